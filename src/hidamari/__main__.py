@@ -4,7 +4,7 @@ import logging
 import os
 import sys
 
-from hidamari import server
+from hidamari import trace
 from hidamari.commons import LOGGER_NAME, VIDEO_WALLPAPER_DIR
 from hidamari.utils import is_flatpak, is_gnome, is_wayland
 
@@ -32,8 +32,19 @@ def main(version="devel", pkgdatadir="/usr/share/hidamari", localedir="/usr/shar
     )
     parser.add_argument("-d", "--debug", action="store_true", help="Print debug messages.")
     parser.add_argument("-r", "--reset", action="store_true", help="Reset user configuration.")
+    parser.add_argument(
+        "--trace-startup",
+        dest="trace_startup",
+        metavar="FILE",
+        help="Write a timeline of all Hidamari processes to FILE (Chrome trace/Perfetto JSON).",
+    )
     args = parser.parse_args()
 
+    # Setup tracing first, so the children spawned later inherit it
+    if args.trace_startup:
+        trace.start(args.trace_startup)
+        trace.process_started("hidamari-server")
+
     # Setup logger
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
@@ -54,6 +65,9 @@ def main(version="devel", pkgdatadir="/usr/share/hidamari", localedir="/usr/shar
 
     # Clear sys.argv as it has influence to the Gtk.Application
     sys.argv = [sys.argv[0]]
+    # Imported here: with `python -m hidamari`, every spawned child re-imports this module
+    from hidamari import server
+
     server.main(version, pkgdatadir, localedir, args)
 
 
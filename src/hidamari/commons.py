@@ -6,6 +6,9 @@ LOGGER_NAME = "Hidamari"
 PROJECT = "io.github.jeffshee.Hidamari"
 DBUS_NAME_SERVER = f"{PROJECT}.server"
 DBUS_NAME_PLAYER = f"{PROJECT}.player"
+# Interface names as declared in the introspection XML of the server and the players
+DBUS_INTERFACE_SERVER = "io.github.jeffshee.hidamari.server"
+DBUS_INTERFACE_PLAYER = "io.github.jeffshee.hidamari.player"
 
 # gettext text domain (matches po/meson.build and the installed hidamari.mo)
 TRANSLATION_DOMAIN = "hidamari"
@@ -45,15 +48,22 @@ X-Flatpak=io.github.jeffshee.Hidamari
 
 CONFIG_DIR = os.path.join(xdg_config_home, "hidamari")
 CONFIG_PATH = os.path.join(CONFIG_DIR, "config.json")
+# Playlists up to version 2, imported into PLAYLIST_DB_PATH. See playlist_store.
 PLAYLIST_PATH = os.path.join(CONFIG_DIR, "playlist.json")
+PLAYLIST_DB_PATH = os.path.join(CONFIG_DIR, "playlist.db")
 
-PLAYLIST_VERSION = 2
+xdg_cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(HOME, ".cache"))
+CACHE_DIR = os.path.join(xdg_cache_home, "hidamari")
+
+PLAYLIST_VERSION = 3
 
 PLAYLIST_MODE_PER_MONITOR = "PER_MONITOR"
 PLAYLIST_MODE_ALL = "ALL"
 PLAYLIST_KEY_MODE = "mode"
 PLAYLIST_KEY_MONITORS = "monitors"
 PLAYLIST_KEY_VIDEOS = "videos"
+# Edits of a playlist's lists, see playlist_store.update()
+PLAYLIST_KEY_EDITS = "edits"
 
 MODE_NULL = "MODE_NULL"
 MODE_VIDEO = "MODE_VIDEO"
@@ -61,7 +71,18 @@ MODE_STREAM = "MODE_STREAM"
 MODE_WEBPAGE = "MODE_WEBPAGE"
 MODE_PLAYLIST = "MODE_PLAYLIST"
 
-CONFIG_VERSION = 5
+# Player process kind serving each mode. Modes of the same kind share one player
+# process, so switching between them doesn't require respawning it.
+PLAYER_KIND_VIDEO = "video"
+PLAYER_KIND_WEB = "web"
+PLAYER_KINDS = {
+    MODE_VIDEO: PLAYER_KIND_VIDEO,
+    MODE_STREAM: PLAYER_KIND_VIDEO,
+    MODE_PLAYLIST: PLAYER_KIND_VIDEO,
+    MODE_WEBPAGE: PLAYER_KIND_WEB,
+}
+
+CONFIG_VERSION = 6
 CONFIG_KEY_VERSION = "version"
 CONFIG_KEY_MODE = "mode"
 CONFIG_KEY_DATA_SOURCE = "data_source"
@@ -76,10 +97,13 @@ CONFIG_KEY_FADE_DURATION_SEC = "fade_duration_sec"
 CONFIG_KEY_FADE_INTERVAL = "fade_interval"
 CONFIG_KEY_SYSTRAY = "is_show_systray"
 CONFIG_KEY_FIRST_TIME = "is_first_time"
+CONFIG_KEY_STANDBY_PLAYER = "is_standby_player"
 CONFIG_TEMPLATE = {
     CONFIG_KEY_VERSION: CONFIG_VERSION,
     CONFIG_KEY_MODE: MODE_NULL,
-    CONFIG_KEY_DATA_SOURCE: None,
+    # {monitor: source} plus "Default", completed with the connected monitors on first
+    # use (see utils.config_template()) so importing this module doesn't query GDK
+    CONFIG_KEY_DATA_SOURCE: {"Default": ""},
     CONFIG_KEY_ACTIVE_PLAYLIST: None,
     CONFIG_KEY_MUTE: False,
     CONFIG_KEY_VOLUME: 50,
@@ -91,23 +115,25 @@ CONFIG_TEMPLATE = {
     CONFIG_KEY_FADE_INTERVAL: 0.1,
     CONFIG_KEY_SYSTRAY: False,
     CONFIG_KEY_FIRST_TIME: True,
+    # Off by default: a standby costs about as much memory as a running player
+    CONFIG_KEY_STANDBY_PLAYER: False,
 }
 
+# Config keys that can be changed at runtime through `apply_settings` (server and player)
+SETTINGS_KEYS = (
+    CONFIG_KEY_MUTE,
+    CONFIG_KEY_VOLUME,
+    CONFIG_KEY_STATIC_WALLPAPER,
+    CONFIG_KEY_BLUR_RADIUS,
+    CONFIG_KEY_PAUSE_WHEN_MAXIMIZED,
+    CONFIG_KEY_MUTE_WHEN_MAXIMIZED,
+    CONFIG_KEY_FADE_DURATION_SEC,
+    CONFIG_KEY_FADE_INTERVAL,
+)
+
 PLAYLIST_TEMPLATE = {
     "version": PLAYLIST_VERSION,
     "playlists": {
 
     }
 }
-
-from hidamari.monitor import MonitorInfo
-
-# initialize config according to monitors
-info = MonitorInfo()
-monitors = info.monitors()
-data_sources = {}
-for monitor in monitors:
-    data_sources[monitor["name"]] = ""
-data_sources["Default"] = ""
-
-CONFIG_TEMPLATE[CONFIG_KEY_DATA_SOURCE] = data_sources
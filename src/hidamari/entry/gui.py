@@ -0,0 +1,11 @@
+"""Entry point of the GUI (control panel) process"""
+
+
+def main(version, pkgdatadir, localedir):
+    from hidamari import trace
+
+    trace.process_started()
+    with trace.span("import"):
+        from hidamari.gui.control import main as gui_main
+
+    gui_main(version, pkgdatadir, localedir)
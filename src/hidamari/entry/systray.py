@@ -0,0 +1,11 @@
+"""Entry point of the systray icon process"""
+
+
+def main(mode, localedir):
+    from hidamari import trace
+
+    trace.process_started()
+    with trace.span("import"):
+        from hidamari.menu import show_systray_icon
+
+    show_systray_icon(mode, localedir)
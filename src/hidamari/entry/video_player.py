@@ -0,0 +1,11 @@
+"""Entry point of the video player process"""
+
+
+def main(snapshot=None):
+    from hidamari import trace
+
+    trace.process_started()
+    with trace.span("import"):
+        from hidamari.player.video_player import main as video_player_main
+
+    video_player_main(snapshot)
@@ -0,0 +1,11 @@
+"""Entry point of the web player process"""
+
+
+def main(snapshot=None):
+    from hidamari import trace
+
+    trace.process_started()
+    with trace.span("import"):
+        from hidamari.player.web_player import main as web_player_main
+
+    web_player_main(snapshot)
@@ -1,6 +1,7 @@
 import logging
 import multiprocessing as mp
 import os
+import signal
 import subprocess
 import sys
 from gettext import gettext as _
@@ -13,6 +14,7 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import Gio, GLib, Gtk
 from pydbus import SessionBus
 
+from hidamari import library, metadata, persistence, trace
 from hidamari.commons import (
     AUTOSTART_DESKTOP_PATH,
     CONFIG_KEY_BLUR_RADIUS,
@@ -34,7 +36,6 @@ from hidamari.commons import (
     TRANSLATION_DOMAIN,
     VIDEO_WALLPAPER_DIR,
 )
-from hidamari.gui.gui_utils import debounce
 from hidamari.gui.local_video_view import LocalVideoView
 from hidamari.gui.playlist_view import PlaylistView
 from hidamari.gui.popover_main import PopoverMain
@@ -83,6 +84,7 @@ class ControlPanel(Gtk.Application):
         self.version = version
         self.window = None
         self.server = None
+        self.library_watcher = None
 
         self.is_autostart = os.path.isfile(AUTOSTART_DESKTOP_PATH)
 
@@ -143,22 +145,23 @@ class ControlPanel(Gtk.Application):
     def _load_config(self):
         self.config = ConfigUtil().load()
 
-    def _save_config(self):
-        ConfigUtil().save(self.config)
-
-    @debounce(1)
-    def _save_config_delay(self):
-        self._save_config()
+    def _save_config_delay(self, *keys):
+        ConfigUtil().save_later({key: self.config[key] for key in keys})
 
     def do_startup(self):
         Gtk.Application.do_startup(self)
+        # The server stops the GUI with SIGTERM: quit cleanly so do_shutdown() runs
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGTERM, self._on_sigterm)
 
         actions = [
             (
                 "local_video_dir",
                 lambda *_: subprocess.run(["xdg-open", os.path.realpath(VIDEO_WALLPAPER_DIR)]),
             ),
-            ("local_video_refresh", self.local_video.reload_icon_view),
+            (
+                "local_video_refresh",
+                lambda *_: self.local_video.reload_icon_view(full_rescan=True),
+            ),
             ("local_video_apply", self.local_video.on_local_video_apply),
             ("local_web_page_apply", self.web_view.on_local_web_page_apply),
             ("play_pause", self.on_play_pause),
@@ -217,6 +220,8 @@ class ControlPanel(Gtk.Application):
             self.popover_main.builder.get_object("SpinBlurRadius").set_visible(False)
 
         self._reload_all_widgets()
+        # Keep the galleries in sync with the video folder
+        self.library_watcher = library.LibraryWatcher(self._on_library_changed)
 
     def do_activate(self):
         if self.window is None:
@@ -225,6 +230,7 @@ class ControlPanel(Gtk.Application):
             self.window.set_application(self)
             self.window.set_position(Gtk.WindowPosition.CENTER)
         self.window.present()
+        trace.instant("window presented")
 
         if self.server is None:
             self._show_error(_("Couldn't connect to server"))
@@ -232,7 +238,7 @@ class ControlPanel(Gtk.Application):
         if self.config[CONFIG_KEY_FIRST_TIME]:
             self._show_welcome()
             self.config[CONFIG_KEY_FIRST_TIME] = False
-            self._save_config()
+            self._save_config_delay(CONFIG_KEY_FIRST_TIME)
 
     def _show_welcome(self):
         # Welcome dialog
@@ -288,6 +294,22 @@ class ControlPanel(Gtk.Application):
         logger.info(f"[GUI/ControlPanel] {action.get_name()}: {state}")
         setup_autostart(state)
 
+    def _on_sigterm(self):
+        self.quit()
+        return GLib.SOURCE_REMOVE
+
+    def _on_library_changed(self, removed, added, renamed):
+        self.local_video.apply_library_changes(removed, added, renamed)
+        self.playlist_view.apply_library_changes(removed, added, renamed)
+
+    def do_shutdown(self):
+        if self.library_watcher is not None:
+            self.library_watcher.close()
+        metadata.shutdown()
+        # Multiprocessing children don't run atexit handlers
+        persistence.flush()
+        Gtk.Application.do_shutdown(self)
+
     def on_quit(self, *_):
         if self.server is not None:
             try:
@@ -345,7 +367,8 @@ def main(version="devel", pkgdatadir="/usr/share/hidamari", localedir="/usr/shar
     Gio.Resource.load(gresource)._register()
     Gtk.IconTheme.get_default().add_resource_path("/io/jeffshee/Hidamari/icons")
 
-    app = ControlPanel(version)
+    with trace.span("ControlPanel()"):
+        app = ControlPanel(version)
     app.run(sys.argv)
 
 
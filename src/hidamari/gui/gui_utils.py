@@ -1,108 +1,260 @@
+import bisect
+import functools
 import logging
 import os
-import subprocess
-import tempfile
-import threading
 
 import gi
 import vlc
 
-gi.require_version("GnomeDesktop", "4.0")
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gdk, GdkPixbuf, Gio, GLib, GnomeDesktop, Gtk
+from gi.repository import Gdk, GdkPixbuf, GLib, Gtk
 
 from hidamari.commons import LOGGER_NAME
-from hidamari.utils import is_flatpak
+from hidamari.gui.thumbnails import (
+    PRIORITY_DEFAULT,
+    PRIORITY_VISIBLE,
+    THUMBNAIL_HEIGHT,
+    cache,
+    scheduler,
+)
 
 logger = logging.getLogger(LOGGER_NAME)
 
 
-def _generate_thumbnail_flatpak(filename):
-    # Inside Flatpak, DesktopThumbnailFactory runs the thumbnailer via
-    # `flatpak-spawn --sandbox`, where glycin (which writes the PNG on
-    # recent GNOME runtimes) can't spawn its own sandboxed loader — nested
-    # sandboxes are blocked, so every thumbnail fails. Run the bundled
-    # thumbnailer directly instead; glycin's single-level sandbox then
-    # works via the org.freedesktop.Flatpak portal.
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        output = os.path.join(tmp_dir, "thumbnail.png")
-        subprocess.run(
-            ["totem-video-thumbnailer", "-s", "256", filename, output],
-            check=True,
-            timeout=60,
-        )
-        return GdkPixbuf.Pixbuf.new_from_file(output)
-
-
-def generate_thumbnail(filename):
-    """Generate and cache a thumbnail. Returns its path, or None if one can't
-    be produced (e.g. no usable thumbnailer, or it failed)."""
-    factory = GnomeDesktop.DesktopThumbnailFactory()
-    mtime = os.path.getmtime(filename)
-    file = Gio.file_new_for_path(filename)
-    uri = file.get_uri()
-    info = file.query_info("standard::content-type", Gio.FileQueryInfoFlags.NONE, None)
-    mime_type = info.get_content_type()
-
-    cached = factory.lookup(uri, mtime)
-    if cached is not None:
-        return cached
-
-    if not factory.can_thumbnail(uri, mime_type, mtime):
-        return None
+# Columns of the video list stores
+COLUMN_PIXBUF = 0
+COLUMN_NAME = 1
+COLUMN_PATH = 2
+COLUMN_STATE = 3
+
+# COLUMN_STATE values
+THUMBNAIL_NONE = 0
+THUMBNAIL_REQUESTED = 1
+THUMBNAIL_LOADED = 2
+THUMBNAIL_FAILED = 3
+
+
+def new_video_list_store():
+    return Gtk.ListStore(GdkPixbuf.Pixbuf, str, str, int)
+
+
+def new_video_row(video_path):
+    return [_placeholder_icon(), os.path.basename(video_path), video_path, THUMBNAIL_NONE]
+
+
+def get_visible_indices(icon_view: Gtk.IconView):
+    """Range of the row indices currently visible in `icon_view`"""
+    visible = icon_view.get_visible_range()
+    if not visible or not visible[0]:
+        return range(0)
+    start, end = visible[-2], visible[-1]
+    return range(start.get_indices()[0], end.get_indices()[0] + 1)
 
-    if is_flatpak():
-        pixbuf = _generate_thumbnail_flatpak(filename)
-    else:
-        pixbuf = factory.generate_thumbnail(uri, mime_type)
-    if pixbuf is None:
-        return None
 
-    factory.save_thumbnail(pixbuf, uri, mtime)
-    return factory.lookup(uri, mtime)
+def _placeholder_icon():
+    return Gtk.IconTheme().get_default().load_icon("video-x-generic", THUMBNAIL_HEIGHT, 0)
 
 
-def get_thumbnail(video_path, list_store, idx):
-    # Best-effort: a preview thumbnail must never crash the GUI. On failure the
-    # generic video icon set by the caller stays in place. (In the Flatpak the
-    # sandboxed thumbnailer can fail; that's fine, we just skip the preview.)
-    try:
-        info = Gio.File.new_for_path(video_path).query_info(
-            "thumbnail::path", Gio.FileQueryInfoFlags.NONE, None
-        )
-        thumbnail = info.get_attribute_byte_string("thumbnail::path") or generate_thumbnail(
-            video_path
-        )
-        if thumbnail:
-            list_store[idx][0] = GdkPixbuf.Pixbuf.new_from_file_at_size(thumbnail, -1, 96)
-    except (GLib.Error, OSError, subprocess.SubprocessError) as e:
-        logger.debug("[Thumbnail] Skipped %s: %s", os.path.basename(video_path), e)
+def _set_thumbnail(model, index, pixbuf, state):
+    # One "row-changed" for both columns, each one invalidates the row's layout
+    model.set(model.iter_nth_child(None, index), [COLUMN_PIXBUF, COLUMN_STATE], [pixbuf, state])
 
 
-def debounce(wait_time):
+class LazyThumbnails:
     """
-    Decorator that will debounce a function so that it is called after wait_time seconds
-    If it is called multiple times, will wait for the last call to be debounced and run only this one.
-    Reference:
-    https://github.com/salesforce/decorator-operations/blob/master/decoratorOperations/debounce_functions/debounce.py
+    Thumbnails of the rows of an IconView, loaded around the viewport only: the visible
+    rows and PREFETCH_SCREENS screens before and after them are requested, visible first,
+    rows scrolled more than RELEASE_SCREENS screens away get the placeholder back and
+    their pending requests are cancelled. Memory and thumbnailer work follow what's on
+    screen, not the size of the model. Thumbnails still in the shared cache are set
+    right away.
+
+    The model needs a column with the video path and an int column for the THUMBNAIL_*
+    state of the row, see COLUMN_*.
     """
 
-    def decorator(function):
-        def debounced(*args, **kwargs):
-            def call_function():
-                debounced._timer = None
-                return function(*args, **kwargs)
+    PREFETCH_SCREENS = 1
+    RELEASE_SCREENS = 3
+    # Rows requested before the view knows its visible range, and the smallest screen
+    MIN_SCREEN_ROWS = 24
 
-            if debounced._timer is not None:
-                debounced._timer.cancel()
-
-            debounced._timer = threading.Timer(wait_time, call_function)
-            debounced._timer.start()
+    def __init__(self, icon_view: Gtk.IconView):
+        self.icon_view = icon_view
+        self._waiting = {}  # video path -> [Gtk.TreeRowReference], requested rows
+        self._loaded = []  # [Gtk.TreeRowReference], rows with their thumbnail
+        self._is_update_pending = False
+
+        for adjustment in (icon_view.get_hadjustment(), icon_view.get_vadjustment()):
+            if adjustment is not None:
+                adjustment.connect("value-changed", self.schedule_update)
+        icon_view.connect("size-allocate", self.schedule_update)
+
+    def reset(self):
+        """Forget every row, e.g. once the model is rebuilt or replaced"""
+        scheduler.cancel(self)
+        self._waiting.clear()
+        self._loaded.clear()
+        self.schedule_update()
+
+    def mark_loaded(self, model, tree_iter):
+        """Track a row inserted with its thumbnail already set"""
+        model[tree_iter][COLUMN_STATE] = THUMBNAIL_LOADED
+        self._loaded.append(Gtk.TreeRowReference.new(model, model.get_path(tree_iter)))
+
+    def schedule_update(self, *_):
+        """Update the thumbnails once the rows visible may have changed"""
+        if not self._is_update_pending:
+            self._is_update_pending = True
+            # After the relayout, which the visible range depends on
+            GLib.idle_add(self._update, priority=GLib.PRIORITY_LOW)
+
+    def _update(self):
+        self._is_update_pending = False
+        model = self.icon_view.get_model()
+        rows = len(model) if model is not None else 0
+        if rows == 0:
+            return GLib.SOURCE_REMOVE
+        visible = get_visible_indices(self.icon_view) or range(min(rows, self.MIN_SCREEN_ROWS))
+        screen = max(len(visible), self.MIN_SCREEN_ROWS)
+
+        def around(screens):
+            return range(
+                max(visible.start - screen * screens, 0), min(visible.stop + screen * screens, rows)
+            )
+
+        prefetched, kept = around(self.PREFETCH_SCREENS), around(self.RELEASE_SCREENS)
+
+        loaded = []
+        for row in self._loaded:
+            index = self._index_in(row, model)
+            if index in kept:
+                loaded.append(row)
+            elif index is not None:
+                _set_thumbnail(model, index, _placeholder_icon(), THUMBNAIL_NONE)
+        self._loaded = loaded
+
+        for video_path, waiting in list(self._waiting.items()):
+            still_waiting = []
+            for row in waiting:
+                index = self._index_in(row, model)
+                if index in kept:
+                    still_waiting.append(row)
+                elif index is not None:
+                    model[index][COLUMN_STATE] = THUMBNAIL_NONE
+            if still_waiting:
+                self._waiting[video_path] = still_waiting
+            else:
+                del self._waiting[video_path]
+                scheduler.cancel(self, [video_path])
+
+        for index in prefetched:
+            if model[index][COLUMN_STATE] != THUMBNAIL_NONE:
+                continue
+            video_path = model[index][COLUMN_PATH]
+            row = Gtk.TreeRowReference.new(model, Gtk.TreePath.new_from_indices([index]))
+            pixbuf = cache.get(video_path)
+            if pixbuf is not None:
+                _set_thumbnail(model, index, pixbuf, THUMBNAIL_LOADED)
+                self._loaded.append(row)
+                continue
+            model[index][COLUMN_STATE] = THUMBNAIL_REQUESTED
+            if video_path in self._waiting:
+                self._waiting[video_path].append(row)
+                continue
+            self._waiting[video_path] = [row]
+            if index in visible:
+                priority = (PRIORITY_VISIBLE, index)
+            else:
+                priority = (PRIORITY_DEFAULT, min(abs(index - visible.start), abs(index - visible.stop)))
+            scheduler.request(
+                self, video_path, functools.partial(self._on_thumbnail, video_path), priority
+            )
+        scheduler.prioritize(self, {model[index][COLUMN_PATH] for index in visible})
+        return GLib.SOURCE_REMOVE
 
-        debounced._timer = None
-        return debounced
+    def _on_thumbnail(self, video_path, pixbuf):
+        model = self.icon_view.get_model()
+        for row in self._waiting.pop(video_path, []):
+            index = self._index_in(row, model)
+            if index is None:
+                continue
+            if pixbuf is None:
+                # No thumbnail to be had, don't ask again
+                model[index][COLUMN_STATE] = THUMBNAIL_FAILED
+                continue
+            _set_thumbnail(model, index, pixbuf, THUMBNAIL_LOADED)
+            self._loaded.append(row)
+
+    @staticmethod
+    def _index_in(row: Gtk.TreeRowReference, model):
+        if not row.valid() or row.get_model() is not model:
+            return None
+        return row.get_path().get_indices()[0]
+
+
+class VideoListModel:
+    """
+    The rows of a gallery IconView (see COLUMN_*), in the order of `paths` (sorted).
+    A library change is applied row by row, so the rest of the gallery keeps its
+    thumbnails, selection and scroll position, and only new videos get a thumbnail.
+    `paths` is updated in place, views may keep a reference to it.
+    """
 
-    return decorator
+    def __init__(self, icon_view: Gtk.IconView):
+        self.icon_view = icon_view
+        self.paths = []
+        self.list_store = new_video_list_store()
+        icon_view.set_pixbuf_column(COLUMN_PIXBUF)
+        icon_view.set_text_column(COLUMN_NAME)
+        icon_view.set_model(self.list_store)
+        self.thumbnails = LazyThumbnails(icon_view)
+
+    def set_paths(self, paths):
+        """Replace all rows, e.g. on a reload"""
+        # Detached while filling, so the view isn't updated once per row
+        self.icon_view.set_model(None)
+        self.list_store.clear()
+        self.paths[:] = paths
+        for video_path in self.paths:
+            self.list_store.append(new_video_row(video_path))
+        self.icon_view.set_model(self.list_store)
+        self.thumbnails.reset()
+
+    def apply_changes(self, removed=(), added=(), renamed=None):
+        """
+        Apply a library change: remove the `removed` paths, insert the `added` ones and
+        move the {old: new} `renamed` ones, keeping their thumbnails.
+        """
+        renamed = renamed or {}
+        kept = {}
+        for old_path in list(renamed) + list(removed):
+            index = self._index(old_path)
+            if index is None:
+                continue
+            row = self.list_store[index]
+            if old_path in renamed and row[COLUMN_STATE] == THUMBNAIL_LOADED:
+                kept[renamed[old_path]] = row[COLUMN_PIXBUF]
+            self.list_store.remove(row.iter)
+            del self.paths[index]
+        for new_path in sorted(set(added) | set(renamed.values())):
+            if self._index(new_path) is not None:
+                continue
+            index = bisect.bisect_left(self.paths, new_path)
+            self.paths.insert(index, new_path)
+            row = new_video_row(new_path)
+            if new_path in kept:
+                row[COLUMN_PIXBUF] = kept[new_path]
+            tree_iter = self.list_store.insert(index, row)
+            if new_path in kept:
+                self.thumbnails.mark_loaded(self.list_store, tree_iter)
+        # Rows removed or moved out of sight are dropped there, new visible ones loaded
+        self.thumbnails.schedule_update()
+
+    def _index(self, video_path):
+        index = bisect.bisect_left(self.paths, video_path)
+        if index < len(self.paths) and self.paths[index] == video_path:
+            return index
+        return None
 
 
 def vlc_media_looping(video_path: str) -> vlc.Media:
@@ -118,9 +270,9 @@ class HoverPreview:
     Muted, looping hover-preview for one IconView: hovering an item for
     HOVER_DELAY_MS starts silent, looping VLC playback of that item's video in a
     small Popover anchored over the item, fading in/out like a YouTube thumbnail
-    preview. Uses GLib.timeout_add (not the threading.Timer-based `debounce`
-    above) because every step here touches GTK/VLC widget state, which must run
-    on the GTK main loop thread. Shared by the local-video and playlist galleries.
+    preview. Uses GLib.timeout_add (not a threading.Timer) because every step
+    here touches GTK/VLC widget state, which must run on the GTK main loop
+    thread. Shared by the local-video and playlist galleries.
     """
     HOVER_DELAY_MS = 350
     FADE_DURATION_MS = 200
@@ -8,18 +8,16 @@ try:
     sys.path.insert(1, os.path.join(sys.path[0], ".."))
     from commons import *
     from monitor import *
-    from gui.gui_utils import get_thumbnail, debounce
-    from utils import ConfigUtil, setup_autostart, is_gnome, is_wayland, get_video_paths
+    from utils import ConfigUtil, setup_autostart, is_gnome, is_wayland, get_video_paths_async
 except ModuleNotFoundError:
     from hidamari.monitor import *
     from hidamari.commons import *
-    from hidamari.gui.gui_utils import get_thumbnail, debounce
     from hidamari.utils import (
         ConfigUtil,
         setup_autostart,
         is_gnome,
         is_wayland,
-        get_video_paths,
+        get_video_paths_async,
     )
 
 gi.require_version("Gtk", "3.0")
@@ -1,22 +1,25 @@
+import functools
 import sys
-import threading
+import time
 
 import gi
 import vlc
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GLib, GdkPixbuf, Gdk
+from gi.repository import Gtk, GLib, Gdk
 
 try:
     import os
     sys.path.insert(1, os.path.join(sys.path[0], ".."))
     from gui.imports import *
-    from gui.gui_utils import get_thumbnail, HoverPreview
+    from gui.gui_utils import HoverPreview, VideoListModel
     from utils import ConfigUtil
+    import metadata
 except ModuleNotFoundError:
     from hidamari.gui.imports import *
-    from hidamari.gui.gui_utils import get_thumbnail, HoverPreview
+    from hidamari.gui.gui_utils import HoverPreview, VideoListModel
     from hidamari.utils import ConfigUtil
+    from hidamari import metadata
 
 class LocalVideoView:
     def __init__(self, config: ConfigUtil, server):
@@ -45,10 +48,15 @@ class LocalVideoView:
                 self.monitors.get_monitor(monitor).set_wallpaper(video_paths['Default'])
                 
         self.all_key = "all"
-        self.video_paths = []
 
         self.icon_view: Gtk.IconView = self.builder.get_object("IconView")
+        # updated row by row by apply_library_changes()
+        self.video_model = VideoListModel(self.icon_view)
+        self.video_paths = self.video_model.paths
+        self._reload_count = 0
         self.icon_view.connect("button-press-event", self.on_icon_view_button_press)
+        self.icon_view.set_has_tooltip(True)
+        self.icon_view.connect("query-tooltip", self.on_icon_view_query_tooltip)
         self.hover_preview = HoverPreview(
             self.icon_view, vlc.Instance(["--no-disable-screensaver"]), self._resolve_video_path)
 
@@ -60,20 +68,44 @@ class LocalVideoView:
             return self.video_paths[index]
         return None
 
-    def reload_icon_view(self, *_):
-        self.video_paths = get_video_paths()
-        list_store = Gtk.ListStore(GdkPixbuf.Pixbuf, str)
-        self.icon_view.set_pixbuf_column(0)
-        self.icon_view.set_text_column(1)
-        self.icon_view.set_model(list_store)
-        for idx, video_path in enumerate(self.video_paths):
-            pixbuf = Gtk.IconTheme().get_default().load_icon("video-x-generic", 96, 0)
-            list_store.append([pixbuf, os.path.basename(video_path)])
-            thread = threading.Thread(
-                target=get_thumbnail, args=(video_path, list_store, idx)
-            )
-            thread.daemon = True
-            thread.start()
+    def reload_icon_view(self, *_, full_rescan=False):
+        # Scanned on a worker thread, the latest reload wins
+        self._reload_count += 1
+        get_video_paths_async(
+            functools.partial(self._on_video_paths, self._reload_count), full_rescan=full_rescan
+        )
+
+    def _on_video_paths(self, reload_count, video_paths):
+        if reload_count != self._reload_count:
+            return
+        self.video_model.set_paths(video_paths)
+        # Probe in the background, so applying a video doesn't have to
+        metadata.prefetch(self.video_paths)
+
+    def apply_library_changes(self, removed: list, added: list, renamed: dict):
+        self.video_model.apply_changes(removed, added, renamed)
+        metadata.prefetch(added + list(renamed.values()))
+
+    def on_icon_view_query_tooltip(self, icon_view, x, y, keyboard_mode, tooltip):
+        is_row, x, y, model, tree_path, _iter = icon_view.get_tooltip_context(x, y, keyboard_mode)
+        video_path = self._resolve_video_path(tree_path) if is_row else None
+        if video_path is None:
+            return False
+        lines = [os.path.basename(video_path)]
+        # Only what's already probed, a tooltip mustn't wait for ffprobe
+        info = metadata.get_cached(video_path)
+        if info and info["width"] and info["height"]:
+            details = [f"{info['width']}×{info['height']}"]
+            if info["duration"]:
+                details.append(time.strftime("%H:%M:%S", time.gmtime(info["duration"])))
+            if info["fps"]:
+                details.append(f"{info['fps']:.3g} fps")
+            if info["codec"]:
+                details.append(info["codec"])
+            lines.append(" · ".join(details))
+        tooltip.set_text("\n".join(lines))
+        icon_view.set_tooltip_item(tooltip, tree_path)
+        return True
         
     def _setup_context_menu(self):
         self.contextMenu_monitors = Gtk.Menu()
@@ -139,13 +171,19 @@ class LocalVideoView:
         # also update the Default video
         paths['Default'] = video_path
         self.config[CONFIG_KEY_DATA_SOURCE] = paths
-        self._save_config()
-        print(video_path, monitor.name)
         if self.server is not None:
-            self.server.video(video_path, monitor.name)
+            # The server persists the mode and data sources it is asked for
+            if monitor == self.all_key:
+                for name in self.monitors.get_monitors():
+                    self.server.video(video_path, name)
+            else:
+                self.server.video(video_path, monitor.name)
+        else:
+            self._save_config(CONFIG_KEY_MODE, CONFIG_KEY_DATA_SOURCE)
             
     def _load_config(self):
         self.config = ConfigUtil().load()
         
-    def _save_config(self):
-        ConfigUtil().save(self.config)
\ No newline at end of file
+    def _save_config(self, *keys):
+        # Merge just these keys: a whole write would undo what others changed meanwhile
+        ConfigUtil().save_later({key: self.config[key] for key in keys})
\ No newline at end of file
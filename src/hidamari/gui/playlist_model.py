@@ -0,0 +1,374 @@
+"""
+Edit model of the playlist being edited in PlaylistView.
+
+Edits are recorded as operations on the draft, one undo step per user action, so that
+- the stored playlist is never copied as a whole: a list is copied the first time it's
+  edited (copy-on-write),
+- the dirty check is O(1): the draft is clean iff everything was undone, as the view
+  starts a new draft from the stored playlist after every save,
+- a save only sends the mode and the edits themselves, never whole lists. The draft
+  knows the entry ids of the stored lists, so the edits it sends address the stored
+  entries by id.
+
+Lists are ordered multisets (a stored playlist may hold duplicates), with a counter of
+their paths for O(1) membership. A batch of inserts or removes is a single operation
+applied in one pass over the list, so adding a folder of thousands of videos or
+removing a large selection is linear, not quadratic.
+
+Lists are keyed by monitor name, or ALL for the shared list of PLAYLIST_MODE_ALL.
+"""
+
+import itertools
+import sys
+from collections import Counter
+
+try:
+    import os
+
+    sys.path.insert(1, os.path.join(sys.path[0], ".."))
+    from commons import (
+        PLAYLIST_KEY_EDITS,
+        PLAYLIST_KEY_MODE,
+        PLAYLIST_KEY_MONITORS,
+        PLAYLIST_KEY_VIDEOS,
+        PLAYLIST_MODE_PER_MONITOR,
+    )
+except ModuleNotFoundError:
+    from hidamari.commons import (
+        PLAYLIST_KEY_EDITS,
+        PLAYLIST_KEY_MODE,
+        PLAYLIST_KEY_MONITORS,
+        PLAYLIST_KEY_VIDEOS,
+        PLAYLIST_MODE_PER_MONITOR,
+    )
+
+ALL = ""
+
+# Operations, each one undone by its inverse:
+#   ("mode", old mode, new mode)
+#   ("insert", key, [(index, path)]) / ("remove", key, [(index, path)]), by ascending
+#     index. Insert indices are the positions in the resulting list, remove indices the
+#     positions in the list the items are removed from.
+#   ("move", key, src, dst): the item at src is taken out of the list and put back at dst
+_INVERSE = {"insert": "remove", "remove": "insert"}
+
+
+class PlaylistDraft:
+    def __init__(self, stored: dict = None, monitors=(), entry_ids: dict = None):
+        """
+        :param stored: The playlist as stored, never modified. None for a new playlist.
+        :param monitors: Monitors every playlist has a list for
+        :param entry_ids: {key: [entry id]} of the stored lists (PlaylistUtil.entry_ids()).
+            A list whose ids are missing or don't match it is saved whole.
+        """
+        stored = stored or {}
+        self.mode = stored.get(PLAYLIST_KEY_MODE, PLAYLIST_MODE_PER_MONITOR)
+        self._lists = dict(stored.get(PLAYLIST_KEY_MONITORS, {}))
+        for monitor in monitors:
+            self._lists.setdefault(monitor, [])
+        self._lists[ALL] = stored.get(PLAYLIST_KEY_VIDEOS, [])
+        entry_ids = entry_ids or {}
+        self._stored_ids = {
+            key: entry_ids.get(key, [])
+            for key, paths in self._lists.items()
+            if len(entry_ids.get(key, [])) == len(paths)
+        }
+        self._owned = set()  # keys of the lists copied from `stored`
+        self._counts = {}  # key -> Counter of the paths, built on first use
+
+        # Called with every operation applied, including undo and redo, e.g. to update
+        # a view of the lists row by row: on_apply(op)
+        self.on_apply = None
+
+        self._undo = []  # [(revision, [op])]
+        self._redo = []
+        self._revision = 0
+        self._stored_mode = self.mode
+
+    """
+        Queries
+    """
+
+    @property
+    def is_dirty(self):
+        return bool(self._undo)
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def get_list(self, key):
+        """The list of `key`, read-only"""
+        return self._lists.get(key, [])
+
+    def contains(self, key, path):
+        return self._count(key)[path] > 0
+
+    def keys(self):
+        return list(self._lists)
+
+    def to_dict(self):
+        """The whole playlist, e.g. to store it under a new name"""
+        return {
+            PLAYLIST_KEY_MODE: self.mode,
+            PLAYLIST_KEY_MONITORS: {
+                key: list(paths) for key, paths in self._lists.items() if key != ALL
+            },
+            PLAYLIST_KEY_VIDEOS: list(self._lists[ALL]),
+        }
+
+    def delta(self):
+        """
+        What changed since the draft was created, as a partial playlist of edits (see
+        playlist_store.update()): the operations still on the undo history, in order,
+        replayed on the entry ids of the stored lists. The lists without entry ids are
+        sent whole.
+        """
+        delta = {}
+        if self.mode != self._stored_mode:
+            delta[PLAYLIST_KEY_MODE] = self.mode
+        edits = {}
+        ids = {}  # key -> entry ids of the list, as edited so far
+        new_ids = itertools.count(-1, -1)
+        whole = set()
+        for _revision, ops in self._undo:
+            for op in ops:
+                if op[0] == "mode":
+                    continue
+                key = op[1]
+                if key not in self._stored_ids:
+                    whole.add(key)
+                    continue
+                if key not in ids:
+                    ids[key] = list(self._stored_ids[key])
+                edits.setdefault(key, []).extend(self._id_edits(op, ids[key], new_ids))
+        if edits:
+            delta[PLAYLIST_KEY_EDITS] = edits
+        for key in whole:
+            if key == ALL:
+                delta[PLAYLIST_KEY_VIDEOS] = list(self._lists[ALL])
+            else:
+                delta.setdefault(PLAYLIST_KEY_MONITORS, {})[key] = list(self._lists[key])
+        return delta
+
+    """
+        Edits, one undo step each. They return whether anything changed.
+    """
+
+    def set_mode(self, mode):
+        if mode == self.mode:
+            return False
+        return self._commit([("mode", self.mode, mode)])
+
+    def add(self, key, paths):
+        """Append the `paths` that aren't in the list yet"""
+        length = len(self.get_list(key))
+        items = []
+        added = set()
+        for path in paths:
+            if path not in added and not self.contains(key, path):
+                added.add(path)
+                items.append((length + len(items), path))
+        return self._commit([("insert", key, items)] if items else [])
+
+    def remove(self, key, indices):
+        return self._commit(self._remove_op(key, indices))
+
+    def remove_missing(self, exists: callable):
+        """Remove the paths for which `exists(path)` is False, from every list"""
+        ops = []
+        for key, paths in self._lists.items():
+            ops += self._remove_op(key, [i for i, path in enumerate(paths) if not exists(path)])
+        return self._commit(ops)
+
+    def deduplicate(self):
+        """Keep only the first occurrence of every path, in every list"""
+        ops = []
+        for key, paths in self._lists.items():
+            if len(self._count(key)) == len(paths):
+                continue
+            seen = set()
+            duplicates = []
+            for index, path in enumerate(paths):
+                if path in seen:
+                    duplicates.append(index)
+                seen.add(path)
+            ops += self._remove_op(key, duplicates)
+        return self._commit(ops)
+
+    def move(self, key, indices, offset):
+        """Move the items at `indices` one step left (offset -1) or right (offset 1)"""
+        length = len(self.get_list(key))
+        ops = []
+        for index in sorted(set(indices), reverse=offset > 0):
+            other = index + offset
+            if 0 <= other < length and 0 <= index < length:
+                # Swapping neighbours is moving one of them
+                ops.append(("move", key, index, other))
+        return self._commit(ops)
+
+    def reorder(self, key, new_order):
+        """
+        Make the list the permutation `new_order` of it, e.g. after a drag-and-drop
+        reorder. Recorded as the moves that turn one into the other: a single one for a
+        dragged item.
+        """
+        return self._commit(self._move_ops(key, list(new_order)))
+
+    def undo(self):
+        if not self._undo:
+            return False
+        revision, ops = self._undo.pop()
+        for op in reversed(ops):
+            self._apply(self._inverse(op))
+        self._redo.append((revision, ops))
+        return True
+
+    def redo(self):
+        if not self._redo:
+            return False
+        revision, ops = self._redo.pop()
+        for op in ops:
+            self._apply(op)
+        self._undo.append((revision, ops))
+        return True
+
+    """
+        Internals
+    """
+
+    def _remove_op(self, key, indices):
+        target = self.get_list(key)
+        items = [(i, target[i]) for i in sorted(set(indices)) if 0 <= i < len(target)]
+        return [("remove", key, items)] if items else []
+
+    def _move_ops(self, key, new_order):
+        current = list(self.get_list(key))
+        if new_order == current:
+            return []
+        # Only the range between the first and the last difference changed
+        pairs = list(zip(current, new_order, strict=True))
+        start = next(i for i, (a, b) in enumerate(pairs) if a != b)
+        end = next(i for i in range(len(pairs), 0, -1) if pairs[i - 1][0] != pairs[i - 1][1])
+        last = end - 1
+        if current[start] == new_order[last] and current[start + 1 : end] == new_order[start:last]:
+            return [("move", key, start, last)]
+        if current[last] == new_order[start] and current[start:last] == new_order[start + 1 : end]:
+            return [("move", key, last, start)]
+        # Anything else, one item at a time
+        ops = []
+        for index in range(start, end):
+            if current[index] != new_order[index]:
+                src = current.index(new_order[index], index)
+                current.insert(index, current.pop(src))
+                ops.append(("move", key, src, index))
+        return ops
+
+    @staticmethod
+    def _id_edits(op, ids, new_ids):
+        """The store edits of `op`, applying it to the entry ids `ids` of its list"""
+        kind = op[0]
+        if kind == "insert":
+            items = [(index, next(new_ids), path) for index, path in op[2]]
+            _insert(ids, [(index, new_id) for index, new_id, _path in items])
+            # One edit per run of consecutive indices, between the entries around it
+            runs = []
+            for index, new_id, path in items:
+                if runs and runs[-1][1] == index - 1:
+                    runs[-1][1] = index
+                    runs[-1][2].append((new_id, path))
+                else:
+                    runs.append([index, index, [(new_id, path)]])
+            return [
+                ("insert", _at(ids, first - 1), _at(ids, last + 1), run)
+                for first, last, run in runs
+            ]
+        if kind == "remove":
+            indices = [index for index, _path in op[2]]
+            removed = [ids[index] for index in indices]
+            _remove(ids, indices)
+            return [("remove", removed)]
+        src, dst = op[2], op[3]
+        entry_id = ids.pop(src)
+        ids.insert(dst, entry_id)
+        return [("move", entry_id, _at(ids, dst - 1), _at(ids, dst + 1))]
+
+    def _count(self, key):
+        if key not in self._counts:
+            self._counts[key] = Counter(self.get_list(key))
+        return self._counts[key]
+
+    def _commit(self, ops):
+        if not ops:
+            return False
+        for op in ops:
+            self._apply(op)
+        self._revision += 1
+        self._undo.append((self._revision, ops))
+        self._redo.clear()
+        return True
+
+    @staticmethod
+    def _inverse(op):
+        if op[0] == "mode":
+            return ("mode", op[2], op[1])
+        if op[0] == "move":
+            return ("move", op[1], op[3], op[2])
+        return (_INVERSE[op[0]], *op[1:])
+
+    def _apply(self, op):
+        kind = op[0]
+        if kind == "mode":
+            self.mode = op[2]
+        else:
+            self._apply_to_list(op)
+        if self.on_apply is not None:
+            self.on_apply(op)
+
+    def _apply_to_list(self, op):
+        kind, key = op[0], op[1]
+        target = self._writable(key)
+        if kind == "insert":
+            _insert(target, op[2])
+            if key in self._counts:
+                self._counts[key].update(path for _index, path in op[2])
+        elif kind == "remove":
+            _remove(target, [index for index, _path in op[2]])
+            if key in self._counts:
+                self._counts[key].subtract(path for _index, path in op[2])
+                self._counts[key] += Counter()  # drop the zero counts
+        elif kind == "move":
+            target.insert(op[3], target.pop(op[2]))
+
+    def _writable(self, key):
+        if key not in self._owned:
+            self._lists[key] = list(self._lists.get(key, []))
+            self._owned.add(key)
+        return self._lists[key]
+
+
+def _insert(target, items):
+    """Insert [(index, item)], by ascending index in the resulting list, in one pass"""
+    if items[0][0] == len(target):
+        # Appending, e.g. adding videos
+        target.extend(item for _index, item in items)
+        return
+    inserted = dict(items)
+    remaining = iter(target)
+    target[:] = [
+        inserted[i] if i in inserted else next(remaining) for i in range(len(target) + len(items))
+    ]
+
+
+def _remove(target, indices):
+    """Remove the items at `indices`, in one pass"""
+    removed = set(indices)
+    target[:] = [item for i, item in enumerate(target) if i not in removed]
+
+
+def _at(target, index):
+    return target[index] if 0 <= index < len(target) else None
@@ -1,13 +1,12 @@
-import copy
+import functools
 import sys
-import threading
 
 import gi
 import pydbus
 import vlc
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GLib, GdkPixbuf, Gdk, Gio, Pango
+from gi.repository import Gtk, GLib, Gdk, Gio, Pango
 
 # Custom DnD target used to drag a video from the library IconView and drop it
 # onto the playlist area; distinct from IconView's own internal "GTK_TREE_MODEL_ROW"
@@ -18,12 +17,28 @@ try:
     import os
     sys.path.insert(1, os.path.join(sys.path[0], ".."))
     from gui.imports import *
-    from gui.gui_utils import get_thumbnail, HoverPreview
-    from utils import ConfigUtil, PlaylistUtil, get_video_paths
+    from gui.gui_utils import (
+        COLUMN_PATH,
+        HoverPreview,
+        LazyThumbnails,
+        VideoListModel,
+        new_video_list_store,
+        new_video_row,
+    )
+    from gui.playlist_model import ALL, PlaylistDraft
+    from utils import ConfigUtil, PlaylistUtil, get_video_paths_async
 except ModuleNotFoundError:
     from hidamari.gui.imports import *
-    from hidamari.gui.gui_utils import get_thumbnail, HoverPreview
-    from hidamari.utils import ConfigUtil, PlaylistUtil, get_video_paths
+    from hidamari.gui.gui_utils import (
+        COLUMN_PATH,
+        HoverPreview,
+        LazyThumbnails,
+        VideoListModel,
+        new_video_list_store,
+        new_video_row,
+    )
+    from hidamari.gui.playlist_model import ALL, PlaylistDraft
+    from hidamari.utils import ConfigUtil, PlaylistUtil, get_video_paths_async
 
 
 class PlaylistView:
@@ -55,6 +70,19 @@ class PlaylistView:
         self.reload_videos_button = self.builder.get_object("ButtonReloadVideos")
         self.distribution_mode_combobox = self.builder.get_object("ComboBoxDistributionMode")
 
+        # library gallery, updated row by row by apply_library_changes()
+        self.video_model = VideoListModel(self.videos_view)
+        self.video_paths = self.video_model.paths
+        self._reload_count = 0
+        self._ellipsize_item_labels(self.videos_view)
+        self.queue_thumbnails = LazyThumbnails(self.playlist_icon_view)
+        # The draft list shown in playlist_icon_view, kept in sync with the draft's
+        # edits row by row by _on_draft_apply()
+        self.queue_key = None
+        self.queue_model = None
+        self._queue_deleted_id = None
+        self._is_reordering = False
+
         # index 0 = PER_MONITOR, index 1 = ALL (kept in sync with DISTRIBUTION_MODES below)
         self.DISTRIBUTION_MODES = [PLAYLIST_MODE_PER_MONITOR, PLAYLIST_MODE_ALL]
         self.distribution_mode_combobox.remove_all()
@@ -65,11 +93,9 @@ class PlaylistView:
         self.monitors = Monitors()
         self.monitor_combobox.remove_all()
         self.playlists = None
-        self.current_playlist = None
+        # The playlist being edited (PlaylistDraft); nothing is persisted until Add/Save
+        self.draft = None
         self.current_playlist_name = None
-        # Snapshot of the currently-loaded playlist as last loaded/saved, used to
-        # detect unsaved edits before switching away (see _is_dirty).
-        self.saved_snapshot = None
 
         # get video paths
         video_paths = self.config[CONFIG_KEY_DATA_SOURCE]
@@ -102,6 +128,8 @@ class PlaylistView:
         self.videos_view.connect("item-activated", self.on_video_activated)
         self.videos_view.connect("button-press-event", self.on_video_button_press)
         self.playlist_icon_view.connect("item-activated", self.on_playlist_video_activated)
+        self.playlist_icon_view.connect("button-press-event", self.on_playlist_video_button_press)
+        self.widget.connect("key-press-event", self.on_key_press)
 
         # Drag-and-drop: drag a video from the library IconView, drop it onto the
         # playlist area to add it. Targets the ScrolledWindow (not playlist_icon_view
@@ -134,7 +162,7 @@ class PlaylistView:
     """
     def on_reload_icon_view(self, button: Gtk.Button):
         logger.info(f"[GUI/PlaylistView] Reloading videos")
-        self.reload_icon_view()
+        self.reload_icon_view(full_rescan=True)
 
     def on_add_or_save_playlist(self, button: Gtk.Button):
         # check if playlist name empty
@@ -156,12 +184,15 @@ class PlaylistView:
             return
         
         # if all good, add/save playlist to listbox
-        # deep-copied so a later "save as" under a different name can't alias (and corrupt)
-        # a playlist already stored under another name
         logger.info(f"[GUI/PlaylistView] Adding/Saving playlist: {playlist_name}")
-        self.playlists[playlist_name] = copy.deepcopy(self.current_playlist) if self.current_playlist else self._new_playlist_data()
-
-        self._save_playlist(playlist_name)
+        draft = self.draft or self._new_draft()
+        if playlist_name == self.current_playlist_name and playlist_name in self.playlists:
+            # Saving the playlist being edited: only what changed
+            self._save_playlist(playlist_name, draft.delta())
+        else:
+            # New playlist, or "save as" under another name
+            self.playlists[playlist_name] = draft.to_dict()
+            self._save_playlist(playlist_name)
         self._load_playlist(select_name=playlist_name)
 
     def on_add_to_playlist(self, button: Gtk.Button):
@@ -175,20 +206,15 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] No videos selected to add")
             return
 
-        for item in selected_items:
-            video_path = self.video_paths[item.get_indices()[0]]
-            self._add_video_to_active_playlist(video_path, monitor_name)
-
-        self._update_playlist_view(monitor_name)
+        video_paths = [self.video_paths[item.get_indices()[0]] for item in selected_items]
+        self._add_videos_to_active_playlist(video_paths, monitor_name)
         self._update_disable_status_for_buttons()
 
-    def _add_video_to_active_playlist(self, video_path: str, monitor_name: str = None):
+    def _add_videos_to_active_playlist(self, video_paths: list, monitor_name: str = None):
         """
-        Add a single video to whichever list is currently being edited: the shared
-        'videos' list in ALL mode, or `monitor_name`'s list in PER_MONITOR mode.
-        Caller is responsible for refreshing the view afterwards (so batch callers,
-        e.g. multi-select add, only redraw once). Returns False if there's nowhere
-        to add it (no monitor selected in PER_MONITOR mode).
+        Add videos, as one undo step, to whichever list is currently being edited: the
+        shared 'videos' list in ALL mode, or `monitor_name`'s list in PER_MONITOR mode.
+        Videos already in the list are skipped. Returns False if nothing was added.
         """
         if monitor_name is None:
             monitor_name = self.monitor_combobox.get_active_text()
@@ -196,16 +222,14 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] No monitor selected")
             return False
 
-        if self.current_playlist is None:
-            self.current_playlist = self._new_playlist_data()
+        if self.draft is None:
+            self.draft = self._new_draft()
+            self._update_playlist_view(self.monitor_combobox.get_active_text())
 
-        target_list = self._get_active_list(monitor_name)
-        if target_list is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             return False
-
-        if video_path not in target_list:
-            target_list.append(video_path)
-        return True
+        return self.draft.add(key, video_paths)
 
     def on_remove_from_playlist(self, button: Gtk.Button):
         # check if any item selected on playlist_icon_view
@@ -230,17 +254,12 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] No monitor selected")
             return
 
-        target_list = self._get_active_list(monitor_name)
-        if target_list is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             logger.warning(f"[GUI/PlaylistView] No current playlist or monitor in playlist")
             return
 
-        for item in selected_items:
-            video_path = target_list[item.get_indices()[0]]
-            if video_path in target_list:
-                target_list.remove(video_path)
-
-        self._update_playlist_view(monitor_name)
+        self.draft.remove(key, [item.get_indices()[0] for item in selected_items])
         self._update_disable_status_for_buttons()
 
     def on_move_left(self, button: Gtk.Button):
@@ -266,21 +285,15 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] No monitor selected")
             return
 
-        playlist = self._get_active_list(monitor_name)
-        if playlist is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             logger.warning(f"[GUI/PlaylistView] No current playlist or monitor in playlist")
             return
 
         # change order of selected items
         indices = [item.get_indices()[0] for item in selected_items]
         logger.info(f"[GUI/PlaylistView] Selected indices to move left: {indices}")
-
-        # left shift: move from the start to avoid index shifting issues
-        for index in sorted(indices):
-            if index > 0:
-                playlist[index], playlist[index - 1] = playlist[index - 1], playlist[index]
-
-        self._update_playlist_view(monitor_name)
+        self.draft.move(key, indices, -1)
         self._update_disable_status_for_buttons()
 
     def on_move_right(self, button: Gtk.Button):
@@ -306,32 +319,25 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] No monitor selected")
             return
 
-        playlist = self._get_active_list(monitor_name)
-        if playlist is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             logger.warning(f"[GUI/PlaylistView] No current playlist or monitor in playlist")
             return
 
         # change order of selected items
         indices = [item.get_indices()[0] for item in selected_items]
         logger.info(f"[GUI/PlaylistView] Selected indices to move right: {indices}")
-
-        # move from the end to avoid index shifting issues
-        for index in sorted(indices, reverse=True):
-            if index < len(playlist) - 1:
-                playlist[index], playlist[index + 1] = playlist[index + 1], playlist[index]
-
-        self._update_playlist_view(monitor_name)
+        self.draft.move(key, indices, 1)
         self._update_disable_status_for_buttons()
 
     def on_distribution_mode_changed(self, combo: Gtk.ComboBoxText):
         active_index = combo.get_active()
-        if active_index < 0 or self.current_playlist is None:
+        if active_index < 0 or self.draft is None:
             return
         mode = self.DISTRIBUTION_MODES[active_index]
         self.monitor_combobox.set_sensitive(mode == PLAYLIST_MODE_PER_MONITOR)
-        if self.current_playlist.get(PLAYLIST_KEY_MODE) == mode:
+        if not self.draft.set_mode(mode):
             return
-        self.current_playlist[PLAYLIST_KEY_MODE] = mode
         logger.info(f"[GUI/PlaylistView] Distribution mode changed to: {mode}")
         self._update_playlist_view(self.monitor_combobox.get_active_text())
         self._update_disable_status_for_buttons()
@@ -434,7 +440,14 @@ class PlaylistView:
         if response != Gtk.ResponseType.OK or not new_name or new_name == playlist_name:
             return
 
-        if new_name in self.playlists:
+        logger.info(f"[GUI/PlaylistView] Renaming playlist '{playlist_name}' to '{new_name}'")
+        try:
+            if new_name in self.playlists:
+                raise ValueError(f"A playlist named '{new_name}' already exists")
+            # Still checked by the store: another window may have just saved one
+            PlaylistUtil().rename_playlist(playlist_name, new_name)
+        except ValueError as e:
+            logger.warning(f"[GUI/PlaylistView] Can't rename playlist: {e}")
             error_dialog = Gtk.MessageDialog(
                 transient_for=self.widget.get_toplevel(),
                 flags=0,
@@ -446,15 +459,14 @@ class PlaylistView:
             error_dialog.destroy()
             return
 
-        logger.info(f"[GUI/PlaylistView] Renaming playlist '{playlist_name}' to '{new_name}'")
         self.playlists[new_name] = self.playlists.pop(playlist_name)
         was_active_playlist = self.config.get(CONFIG_KEY_ACTIVE_PLAYLIST) == playlist_name
-        self._save_playlist(None)
         if was_active_playlist:
             self.config[CONFIG_KEY_ACTIVE_PLAYLIST] = new_name
-            self._save_config()
             if self.server is not None:
                 self.server.playlist(new_name)  # live-reload under the new name
+            else:
+                self._save_config(CONFIG_KEY_ACTIVE_PLAYLIST)
         self._load_playlist(select_name=new_name)
 
     def on_playlist_apply(self, button: Gtk.Button):
@@ -478,21 +490,42 @@ class PlaylistView:
         self._apply_playlist(selected_playlist.playlist_name)
 
     def _apply_playlist(self, playlist_name: str):
-        if playlist_name not in self.playlists:
+        if playlist_name not in (self.playlists or {}):
             logger.warning(f"[GUI/PlaylistView] Playlist {playlist_name} not found in playlists")
             return
 
         self.config[CONFIG_KEY_MODE] = MODE_PLAYLIST
         self.config[CONFIG_KEY_ACTIVE_PLAYLIST] = playlist_name
-        self._save_config()
         logger.info(f"[GUI/PlaylistView] Applying playlist: {playlist_name}")
         if self.server is not None:
             self.server.playlist(playlist_name)
+        else:
+            self._save_config(CONFIG_KEY_MODE, CONFIG_KEY_ACTIVE_PLAYLIST)
 
     """
         Other callbacks
     """
     
+    def on_key_press(self, widget, event: Gdk.EventKey):
+        # Ctrl+Z: undo, Ctrl+Shift+Z: redo the last edit of the draft
+        state = event.state & Gtk.accelerator_get_default_mod_mask()
+        if Gdk.keyval_to_lower(event.keyval) != Gdk.KEY_z or self.draft is None:
+            return False
+        if state == Gdk.ModifierType.CONTROL_MASK:
+            is_changed = self.draft.undo()
+        elif state == Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK:
+            is_changed = self.draft.redo()
+        else:
+            return False
+        if is_changed:
+            self._sync_distribution_mode_ui()
+            # The list shown is up to date, unless the mode changed which one it is
+            monitor_name = self.monitor_combobox.get_active_text()
+            if self._get_active_key(monitor_name) != self.queue_key:
+                self._update_playlist_view(monitor_name)
+            self._update_disable_status_for_buttons()
+        return True
+
     def on_playlist_name_changed(self, entry: Gtk.Entry):
         self._update_disable_status_for_buttons()
 
@@ -512,10 +545,7 @@ class PlaylistView:
         """Load `playlist_name` as the current draft. Does not check for unsaved changes."""
         self.playlist_name_entry.set_text(playlist_name)
         self.current_playlist_name = playlist_name
-        # Deep-copied so live edits are a draft; nothing is persisted until Add/Save.
-        stored = self.playlists.get(playlist_name)
-        self.current_playlist = copy.deepcopy(stored) if stored is not None else self._new_playlist_data()
-        self.saved_snapshot = copy.deepcopy(self.current_playlist)
+        self.draft = self._new_draft(playlist_name)
         self._sync_distribution_mode_ui()
         self._update_disable_status_for_buttons()
         # set active monitor
@@ -524,7 +554,7 @@ class PlaylistView:
         self._update_playlist_view(monitor_name)
 
     def _is_dirty(self):
-        return self.current_playlist is not None and self.current_playlist != self.saved_snapshot
+        return self.draft is not None and self.draft.is_dirty
 
     def _confirm_discard_changes(self):
         dialog = Gtk.MessageDialog(
@@ -579,16 +609,79 @@ class PlaylistView:
             return
         video_path = self.video_paths[index]
         monitor_name = self.monitor_combobox.get_active_text()
-        if self._add_video_to_active_playlist(video_path, monitor_name):
+        if self._add_videos_to_active_playlist([video_path], monitor_name):
             logger.info(f"[GUI/PlaylistView] Video added via double-click: {video_path}")
-            self._update_playlist_view(monitor_name)
             self._update_disable_status_for_buttons()
 
     def on_playlist_video_activated(self, icon_view: Gtk.IconView, path: Gtk.TreePath):
         model = icon_view.get_model()
-        video_path = model[path][2]  # 3rd column holds the full video path
+        video_path = model[path][COLUMN_PATH]
         self._preview_video(video_path)
 
+    def on_playlist_video_button_press(self, icon_view: Gtk.IconView, event: Gdk.EventButton):
+        if event.button != 3:
+            return False
+        menu = self._build_queue_context_menu()
+        menu.popup_at_pointer(event)
+        return True
+
+    def _build_queue_context_menu(self):
+        menu = Gtk.Menu()
+
+        add_folder_item = Gtk.MenuItem(label="Add Folder…")
+        add_folder_item.connect("activate", lambda _: self._add_folder_via_dialog())
+        menu.append(add_folder_item)
+
+        menu.append(Gtk.SeparatorMenuItem())
+
+        remove_missing_item = Gtk.MenuItem(label="Remove Missing Files")
+        remove_missing_item.connect("activate", lambda _: self._remove_missing_videos())
+        menu.append(remove_missing_item)
+
+        deduplicate_item = Gtk.MenuItem(label="Remove Duplicates")
+        deduplicate_item.connect("activate", lambda _: self._deduplicate_videos())
+        menu.append(deduplicate_item)
+
+        for item in (remove_missing_item, deduplicate_item):
+            item.set_sensitive(self.draft is not None)
+        menu.show_all()
+        return menu
+
+    def _add_folder_via_dialog(self):
+        dialog = Gtk.FileChooserDialog(
+            title="Add Folder",
+            transient_for=self.widget.get_toplevel(),
+            action=Gtk.FileChooserAction.SELECT_FOLDER,
+        )
+        dialog.add_buttons(
+            Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_ADD, Gtk.ResponseType.OK)
+        response = dialog.run()
+        folder = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not folder:
+            return
+
+        monitor_name = self.monitor_combobox.get_active_text()
+        # Listed on a worker thread, e.g. for a large folder on a network share
+        get_video_paths_async(
+            functools.partial(self._add_folder_videos, folder, monitor_name), folder
+        )
+
+    def _add_folder_videos(self, folder, monitor_name, video_paths):
+        if self._add_videos_to_active_playlist(video_paths, monitor_name):
+            logger.info(f"[GUI/PlaylistView] Added {len(video_paths)} videos from {folder}")
+            self._update_disable_status_for_buttons()
+
+    def _remove_missing_videos(self):
+        if self.draft is not None and self.draft.remove_missing(os.path.isfile):
+            logger.info("[GUI/PlaylistView] Removed missing videos from the playlist")
+            self._update_disable_status_for_buttons()
+
+    def _deduplicate_videos(self):
+        if self.draft is not None and self.draft.deduplicate():
+            logger.info("[GUI/PlaylistView] Removed duplicate videos from the playlist")
+            self._update_disable_status_for_buttons()
+
     def on_video_button_press(self, icon_view: Gtk.IconView, event: Gdk.EventButton):
         if event.button != 3:
             return False
@@ -633,14 +726,14 @@ class PlaylistView:
         return menu
 
     def _add_video_via_menu(self, video_path: str, monitor_name: str):
-        if self._add_video_to_active_playlist(video_path, monitor_name):
+        if self._add_videos_to_active_playlist([video_path], monitor_name):
             logger.info(f"[GUI/PlaylistView] Video added via context menu: {video_path}")
             if monitor_name and monitor_name != self.monitor_combobox.get_active_text():
                 # switch the queue view to the monitor the video was just added to
                 monitor_names = list(self.monitors.get_monitors())
                 if monitor_name in monitor_names:
+                    # Shows that monitor's list, see on_monitor_changed()
                     self.monitor_combobox.set_active(monitor_names.index(monitor_name))
-            self._update_playlist_view(monitor_name)
             self._update_disable_status_for_buttons()
 
     def _preview_video(self, video_path: str):
@@ -693,18 +786,9 @@ class PlaylistView:
             drag_context.finish(False, False, time)
             return
 
-        if self.current_playlist is None:
-            self.current_playlist = self._new_playlist_data()
-        target_list = self._get_active_list(monitor_name)
-        if target_list is None:
-            drag_context.finish(False, False, time)
-            return
-
         video_path = self.video_paths[index]
-        if video_path not in target_list:
+        if self._add_videos_to_active_playlist([video_path], monitor_name):
             logger.info(f"[GUI/PlaylistView] Video dropped into playlist: {video_path}")
-            target_list.append(video_path)
-            self._update_playlist_view(monitor_name)
             self._update_disable_status_for_buttons()
         drag_context.finish(True, False, time)
 
@@ -720,7 +804,7 @@ class PlaylistView:
         if model is None:
             return None
         try:
-            return model[path][2]
+            return model[path][COLUMN_PATH]
         except (IndexError, TypeError):
             return None
 
@@ -737,21 +821,20 @@ class PlaylistView:
                 cell.set_property("ellipsize", Pango.EllipsizeMode.END)
                 cell.set_property("alignment", Pango.Alignment.CENTER)
 
-    def reload_icon_view(self, *_):
-        self.video_paths = get_video_paths()
-        list_store = Gtk.ListStore(GdkPixbuf.Pixbuf, str)
-        self.videos_view.set_pixbuf_column(0)
-        self.videos_view.set_text_column(1)
-        self._ellipsize_item_labels(self.videos_view)
-        self.videos_view.set_model(list_store)
-        for idx, video_path in enumerate(self.video_paths):
-            pixbuf = Gtk.IconTheme().get_default().load_icon("video-x-generic", 96, 0)
-            list_store.append([pixbuf, os.path.basename(video_path)])
-            thread = threading.Thread(
-                target=get_thumbnail, args=(video_path, list_store, idx)
-            )
-            thread.daemon = True
-            thread.start()
+    def reload_icon_view(self, *_, full_rescan=False):
+        # Scanned on a worker thread, the latest reload wins
+        self._reload_count += 1
+        get_video_paths_async(
+            functools.partial(self._on_video_paths, self._reload_count), full_rescan=full_rescan
+        )
+
+    def _on_video_paths(self, reload_count, video_paths):
+        if reload_count == self._reload_count:
+            self.video_model.set_paths(video_paths)
+
+    def apply_library_changes(self, removed: list, added: list, renamed: dict):
+        self.video_model.apply_changes(removed, added, renamed)
+        self._update_disable_status_for_buttons()
 
     def _update_disable_status_for_buttons(self):
         # if no playlist selected, disable apply/delete buttons
@@ -774,38 +857,42 @@ class PlaylistView:
         self.move_right_button.set_sensitive(selected_video)
 
     def _is_all_mode(self):
-        return self.current_playlist is not None and \
-            self.current_playlist.get(PLAYLIST_KEY_MODE) == PLAYLIST_MODE_ALL
+        return self.draft is not None and self.draft.mode == PLAYLIST_MODE_ALL
 
-    def _new_playlist_data(self):
-        return {
-            PLAYLIST_KEY_MODE: PLAYLIST_MODE_PER_MONITOR,
-            PLAYLIST_KEY_MONITORS: {monitor: [] for monitor in self.monitors.get_monitors()},
-            PLAYLIST_KEY_VIDEOS: [],
-        }
+    def _new_draft(self, playlist_name: str = None):
+        """A draft of the stored playlist `playlist_name`, or of a new one"""
+        if playlist_name not in (self.playlists or {}):
+            draft = PlaylistDraft(None, self.monitors.get_monitors())
+        else:
+            draft = PlaylistDraft(
+                self.playlists[playlist_name],
+                self.monitors.get_monitors(),
+                PlaylistUtil().entry_ids(playlist_name),
+            )
+        draft.on_apply = self._on_draft_apply
+        return draft
 
-    def _get_active_list(self, monitor_name: str):
+    def _get_active_key(self, monitor_name: str):
         """
-        Returns a direct reference to the video list currently being edited: the
-        shared 'videos' list in ALL mode, or this monitor's list in PER_MONITOR mode.
+        Key of the video list currently being edited in the draft: the shared 'videos'
+        list in ALL mode, or this monitor's list in PER_MONITOR mode.
         """
-        if self.current_playlist is None:
+        if self.draft is None:
             return None
         if self._is_all_mode():
-            return self.current_playlist.setdefault(PLAYLIST_KEY_VIDEOS, [])
+            return ALL
         if not monitor_name:
             return None
-        monitors = self.current_playlist.setdefault(PLAYLIST_KEY_MONITORS, {})
-        return monitors.setdefault(monitor_name, [])
+        return monitor_name
 
     def _sync_distribution_mode_ui(self):
-        mode = self.current_playlist.get(PLAYLIST_KEY_MODE, PLAYLIST_MODE_PER_MONITOR)
+        mode = self.draft.mode
         index = self.DISTRIBUTION_MODES.index(mode) if mode in self.DISTRIBUTION_MODES else 0
         self.distribution_mode_combobox.set_active(index)
         self.monitor_combobox.set_sensitive(mode == PLAYLIST_MODE_PER_MONITOR)
 
     def _update_playlist_view(self, monitor_name: str):
-        if self.current_playlist is None:
+        if self.draft is None:
             logger.warning(f"[GUI/PlaylistView] No current playlist to update")
             return
 
@@ -814,15 +901,16 @@ class PlaylistView:
             logger.warning(f"[GUI/PlaylistView] Monitor {monitor_name} not found")
             return
 
-        video_list = self._get_active_list(monitor_name)
-        if video_list is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             return
+        video_list = self.draft.get_list(key)
 
         # add icons for playlist videos
-        # 3rd column holds the full video path (not displayed) so a drag-reorder
-        # can be read back into `self.current_playlist` without relying on the
+        # COLUMN_PATH holds the full video path (not displayed) so a drag-reorder
+        # can be read back into the draft without relying on the
         # (non-unique) displayed basename.
-        list_store = Gtk.ListStore(GdkPixbuf.Pixbuf, str, str)
+        list_store = new_video_list_store()
         self.playlist_icon_view.set_pixbuf_column(0)
         self.playlist_icon_view.set_text_column(1)
         self._ellipsize_item_labels(self.playlist_icon_view)
@@ -832,15 +920,12 @@ class PlaylistView:
         # item count so the icon view never wraps, and lets the ScrolledWindow's
         # horizontal scrollbar take over instead.
         self.playlist_icon_view.set_columns(max(len(video_list), 1))
-        list_store.connect("row-deleted", self._on_playlist_reordered)
-        for idx, video_path in enumerate(video_list):
-            pixbuf = Gtk.IconTheme().get_default().load_icon("video-x-generic", 96, 0)
-            list_store.append([pixbuf, os.path.basename(video_path), video_path])
-            thread = threading.Thread(
-                target=get_thumbnail, args=(video_path, list_store, idx)
-            )
-            thread.daemon = True
-            thread.start()
+        for video_path in video_list:
+            list_store.append(new_video_row(video_path))
+        self._queue_deleted_id = list_store.connect("row-deleted", self._on_playlist_reordered)
+        self.queue_key = key
+        self.queue_model = list_store
+        self.queue_thumbnails.reset()
 
         logger.info(f"[GUI/PlaylistView] Updating playlist view "
                     f"({'all monitors' if is_all_mode else monitor_name})")
@@ -851,22 +936,53 @@ class PlaylistView:
         (GTK's built-in reorderable DnD moves a row by inserting the dragged row at
         its new position, then deleting the old one - so "row-deleted" is the point
         at which the model already reflects the final, reordered state).
-        Keep `self.current_playlist` in sync so it saves/applies in the new order.
+        Keep the draft in sync so it saves/applies in the new order.
         """
         monitor_name = self.monitor_combobox.get_active_text()
-        target_list = self._get_active_list(monitor_name)
-        if target_list is None:
+        key = self._get_active_key(monitor_name)
+        if key is None:
             return
 
-        new_order = [row[2] for row in model]
-        if new_order == target_list:
+        # The model already is in the new order
+        self._is_reordering = True
+        try:
+            is_changed = self.draft.reorder(key, [row[COLUMN_PATH] for row in model])
+        finally:
+            self._is_reordering = False
+        if not is_changed:
             return
 
         logger.info(f"[GUI/PlaylistView] Playlist reordered "
                     f"({'all monitors' if self._is_all_mode() else monitor_name})")
-        target_list[:] = new_order
         self._update_disable_status_for_buttons()
 
+    def _on_draft_apply(self, op):
+        """Apply an edit of the draft to the list shown, if it's the one edited"""
+        if (
+            op[0] == "mode"
+            or op[1] != self.queue_key
+            or self.queue_model is None
+            or self._is_reordering
+        ):
+            return
+        model = self.queue_model
+        with model.handler_block(self._queue_deleted_id):
+            if op[0] == "insert":
+                for index, video_path in op[2]:
+                    model.insert(index, new_video_row(video_path))
+            elif op[0] == "remove":
+                for index, _video_path in reversed(op[2]):
+                    model.remove(model.get_iter(index))
+            elif op[0] == "move":
+                src, dst = op[2], op[3]
+                if dst < src:
+                    model.move_before(model.get_iter(src), model.get_iter(dst))
+                elif dst > src:
+                    model.move_after(model.get_iter(src), model.get_iter(dst))
+        self.playlist_icon_view.set_columns(max(len(model), 1))
+        # New rows need their thumbnails, the others keep theirs
+        self.queue_thumbnails.schedule_update()
+
     def _build_playlist_row(self, name: str, playlist_data: dict):
         row = Gtk.ListBoxRow()
         # Identity lives on the row object itself (not the displayed label text) so
@@ -890,8 +1006,7 @@ class PlaylistView:
         """Clear the editor to a blank, unsaved playlist draft (no listbox row selected)."""
         self.current_playlist_name = None
         self.playlist_name_entry.set_text("")
-        self.current_playlist = self._new_playlist_data()
-        self.saved_snapshot = copy.deepcopy(self.current_playlist)
+        self.draft = self._new_draft()
         self._sync_distribution_mode_ui()
         self._update_disable_status_for_buttons()
         monitor_name = self.monitor_combobox.get_active_text()
@@ -927,13 +1042,22 @@ class PlaylistView:
         else:
             self._reset_to_new_draft()
 
-    def _save_playlist(self, playlist_name=None):
-        original = PlaylistUtil().load()
-        original["playlists"] = self.playlists
-        self.playlists = original["playlists"]
-        PlaylistUtil().save(original)
+    def _save_playlist(self, playlist_name, changes: dict = None):
+        """
+        Store `playlist_name`: only `changes` (a partial playlist, see
+        PlaylistDraft.delta()) if given, otherwise as in self.playlists, or delete it if
+        it's gone from there
+        """
+        if changes is not None:
+            if not changes:
+                return
+            PlaylistUtil().update_playlist(playlist_name, changes)
+        elif playlist_name in self.playlists:
+            PlaylistUtil().upsert_playlist(playlist_name, self.playlists[playlist_name])
+        else:
+            PlaylistUtil().delete_playlist(playlist_name)
 
-        if self.server is not None and playlist_name:
+        if self.server is not None:
             active_playlist = self.config.get(CONFIG_KEY_ACTIVE_PLAYLIST, None)
             if playlist_name == active_playlist:
                 self.server.playlist(playlist_name)  # live-reload the currently applied playlist
@@ -941,5 +1065,6 @@ class PlaylistView:
     def _load_config(self):
         self.config = ConfigUtil().load()
         
-    def _save_config(self):
-        ConfigUtil().save(self.config)
\ No newline at end of file
+    def _save_config(self, *keys):
+        # Merge just these keys: a whole write would undo what others changed meanwhile
+        ConfigUtil().save_later({key: self.config[key] for key in keys})
\ No newline at end of file
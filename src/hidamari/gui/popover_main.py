@@ -5,16 +5,21 @@ try:
     sys.path.insert(1, os.path.join(sys.path[0], ".."))
     from gui.imports import *
     from gui.about_dialog import AboutDialog
-    from utils import ConfigUtil
+    from utils import ConfigUtil, to_variant_dict
 except ModuleNotFoundError:
     from hidamari.gui.imports import *
     from hidamari.gui.about_dialog import AboutDialog
-    from hidamari.utils import ConfigUtil
+    from hidamari.utils import ConfigUtil, to_variant_dict
+
+# A dragged slider changes its value on every step; send the latest one this often
+SETTINGS_APPLY_DELAY_MSEC = 50
 
 class PopoverMain:
     def __init__(self, config: ConfigUtil, server):
         self.config = config
         self.server = server
+        self._pending_keys = set()
+        self._apply_id = None
         self.builder = Gtk.Builder()
         try:
             self.builder.add_from_resource(APP_UI_RESOURCE_PATH + "popover_main.ui")
@@ -33,17 +38,13 @@ class PopoverMain:
     def on_volume_changed(self, adjustment):
         self.config[CONFIG_KEY_VOLUME] = int(adjustment.get_value())
         logger.info(f"[GUI/PopoverMain] Volume: {self.config[CONFIG_KEY_VOLUME]}")
-        self._save_config_delay()
-        if self.server is not None:
-            self.server.volume = self.config[CONFIG_KEY_VOLUME]
+        self._apply_settings(CONFIG_KEY_VOLUME)
         self.set_mute_toggle_icon()
 
     def on_blur_radius_changed(self, adjustment):
         self.config[CONFIG_KEY_BLUR_RADIUS] = int(adjustment.get_value())
         logger.info(f"[GUI/PopoverMain] Blur radius: {self.config[CONFIG_KEY_BLUR_RADIUS]}")
-        self._save_config_delay()
-        if self.server is not None:
-            self.server.blur_radius = self.config[CONFIG_KEY_BLUR_RADIUS]
+        self._apply_settings(CONFIG_KEY_BLUR_RADIUS)
         
     def set_mute_toggle_icon(self):
         toggle_icon: Gtk.Image = self.builder.get_object("ToggleMuteIcon")
@@ -76,9 +77,7 @@ class PopoverMain:
         action.set_state(state)
         self.config[CONFIG_KEY_MUTE] = bool(state)
         logger.info(f"[GUI/PopoverMain] {action.get_name()}: {state}")
-        self._save_config()
-        if self.server is not None:
-            self.server.is_mute = self.config[CONFIG_KEY_MUTE]
+        self._apply_settings(CONFIG_KEY_MUTE)
         self.set_mute_toggle_icon()
         self.set_scale_volume_sensitive()
         
@@ -86,26 +85,20 @@ class PopoverMain:
         action.set_state(state)
         self.config[CONFIG_KEY_STATIC_WALLPAPER] = bool(state)
         logger.info(f"[GUI/PopoverMain] {action.get_name()}: {state}")
-        self._save_config()
-        if self.server is not None:
-            self.server.is_static_wallpaper = self.config[CONFIG_KEY_STATIC_WALLPAPER]
+        self._apply_settings(CONFIG_KEY_STATIC_WALLPAPER)
         self.set_spin_blur_radius_sensitive()
 
     def on_pause_when_maximized(self, action, state):
         action.set_state(state)
         self.config[CONFIG_KEY_PAUSE_WHEN_MAXIMIZED] = bool(state)
         logger.info(f"[GUI/PopoverMain] {action.get_name()}: {state}")
-        self._save_config()
-        if self.server is not None:
-            self.server.is_pause_when_maximized = self.config[CONFIG_KEY_PAUSE_WHEN_MAXIMIZED]
+        self._apply_settings(CONFIG_KEY_PAUSE_WHEN_MAXIMIZED)
         
     def on_mute_when_maximized(self, action, state):
         action.set_state(state)
         self.config[CONFIG_KEY_MUTE_WHEN_MAXIMIZED] = bool(state)
         logger.info(f"[GUI/PopoverMain] {action.get_name()}: {state}")
-        self._save_config()
-        if self.server is not None:
-            self.server.is_mute_when_maximized = self.config[CONFIG_KEY_MUTE_WHEN_MAXIMIZED]
+        self._apply_settings(CONFIG_KEY_MUTE_WHEN_MAXIMIZED)
             
     def on_about(self, window: Gtk.Window, version: str, *_):
         dialog = AboutDialog().dialog
@@ -126,12 +119,21 @@ class PopoverMain:
             icon_name = "audio-volume-high-symbolic"
         toggle_icon.set_from_icon_name(icon_name=icon_name, size=0)
         
+    def _apply_settings(self, *keys):
+        self._pending_keys.update(keys)
+        if self._apply_id is None:
+            self._apply_id = GLib.timeout_add(SETTINGS_APPLY_DELAY_MSEC, self._flush_settings)
+
+    def _flush_settings(self):
+        self._apply_id = None
+        settings = {key: self.config[key] for key in self._pending_keys}
+        self._pending_keys.clear()
+        if self.server is not None:
+            # The server forwards them to the player and persists them
+            self.server.apply_settings(to_variant_dict(settings))
+        else:
+            ConfigUtil().save_later(settings)
+        return GLib.SOURCE_REMOVE
+
     def _load_config(self):
         self.config = ConfigUtil().load()
-        
-    def _save_config(self):
-        ConfigUtil().save(self.config)
-        
-    @debounce(1)
-    def _save_config_delay(self):
-        self._save_config()
\ No newline at end of file
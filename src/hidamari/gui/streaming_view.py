@@ -1,5 +1,4 @@
 import sys
-import yt_dlp
 
 try:
     import os
@@ -30,6 +29,9 @@ class StreamingView:
         
     def _check_yt_dlp(self, raw_url):
         # Check if the url is valid (yt_dlp)
+        # Imported here: yt_dlp is heavy and only needed once a stream is submitted
+        import yt_dlp
+
         try:
             with yt_dlp.YoutubeDL({"noplaylist": True}) as ydl:
                 ydl.extract_info(raw_url, download=False)
@@ -47,12 +49,14 @@ class StreamingView:
         logger.info(f"[GUI/StreamingView] Streaming: {url}")
         self.config[CONFIG_KEY_MODE] = MODE_STREAM
         self.config[CONFIG_KEY_DATA_SOURCE]['Default'] = url #! we dont want to break the config, webpage and stream modes will kept in Default source
-        self._save_config()
         if self.server is not None:
             self.server.stream(url)
+        else:
+            self._save_config(CONFIG_KEY_MODE, CONFIG_KEY_DATA_SOURCE)
 
     def _load_config(self):
         self.config = ConfigUtil().load()
         
-    def _save_config(self):
-        ConfigUtil().save(self.config)
\ No newline at end of file
+    def _save_config(self, *keys):
+        # Merge just these keys: a whole write would undo what others changed meanwhile
+        ConfigUtil().save_later({key: self.config[key] for key in keys})
\ No newline at end of file
@@ -0,0 +1,471 @@
+"""
+Thumbnails of the gallery views.
+
+They are made by one shared ThumbnailScheduler, on a fixed number of worker threads
+instead of a thread per row:
+- requests are prioritized, the rows visible in their IconView first,
+- requests for the same video (e.g. from the library gallery and the playlist queue)
+  share one job,
+- a view that is rebuilt cancels the requests it still has pending.
+Results are delivered to the requesters on the GTK main loop, queued and applied in
+batches by a single idle callback that yields back after RESULTS_BUDGET_MSEC, so a
+burst of completions is applied in a few frames with one relayout each instead of a
+relayout per thumbnail.
+
+Scaled thumbnails are kept in a process-wide LRU `cache` with a memory budget, so
+views that are rebuilt (the playlist queue, after every edit) or scrolled back redraw
+from memory instead of decoding the PNGs again.
+
+Missing thumbnails are made in batches: a worker takes up to BATCH_SIZE jobs and
+extracts their frames with a single ffmpeg process, instead of starting a thumbnailer
+process per video. A batch ffmpeg fails on is split and retried, so one bad file only
+costs a few more processes. The frames are saved to the freedesktop thumbnail cache
+like the ones of the desktop's thumbnailers.
+Benchmark against the per-file thumbnailer:
+    python -m hidamari.gui.thumbnails <folder of videos>
+"""
+
+import collections
+import heapq
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import gi
+
+gi.require_version("GnomeDesktop", "4.0")
+gi.require_version("Gtk", "3.0")
+from gi.repository import GdkPixbuf, Gio, GLib, GnomeDesktop
+
+from hidamari import metadata
+from hidamari.commons import LOGGER_NAME
+from hidamari.utils import is_flatpak
+
+logger = logging.getLogger(LOGGER_NAME)
+
+THUMBNAIL_HEIGHT = 96
+# Each worker may run a thumbnailer process
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# About a thousand 16:9 thumbnails
+CACHE_BUDGET_BYTES = 64 * 1024 * 1024
+# Main loop time spent applying results per idle callback, about half a frame at 60Hz
+RESULTS_BUDGET_MSEC = 8
+# Videos per ffmpeg process, each input keeps a decoder open
+BATCH_SIZE = 8
+BATCH_TIMEOUT_SEC = 120
+# Fit in the freedesktop "large" size, like `totem-video-thumbnailer -s 256`
+FRAME_FILTER = "scale=w=256:h=256:force_original_aspect_ratio=decrease"
+
+# Priorities are (tier, order) tuples, lowest first
+PRIORITY_VISIBLE = 0
+PRIORITY_DEFAULT = 1
+
+
+def _generate_thumbnail_flatpak(filename):
+    # Inside Flatpak, DesktopThumbnailFactory runs the thumbnailer via
+    # `flatpak-spawn --sandbox`, where glycin (which writes the PNG on
+    # recent GNOME runtimes) can't spawn its own sandboxed loader — nested
+    # sandboxes are blocked, so every thumbnail fails. Run the bundled
+    # thumbnailer directly instead; glycin's single-level sandbox then
+    # works via the org.freedesktop.Flatpak portal.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "thumbnail.png")
+        subprocess.run(
+            ["totem-video-thumbnailer", "-s", "256", filename, output],
+            check=True,
+            timeout=60,
+        )
+        return GdkPixbuf.Pixbuf.new_from_file(output)
+
+
+def generate_thumbnail(filename):
+    """Generate and cache a thumbnail. Returns its path, or None if one can't
+    be produced (e.g. no usable thumbnailer, or it failed)."""
+    factory = GnomeDesktop.DesktopThumbnailFactory()
+    mtime = os.path.getmtime(filename)
+    file = Gio.file_new_for_path(filename)
+    uri = file.get_uri()
+    info = file.query_info("standard::content-type", Gio.FileQueryInfoFlags.NONE, None)
+    mime_type = info.get_content_type()
+
+    cached = factory.lookup(uri, mtime)
+    if cached is not None:
+        return cached
+
+    if not factory.can_thumbnail(uri, mime_type, mtime):
+        return None
+
+    if is_flatpak():
+        pixbuf = _generate_thumbnail_flatpak(filename)
+    else:
+        pixbuf = factory.generate_thumbnail(uri, mime_type)
+    if pixbuf is None:
+        return None
+
+    factory.save_thumbnail(pixbuf, uri, mtime)
+    return factory.lookup(uri, mtime)
+
+
+class PixbufCache:
+    """LRU cache of scaled thumbnails keyed by (path, mtime, size), thread-safe"""
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.size_bytes = 0
+        self._entries = collections.OrderedDict()  # key -> pixbuf, least recently used first
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(video_path):
+        """None if `video_path` can't be stat()'ed"""
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return None
+        return (video_path, st.st_mtime_ns, st.st_size)
+
+    def get(self, video_path, key=None):
+        key = key or self.key(video_path)
+        with self._lock:
+            pixbuf = self._entries.get(key)
+            if pixbuf is not None:
+                self._entries.move_to_end(key)
+            return pixbuf
+
+    def put(self, key, pixbuf):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous.get_byte_length()
+            self._entries[key] = pixbuf
+            self.size_bytes += pixbuf.get_byte_length()
+            while self.size_bytes > self.budget_bytes and len(self._entries) > 1:
+                _key, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= evicted.get_byte_length()
+
+
+cache = PixbufCache()
+
+
+def extract_frames(video_paths, output_dir):
+    """
+    Grab one frame of each of `video_paths` with a single ffmpeg process, as PNGs in
+    `output_dir`. Returns {video path: PNG path} of the frames it got.
+
+    ffmpeg gives up on the whole batch when one file fails, e.g. one it can't open.
+    The batch is then split in halves that are retried, so the other files still get
+    their frames: one bad file among BATCH_SIZE costs 2 * log2(BATCH_SIZE) more
+    processes. Raises OSError if ffmpeg can't be run, TimeoutExpired if a batch hangs.
+    """
+    outputs = {
+        video_path: os.path.join(output_dir, f"{index}.png")
+        for index, video_path in enumerate(video_paths)
+    }
+    frames = {}
+    pending = [list(video_paths)]
+    while pending:
+        batch = pending.pop()
+        try:
+            _run_ffmpeg(batch, outputs)
+        except subprocess.CalledProcessError:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                pending += [batch[middle:], batch[:middle]]
+            else:
+                logger.debug(f"[Thumbnail] ffmpeg can't do {os.path.basename(batch[0])}")
+            continue
+        for video_path in batch:
+            output = outputs[video_path]
+            if os.path.isfile(output) and os.path.getsize(output) > 0:
+                frames[video_path] = output
+    return frames
+
+
+def _run_ffmpeg(video_paths, outputs):
+    command = ["ffmpeg", "-nostdin", "-v", "error", "-y"]
+    for video_path in video_paths:
+        # Input seeking (before -i) jumps to the nearest keyframe, no decoding up to it
+        command += ["-ss", f"{_frame_position(video_path):.3f}", "-i", video_path]
+    for index, video_path in enumerate(video_paths):
+        command += [
+            "-map", f"{index}:v:0", "-frames:v", "1", "-vf", FRAME_FILTER, outputs[video_path]
+        ]
+    subprocess.run(
+        command,
+        check=True,
+        timeout=BATCH_TIMEOUT_SEC,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def _frame_position(video_path):
+    # A third in, past intros and fades, like totem-video-thumbnailer. Only a known
+    # duration is used, probing here would cost a process per video again.
+    info = metadata.get_cached(video_path)
+    return info["duration"] / 3 if info and info["duration"] else 0
+
+
+def generate_thumbnails(video_paths):
+    """
+    Generate and cache the thumbnails of `video_paths` in one ffmpeg batch. Returns
+    {video path: thumbnail path or None}. Videos ffmpeg can't do fall back to
+    generate_thumbnail().
+    """
+    factory = GnomeDesktop.DesktopThumbnailFactory()
+    results = {}
+    missing = {}  # video path -> (uri, mtime)
+    for video_path in video_paths:
+        uri = Gio.File.new_for_path(video_path).get_uri()
+        mtime = os.path.getmtime(video_path)
+        cached = factory.lookup(uri, mtime)
+        if cached is not None:
+            results[video_path] = cached
+        else:
+            missing[video_path] = (uri, mtime)
+    if not missing:
+        return results
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            frames = extract_frames(list(missing), tmp_dir)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"[Thumbnail] Batch of {len(missing)} failed, one by one instead: {e}")
+            frames = {}
+        for video_path, (uri, mtime) in missing.items():
+            if video_path in frames:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_file(frames[video_path])
+                factory.save_thumbnail(pixbuf, uri, mtime)
+                results[video_path] = factory.lookup(uri, mtime)
+            else:
+                results[video_path] = generate_thumbnail(video_path)
+    return results
+
+
+def load_thumbnail(video_path):
+    """The thumbnail of `video_path` scaled to THUMBNAIL_HEIGHT, None if there's none"""
+    return dict(load_thumbnails([video_path]))[video_path]
+
+
+def load_thumbnails(video_paths):
+    """
+    Yield (video path, thumbnail scaled to THUMBNAIL_HEIGHT or None) for `video_paths`:
+    first the ones already cached or thumbnailed, then the others, generated in one batch.
+    """
+    missing = {}  # video path -> cache key
+    for video_path in video_paths:
+        key = cache.key(video_path)
+        if key is None:
+            yield video_path, None
+            continue
+        pixbuf = cache.get(video_path, key)
+        if pixbuf is None:
+            thumbnail = _guarded(video_path, _get_thumbnail_path, video_path)
+            if thumbnail is None:
+                missing[video_path] = key
+                continue
+            pixbuf = _load_scaled(video_path, key, thumbnail)
+        yield video_path, pixbuf
+    if missing:
+        thumbnails = _guarded(missing, generate_thumbnails, list(missing)) or {}
+        for video_path, key in missing.items():
+            thumbnail = thumbnails.get(video_path)
+            yield video_path, _load_scaled(video_path, key, thumbnail) if thumbnail else None
+
+
+def _get_thumbnail_path(video_path):
+    info = Gio.File.new_for_path(video_path).query_info(
+        "thumbnail::path", Gio.FileQueryInfoFlags.NONE, None
+    )
+    return info.get_attribute_byte_string("thumbnail::path")
+
+
+def _load_scaled(video_path, key, thumbnail):
+    pixbuf = _guarded(
+        video_path, GdkPixbuf.Pixbuf.new_from_file_at_size, thumbnail, -1, THUMBNAIL_HEIGHT
+    )
+    if pixbuf is not None:
+        cache.put(key, pixbuf)
+    return pixbuf
+
+
+def _guarded(subject, function, *args):
+    # Best-effort: a preview thumbnail must never crash the GUI. On failure the
+    # generic video icon set by the caller stays in place. (In the Flatpak the
+    # sandboxed thumbnailer can fail; that's fine, we just skip the preview.)
+    try:
+        return function(*args)
+    except (GLib.Error, OSError, subprocess.SubprocessError) as e:
+        names = subject if isinstance(subject, str) else f"{len(subject)} videos"
+        logger.debug("[Thumbnail] Skipped %s: %s", os.path.basename(names), e)
+        return None
+
+
+class _Job:
+    def __init__(self, video_path):
+        self.video_path = video_path
+        self.waiters = []  # [[owner, callback, priority]]
+        self.priority = None
+        self.is_running = False
+
+
+class ThumbnailScheduler:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._jobs = {}  # video path -> _Job, pending or running
+        self._heap = []  # (priority, seq, video path), stale entries are skipped
+        self._seq = itertools.count()
+        self._boost = itertools.count(1)
+        self._cond = threading.Condition()
+        self._workers = []
+        self._results = collections.deque()  # (job, pixbuf), to apply on the main loop
+        self._is_flush_pending = False
+
+    def request(self, owner, video_path, callback: callable, priority=(PRIORITY_DEFAULT, 0)):
+        """
+        Make the thumbnail of `video_path` for `owner` (e.g. a view's model), then call
+        `callback(pixbuf)` on the main loop. pixbuf is None if there's no thumbnail.
+        """
+        with self._cond:
+            job = self._jobs.get(video_path)
+            if job is None:
+                job = self._jobs[video_path] = _Job(video_path)
+            job.waiters.append([owner, callback, priority])
+            self._update_priority(job)
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._run, name="hidamari-thumbnailer", daemon=True
+                )
+                self._workers.append(worker)
+                worker.start()
+            self._cond.notify()
+
+    def prioritize(self, owner, video_paths):
+        """Make the pending requests of `owner` for `video_paths` the next ones, e.g. the
+        rows that just scrolled into view"""
+        priority = (PRIORITY_VISIBLE, -next(self._boost))
+        with self._cond:
+            for video_path in video_paths:
+                job = self._jobs.get(video_path)
+                if job is None or job.is_running:
+                    continue
+                for waiter in job.waiters:
+                    if waiter[0] is owner:
+                        waiter[2] = priority
+                self._update_priority(job)
+
+    def cancel(self, owner, video_paths=None):
+        """Drop the requests of `owner`, e.g. before rebuilding a view, or only those for
+        `video_paths`"""
+        with self._cond:
+            if video_paths is None:
+                video_paths = list(self._jobs)
+            for video_path in video_paths:
+                job = self._jobs.get(video_path)
+                if job is None:
+                    continue
+                job.waiters = [waiter for waiter in job.waiters if waiter[0] is not owner]
+                if not job.waiters and not job.is_running:
+                    del self._jobs[video_path]
+
+    def _update_priority(self, job):
+        priority = min(waiter[2] for waiter in job.waiters)
+        if priority != job.priority:
+            job.priority = priority
+            heapq.heappush(self._heap, (priority, next(self._seq), job.video_path))
+
+    def _next_jobs(self, count):
+        jobs = []
+        while self._heap and len(jobs) < count:
+            priority, _seq, video_path = heapq.heappop(self._heap)
+            job = self._jobs.get(video_path)
+            if job is not None and not job.is_running and job.priority == priority:
+                job.is_running = True
+                jobs.append(job)
+        return jobs
+
+    def _run(self):
+        while True:
+            with self._cond:
+                jobs = self._next_jobs(BATCH_SIZE)
+                while not jobs:
+                    self._cond.wait()
+                    jobs = self._next_jobs(BATCH_SIZE)
+            jobs = {job.video_path: job for job in jobs}
+            # Queued one by one: the ones already thumbnailed don't wait for the batch
+            for video_path, pixbuf in load_thumbnails(list(jobs)):
+                with self._cond:
+                    self._results.append((jobs[video_path], pixbuf))
+                    if not self._is_flush_pending:
+                        self._is_flush_pending = True
+                        # Below the redraw priority: a frame is drawn between batches
+                        GLib.idle_add(self._flush_results)
+
+    def _flush_results(self):
+        deadline = time.monotonic() + RESULTS_BUDGET_MSEC / 1000
+        while time.monotonic() < deadline:
+            # The waiters are read only now: a request cancelled meanwhile gets nothing
+            with self._cond:
+                if not self._results:
+                    self._is_flush_pending = False
+                    return GLib.SOURCE_REMOVE
+                job, pixbuf = self._results.popleft()
+                if self._jobs.get(job.video_path) is job:
+                    del self._jobs[job.video_path]
+                waiters = job.waiters
+            for _owner, callback, _priority in waiters:
+                callback(pixbuf)
+        return GLib.SOURCE_CONTINUE
+
+
+scheduler = ThumbnailScheduler()
+
+
+def _benchmark(folder):
+    """Time the per-file thumbnailer against the batch extraction, without caching"""
+    video_paths = sorted(
+        os.path.join(folder, name)
+        for name in os.listdir(folder)
+        if os.path.isfile(os.path.join(folder, name))
+    )
+    factory = GnomeDesktop.DesktopThumbnailFactory()
+
+    start = time.monotonic()
+    per_file = 0
+    for video_path in video_paths:
+        file = Gio.File.new_for_path(video_path)
+        info = file.query_info("standard::content-type", Gio.FileQueryInfoFlags.NONE, None)
+        try:
+            if is_flatpak():
+                pixbuf = _generate_thumbnail_flatpak(video_path)
+            else:
+                pixbuf = factory.generate_thumbnail(file.get_uri(), info.get_content_type())
+        except (GLib.Error, subprocess.SubprocessError):
+            pixbuf = None
+        per_file += pixbuf is not None
+    per_file_sec = time.monotonic() - start
+
+    start = time.monotonic()
+    batched = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for first in range(0, len(video_paths), BATCH_SIZE):
+            try:
+                batched += len(extract_frames(video_paths[first:first + BATCH_SIZE], tmp_dir))
+            except (OSError, subprocess.SubprocessError):
+                pass
+    batched_sec = time.monotonic() - start
+
+    print(f"{len(video_paths)} files")
+    print(f"per file: {per_file} thumbnails in {per_file_sec:.2f}s")
+    print(f"batches of {BATCH_SIZE}: {batched} thumbnails in {batched_sec:.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m hidamari.gui.thumbnails <folder of videos>")
+    _benchmark(sys.argv[1])
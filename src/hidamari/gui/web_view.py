@@ -1,5 +1,4 @@
 import sys
-import requests
 
 try:
     import os
@@ -30,6 +29,9 @@ class WebView:
         
     def _check_url(self, url):
         # Check if the url is valid
+        # Imported here: requests is only needed once a URL is submitted
+        import requests
+
         try:
             response = requests.get(url)
         except requests.exceptions.RequestException as e:
@@ -53,9 +55,10 @@ class WebView:
         logger.info(f"[GUI/WebView] Webpage: {url}")
         self.config[CONFIG_KEY_MODE] = MODE_WEBPAGE
         self.config[CONFIG_KEY_DATA_SOURCE]['Default'] = url #! we dont want to break the config, webpage and stream modes will kept in Default source
-        self._save_config()
         if self.server is not None:
             self.server.webpage(url)
+        else:
+            self._save_config(CONFIG_KEY_MODE, CONFIG_KEY_DATA_SOURCE)
             
     def on_local_web_page_apply(self, *_):
         file_chooser: Gtk.FileChooserButton = self.builder.get_object("FileChooser")
@@ -67,12 +70,14 @@ class WebView:
         logger.info(f"[GUI/WebView] Local Webpage: {file_path}")
         self.config[CONFIG_KEY_MODE] = MODE_WEBPAGE
         self.config[CONFIG_KEY_DATA_SOURCE]['Default'] = file_path #! we dont want to break the config, webpage and stream modes will kept in Default source
-        self._save_config()
         if self.server is not None:
             self.server.webpage(choose.get_path())
+        else:
+            self._save_config(CONFIG_KEY_MODE, CONFIG_KEY_DATA_SOURCE)
             
     def _load_config(self):
         self.config = ConfigUtil().load()
         
-    def _save_config(self):
-        ConfigUtil().save(self.config)
\ No newline at end of file
+    def _save_config(self, *keys):
+        # Merge just these keys: a whole write would undo what others changed meanwhile
+        ConfigUtil().save_later({key: self.config[key] for key in keys})
\ No newline at end of file
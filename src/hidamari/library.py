@@ -0,0 +1,378 @@
+"""
+Media library index.
+
+An SQLite index of the video folders in CACHE_DIR (it can be deleted at any time):
+- `files` caches the content type of every file, keyed by (inode, size, mtime), so
+  a file is only sniffed again when it changed,
+- `dirs` remembers the mtime of every folder, so an unchanged folder isn't listed
+  again: only its subfolders are visited,
+- `metadata` holds the ffprobe results of the metadata module.
+Queries rescan what changed first, which usually costs one stat() per folder. Files
+modified in place (same name) in an unchanged folder are noticed by a full rescan
+(`scan(full=True)`), e.g. on an explicit reload. Like playlist_store, every thread
+has its own connection and the database is in WAL mode, so the server, the GUI and
+the players share it.
+
+LibraryWatcher keeps the index of a folder up to date as files come and go, and
+reports the videos added, removed and renamed.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from gi.repository import Gio, GLib
+
+from hidamari.commons import CACHE_DIR, LOGGER_NAME, VIDEO_WALLPAPER_DIR
+
+logger = logging.getLogger(LOGGER_NAME)
+
+LIBRARY_DB_PATH = os.path.join(CACHE_DIR, "library.db")
+# Bump to rebuild the index from scratch
+LIBRARY_VERSION = 2
+BUSY_TIMEOUT_SEC = 10
+# Wait for this long without file events before rescanning, e.g. while a folder of
+# clips is being copied, but no longer than WATCH_MAX_DELAY_MSEC after the first one
+WATCH_DEBOUNCE_MSEC = 500
+WATCH_MAX_DELAY_MSEC = 5000
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        dir TEXT NOT NULL,
+        inode INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        content_type TEXT NOT NULL,
+        is_video INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS files_by_dir ON files (dir)",
+    """
+    CREATE TABLE IF NOT EXISTS dirs (
+        path TEXT PRIMARY KEY,
+        parent TEXT,
+        mtime_ns INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS dirs_by_parent ON dirs (parent)",
+    # Any video, not only the indexed ones. See metadata.FIELDS.
+    """
+    CREATE TABLE IF NOT EXISTS metadata (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        width INTEGER,
+        height INTEGER,
+        duration REAL,
+        fps REAL,
+        codec TEXT,
+        bitrate INTEGER
+    ) WITHOUT ROWID
+    """,
+)
+
+_local = threading.local()
+
+
+def connect():
+    """The connection of the calling thread, opened on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(LIBRARY_DB_PATH, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # It's a cache, losing the last transactions on power loss is fine
+        conn.execute("PRAGMA synchronous = NORMAL")
+        with _transaction(conn):
+            if conn.execute("PRAGMA user_version").fetchone()[0] != LIBRARY_VERSION:
+                conn.execute("DROP TABLE IF EXISTS files")
+                conn.execute("DROP TABLE IF EXISTS dirs")
+                conn.execute("DROP TABLE IF EXISTS metadata")
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {LIBRARY_VERSION}")
+        _local.conn = conn
+    return conn
+
+
+@contextlib.contextmanager
+def _transaction(conn):
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _content_type(path):
+    try:
+        info = Gio.File.new_for_path(path).query_info(
+            Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE, Gio.FileQueryInfoFlags.NONE, None
+        )
+    except GLib.Error as e:
+        logger.debug(f"[Library] Can't query {path}: {e}")
+        return ""
+    return info.get_content_type() or ""
+
+
+def _is_under(column):
+    """SQL condition: `column` is the folder ?1 or one of its subfolders (?2 = ?1 + '/')"""
+    return f"({column} = ?1 OR substr({column}, 1, length(?2)) = ?2)"
+
+
+def scan(directory=VIDEO_WALLPAPER_DIR, full=False):
+    """
+    Bring the index of `directory` (recursively) up to date. With `full`, every file is
+    stat()'ed, not only those in folders whose listing changed.
+    """
+    directory = os.path.abspath(directory)
+    conn = connect()
+    with _transaction(conn):
+        _scan_dir(conn, directory, full, set())
+
+
+def _scan_dir(conn, path, full, visited):
+    try:
+        st = os.stat(path)
+    except OSError:
+        _forget_dir(conn, path)
+        return
+    # Symlinked folders may loop
+    if (st.st_dev, st.st_ino) in visited:
+        return
+    visited.add((st.st_dev, st.st_ino))
+
+    row = conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (path,)).fetchone()
+    if row is not None and row[0] == st.st_mtime_ns and not full:
+        # Same entries as last time, only the subfolders may have changed
+        subdirs = [p for (p,) in conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+        for subdir in subdirs:
+            _scan_dir(conn, subdir, full, visited)
+        return
+
+    files = {}
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        files[entry.path] = entry.stat()
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning(f"[Library] Can't list {path}: {e}")
+        _forget_dir(conn, path)
+        return
+
+    known = {
+        p: (inode, size, mtime_ns)
+        for p, inode, size, mtime_ns in conn.execute(
+            "SELECT path, inode, size, mtime_ns FROM files WHERE dir = ?", (path,)
+        )
+    }
+    conn.executemany(
+        "DELETE FROM files WHERE path = ?", [(p,) for p in known.keys() - files.keys()]
+    )
+    changed = []
+    for p, file_st in files.items():
+        key = (file_st.st_ino, file_st.st_size, file_st.st_mtime_ns)
+        if known.get(p) != key:
+            content_type = _content_type(p)
+            changed.append((p, path, *key, content_type, "video" in content_type))
+    conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+    if changed:
+        logger.debug(f"[Library] Indexed {len(changed)} files in {path}")
+
+    known_subdirs = {p for (p,) in conn.execute("SELECT path FROM dirs WHERE parent = ?", (path,))}
+    for gone in known_subdirs - set(subdirs):
+        _forget_dir(conn, gone)
+    conn.execute(
+        "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+        (path, os.path.dirname(path), st.st_mtime_ns),
+    )
+    for subdir in subdirs:
+        _scan_dir(conn, subdir, full, visited)
+
+
+def _forget_dir(conn, path):
+    """Drop `path` and everything under it from the index"""
+    args = (path, path + os.sep)
+    conn.execute(f"DELETE FROM files WHERE {_is_under('dir')}", args)
+    conn.execute(f"DELETE FROM dirs WHERE {_is_under('path')}", args)
+
+
+def get_videos(directory=VIDEO_WALLPAPER_DIR, recursive=True):
+    """Sorted paths of the videos in `directory`, rescanned first"""
+    directory = os.path.abspath(directory)
+    scan(directory)
+    if recursive:
+        query = f"SELECT path FROM files WHERE is_video AND {_is_under('dir')} ORDER BY path"
+        args = (directory, directory + os.sep)
+    else:
+        query = "SELECT path FROM files WHERE is_video AND dir = ? ORDER BY path"
+        args = (directory,)
+    return [path for (path,) in connect().execute(query, args)]
+
+
+def get_entry(path):
+    """Indexed {size, mtime_ns, content_type} of `path`, None if it isn't indexed"""
+    row = connect().execute(
+        "SELECT size, mtime_ns, content_type FROM files WHERE path = ?", (os.path.abspath(path),)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"size": row[0], "mtime_ns": row[1], "content_type": row[2]}
+
+
+def get_video_stats(directory=VIDEO_WALLPAPER_DIR):
+    """
+    {path: (inode, size, mtime_ns)} of the indexed videos in `directory` and its
+    subfolders, no rescan
+    """
+    directory = os.path.abspath(directory)
+    rows = connect().execute(
+        f"SELECT path, inode, size, mtime_ns FROM files WHERE is_video AND {_is_under('dir')}",
+        (directory, directory + os.sep),
+    )
+    return {path: tuple(stats) for path, *stats in rows}
+
+
+def get_dirs(directory=VIDEO_WALLPAPER_DIR):
+    """The indexed folder `directory` and its subfolders, no rescan"""
+    directory = os.path.abspath(directory)
+    rows = connect().execute(
+        f"SELECT path FROM dirs WHERE {_is_under('path')}", (directory, directory + os.sep)
+    )
+    return [path for (path,) in rows]
+
+
+class LibraryWatcher:
+    """
+    Watches `directory` and its subfolders with Gio.FileMonitor (inotify). Bursts of
+    events are debounced into one rescan of the folders they happened in, after which
+    `on_changed(removed, added, renamed)` is called on the main loop with the video paths
+    that are gone, the new ones, and {old path: new path} for the renamed ones (same
+    inode, size and mtime, so their thumbnails can be kept).
+    """
+
+    # Events that may change the set of videos. CHANGED fires continuously while a
+    # file is written, CHANGES_DONE_HINT once it's done.
+    EVENTS = (
+        Gio.FileMonitorEvent.CREATED,
+        Gio.FileMonitorEvent.DELETED,
+        Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+        Gio.FileMonitorEvent.MOVED_IN,
+        Gio.FileMonitorEvent.MOVED_OUT,
+        Gio.FileMonitorEvent.RENAMED,
+    )
+
+    def __init__(self, on_changed: callable, directory=VIDEO_WALLPAPER_DIR):
+        self.on_changed = on_changed
+        self.directory = os.path.abspath(directory)
+        self.monitors = {}  # folder -> Gio.FileMonitor
+        self._changed_dirs = set()
+        self._first_event_time = None
+        self._flush_id = None
+        self._is_closed = False
+
+        self.videos = {}
+        # The first scan may take a while, it runs on a worker thread. Watching starts
+        # once it's done.
+        threading.Thread(target=self._scan, name="hidamari-library-scan", daemon=True).start()
+
+    def _scan(self):
+        try:
+            scan(self.directory)
+            videos = get_video_stats(self.directory)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"[Library] Can't scan {self.directory}: {e}")
+            return
+        GLib.idle_add(self._start, videos)
+
+    def _start(self, videos):
+        if not self._is_closed:
+            self.videos = videos
+            self._sync_monitors()
+        return GLib.SOURCE_REMOVE
+
+    def close(self):
+        self._is_closed = True
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = None
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.monitors.clear()
+
+    def _sync_monitors(self):
+        dirs = set(get_dirs(self.directory))
+        for gone in self.monitors.keys() - dirs:
+            self.monitors.pop(gone).cancel()
+        for path in dirs - self.monitors.keys():
+            try:
+                monitor = Gio.File.new_for_path(path).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None
+                )
+            except GLib.Error as e:
+                logger.warning(f"[Library] Can't watch {path}: {e}")
+                continue
+            monitor.connect("changed", self._on_monitor_changed, path)
+            self.monitors[path] = monitor
+
+    def _on_monitor_changed(self, _monitor, file, _other_file, event_type, path):
+        if event_type not in self.EVENTS:
+            return
+        self._changed_dirs.add(path)
+        now = time.monotonic()
+        if self._first_event_time is None:
+            self._first_event_time = now
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = None
+        if (now - self._first_event_time) * 1000 >= WATCH_MAX_DELAY_MSEC:
+            self._flush()
+        else:
+            self._flush_id = GLib.timeout_add(WATCH_DEBOUNCE_MSEC, self._flush)
+
+    def _flush(self):
+        self._flush_id = None
+        self._first_event_time = None
+        changed_dirs, self._changed_dirs = self._changed_dirs, set()
+        # A rescan covers the subfolders
+        for path in sorted(changed_dirs):
+            if not any(path.startswith(other + os.sep) for other in changed_dirs):
+                scan(path, full=True)
+        self._sync_monitors()
+
+        videos = get_video_stats(self.directory)
+        removed = self.videos.keys() - videos.keys()
+        added = videos.keys() - self.videos.keys()
+        # A deleted file's inode may be reused right away, the size and mtime tell apart
+        removed_by_stats = {self.videos[path]: path for path in removed}
+        renamed = {
+            removed_by_stats[videos[path]]: path
+            for path in added
+            if videos[path] in removed_by_stats
+        }
+        removed -= renamed.keys()
+        added -= set(renamed.values())
+        self.videos = videos
+        if removed or added or renamed:
+            logger.info(
+                f"[Library] {len(added)} added, {len(removed)} removed, {len(renamed)} renamed"
+            )
+            self.on_changed(sorted(removed), sorted(added), renamed)
+        return GLib.SOURCE_REMOVE
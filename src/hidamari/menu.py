@@ -7,11 +7,10 @@ import gi
 import setproctitle
 
 gi.require_version("Gtk", "3.0")
-gi.require_version("AppIndicator3", "0.1")
-from gi.repository import AppIndicator3 as AppIndicator
 from gi.repository import GLib, Gtk
 from pydbus import SessionBus
 
+from hidamari import trace
 from hidamari.commons import DBUS_NAME_SERVER, LOGGER_NAME, MODE_VIDEO, MODE_WEBPAGE, PROJECT
 from hidamari.utils import init_translations
 
@@ -124,10 +123,15 @@ def build_menu(mode):
 
 
 def show_systray_icon(mode, localedir="/usr/share/locale"):
+    # Imported here: the players import this module for `build_menu` only
+    gi.require_version("AppIndicator3", "0.1")
+    from gi.repository import AppIndicator3 as AppIndicator
+
     setproctitle.setproctitle(mp.current_process().name)
     init_translations(localedir)
 
-    menu = build_menu(mode)
+    with trace.span("build_menu"):
+        menu = build_menu(mode)
     indicator = AppIndicator.Indicator.new(
         id=APP_INDICATOR_ID,
         icon_name=APP_INDICATOR_ICON,
@@ -136,6 +140,7 @@ def show_systray_icon(mode, localedir="/usr/share/locale"):
     indicator.set_status(AppIndicator.IndicatorStatus.ACTIVE)
     indicator.set_menu(menu)
     logger.info("[Systray] Ready")
+    trace.instant("systray ready")
     Gtk.main()
 
 
@@ -0,0 +1,211 @@
+"""
+Video metadata: width, height, duration, frame rate, codec and bitrate.
+
+Every video is probed with ffprobe once per version of the file: results are kept in
+the library database keyed by (path, size, mtime), so applying a known video doesn't
+launch any subprocess. Probes run on a small shared pool of worker threads, and
+concurrent requests for the same file share one probe.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from hidamari import library, trace
+from hidamari.commons import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+PROBE_TIMEOUT_SEC = 30
+FIELDS = ("width", "height", "duration", "fps", "codec", "bitrate")
+
+_executor = None
+_lock = threading.Lock()
+_probing = {}  # (path, size, mtime_ns) -> Future
+
+
+def get(path):
+    """
+    Metadata of `path` as a dict of FIELDS, probed if needed. Fields ffprobe didn't
+    report are None, all of them if the file can't be probed. None if there's no such
+    file or no ffprobe.
+    """
+    return get_many([path])[path]
+
+
+def get_many(paths):
+    """{path: metadata or None}, the missing ones probed in parallel"""
+    results = {}
+    futures = {}
+    for path in set(paths):
+        key = _key(path)
+        if key is None:
+            results[path] = None
+            continue
+        cached = get_cached(path, key)
+        if cached is not None:
+            results[path] = cached
+        else:
+            futures[path] = _submit(key)
+    for path, future in futures.items():
+        results[path] = future.result()
+    return results
+
+
+def get_cached(path, key=None):
+    """Metadata of `path` if it's already known, None otherwise. Never probes."""
+    key = key or _key(path)
+    if key is None:
+        return None
+    row = library.connect().execute(
+        f"SELECT {', '.join(FIELDS)} FROM metadata WHERE path = ? AND size = ? AND mtime_ns = ?",
+        key,
+    ).fetchone()
+    return dict(zip(FIELDS, row, strict=True)) if row is not None else None
+
+
+def prefetch(paths):
+    """
+    Probe the `paths` that aren't cached yet in the background, e.g. a whole library.
+    Doesn't touch the disk on the calling thread: the stats and cache lookups run on
+    the pool too.
+    """
+    paths = list(paths)
+    if paths:
+        executor = _get_executor()
+        executor.submit(_prefetch, executor, paths)
+
+
+def shutdown():
+    """Drop the pending probes, call it before quitting"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _key(path):
+    if not path:
+        # e.g. no video picked yet for a monitor
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="hidamari-probe")
+        return _executor
+
+
+def _prefetch(executor, paths):
+    for path in paths:
+        key = _key(path)
+        if key is not None and get_cached(path, key) is None:
+            try:
+                _submit(key, executor)
+            except RuntimeError:
+                # Shut down meanwhile
+                return
+
+
+def _submit(key, executor=None):
+    executor = executor or _get_executor()
+    with _lock:
+        future = _probing.get(key)
+        if future is None:
+            future = executor.submit(_probe_and_store, key)
+            _probing[key] = future
+            future.add_done_callback(lambda _future: _forget(key))
+        return future
+
+
+def _forget(key):
+    with _lock:
+        _probing.pop(key, None)
+
+
+def _probe_and_store(key):
+    path, size, mtime_ns = key
+    try:
+        info = _probe(path)
+    except FileNotFoundError:
+        # No ffprobe, nothing worth caching
+        logger.warning("[Metadata] ffprobe not found")
+        return None
+    except (subprocess.SubprocessError, OSError, ValueError) as e:
+        logger.debug(f"[Metadata] Can't probe {path}: {e}")
+        # Cached too: a file that can't be probed isn't probed again until it changes
+        info = None
+    values = [info.get(field) if info else None for field in FIELDS]
+    library.connect().execute(
+        f"""
+        INSERT OR REPLACE INTO metadata (path, size, mtime_ns, {', '.join(FIELDS)})
+        VALUES (?, ?, ?, {', '.join('?' * len(FIELDS))})
+        """,
+        (path, size, mtime_ns, *values),
+    )
+    return dict(zip(FIELDS, values, strict=True))
+
+
+def _probe(path):
+    with trace.span("ffprobe", path=path):
+        output = subprocess.check_output(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "v:0",
+                "-show_entries",
+                "stream=width,height,codec_name,avg_frame_rate,r_frame_rate,bit_rate"
+                ":format=duration,bit_rate",
+                "-of",
+                "json",
+                path,
+            ],
+            shell=False,
+            encoding="UTF-8",
+            stderr=subprocess.DEVNULL,
+            timeout=PROBE_TIMEOUT_SEC,
+        )
+    document = json.loads(output)
+    streams = document.get("streams") or []
+    if not streams:
+        raise ValueError("no video stream")
+    stream = streams[0]
+    format_ = document.get("format", {})
+    return {
+        "width": _number(stream.get("width"), int),
+        "height": _number(stream.get("height"), int),
+        "duration": _number(format_.get("duration"), float),
+        "fps": _frame_rate(stream.get("avg_frame_rate")) or _frame_rate(stream.get("r_frame_rate")),
+        "codec": stream.get("codec_name"),
+        "bitrate": _number(stream.get("bit_rate") or format_.get("bit_rate"), int),
+    }
+
+
+def _number(value, type_):
+    try:
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value):
+    """ffprobe reports frame rates as fractions, "0/0" when unknown"""
+    numerator, _, denominator = (value or "").partition("/")
+    try:
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
@@ -3,6 +3,8 @@ import gi
 gi.require_version("Gdk", "3.0")
 from gi.repository import Gdk
 
+from hidamari import trace
+
 
 class Monitor:
     def __init__(self, name, width=0, height=0, x=0, y=0, is_primary=False, wallpaper=None):
@@ -21,13 +23,42 @@ class Monitor:
         return f"Monitor(name={self.name}, x={self.x}, y={self.y}, width={self.width}, height={self.height}, is_primary={self.is_primary}, wallpaper={self.wallpaper})"
 
 
+# Monitor names of the default display, dropped on hotplug. See MonitorInfo.names().
+_names = None
+_is_watching = False
+
+
+def _on_monitors_changed(*_):
+    global _names
+    _names = None
+
+
 class MonitorInfo:
+    @staticmethod
+    def names():
+        """
+        Names of the connected monitors, enumerated once and again after a hotplug (which
+        is only noticed by processes running a main loop)
+        """
+        global _names, _is_watching
+        if _names is None:
+            display = Gdk.Display.get_default()
+            if not _is_watching:
+                display.connect("monitor-added", _on_monitors_changed)
+                display.connect("monitor-removed", _on_monitors_changed)
+                _is_watching = True
+            _names = tuple(
+                display.get_monitor(i).get_model() for i in range(display.get_n_monitors())
+            )
+        return _names
+
     @staticmethod
     def get_unique_monitor_count():
         display = Gdk.Display.get_default()
         return display.get_n_monitors()
 
     @staticmethod
+    @trace.traced("MonitorInfo.monitors")
     def monitors():
         display = Gdk.Display.get_default()
         n_monitors = display.get_n_monitors()
@@ -58,6 +89,7 @@ class MonitorInfo:
 
 
 class Monitors:
+    @trace.traced("Monitors()")
     def __init__(self):
         self.monitors = {}
         for monitor in MonitorInfo.monitors():
@@ -0,0 +1,147 @@
+"""
+Persistence of the files in CONFIG_DIR, shared by every process.
+
+- Writes are atomic: a temporary file in the same directory is written, fsync'ed and
+  renamed over the target, so a concurrent reader sees either the old or the new file,
+  never a torn one.
+- `locked()` serializes read-modify-write sequences across processes with an advisory
+  lock on CONFIG_DIR/.lock (and across threads with a process-wide RLock).
+- `save_later()` is a write-behind queue: a burst of saves to the same file collapses
+  into the last one, written by a background thread. `flush()` writes everything
+  pending right away; it runs at exit, but multiprocessing children don't run atexit
+  handlers, so they have to call it when quitting.
+"""
+
+import atexit
+import contextlib
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from hidamari.commons import CONFIG_DIR, LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+LOCK_PATH = os.path.join(CONFIG_DIR, ".lock")
+WRITE_BEHIND_DELAY_SEC = 1
+
+# Held by any thread that owns the cross-process lock, and by ConfigUtil's cache
+process_lock = threading.RLock()
+_lock_fd = None
+_lock_depth = 0
+
+
+@contextlib.contextmanager
+def locked():
+    """Cross-process advisory lock of CONFIG_DIR, reentrant within the process"""
+    global _lock_fd, _lock_depth
+    with process_lock:
+        if _lock_depth == 0:
+            os.makedirs(CONFIG_DIR, exist_ok=True)
+            _lock_fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+            fcntl.flock(_lock_fd, fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                fcntl.flock(_lock_fd, fcntl.LOCK_UN)
+                os.close(_lock_fd)
+                _lock_fd = None
+
+
+def atomic_write(path, text):
+    """Replace `path` with `text` through a temporary file, fsync and rename"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+class WriteBehind:
+    def __init__(self):
+        self._pending = {}  # key -> (due time, write callable, generation)
+        # Bumped by every synchronous write of a key, which supersedes older pending ones
+        self._generations = {}
+        self._cond = threading.Condition()
+        # Held while writing, so an older write never lands after a newer one
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, key, write: callable, delay_sec=WRITE_BEHIND_DELAY_SEC):
+        """Run `write` after `delay_sec`, replacing whatever is pending for `key`"""
+        with self._cond:
+            generation = self._generations.get(key, 0)
+            self._pending[key] = (time.monotonic() + delay_sec, write, generation)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="hidamari-write-behind", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, key):
+        """
+        Drop the pending write of `key`, including one that is about to run. Call it with
+        `process_lock` held, right before writing `key` synchronously.
+        """
+        with self._cond:
+            self._pending.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def flush(self):
+        """Run all pending writes now"""
+        with self._write_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            for key, (_due, write, generation) in pending.items():
+                self._write(key, write, generation)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [due for due, _write, _generation in self._pending.values()]
+                    if due and min(due) <= now:
+                        break
+                    self._cond.wait(min(due) - now if due else None)
+            with self._write_lock:
+                with self._cond:
+                    now = time.monotonic()
+                    ready = [key for key, (due, *_) in self._pending.items() if due <= now]
+                    writes = [(key, *self._pending.pop(key)[1:]) for key in ready]
+                for key, write, generation in writes:
+                    self._write(key, write, generation)
+
+    def _write(self, key, write, generation):
+        # Checked under process_lock: a synchronous write either already superseded this
+        # one, or waits for it to finish
+        with process_lock:
+            with self._cond:
+                if self._generations.get(key, 0) != generation:
+                    return
+            try:
+                write()
+            except Exception as e:
+                logger.error(f"[Persistence] Write of {key} failed: {e}")
+
+
+_write_behind = WriteBehind()
+save_later = _write_behind.schedule
+discard = _write_behind.discard
+flush = _write_behind.flush
+atexit.register(flush)
@@ -8,15 +8,26 @@ import setproctitle
 
 gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
-from gi.repository import Gdk, Gio, Gtk
+from gi.repository import Gdk, Gio, GLib, Gtk
 from pydbus import SessionBus
-
-from hidamari.commons import DBUS_NAME_PLAYER, LOGGER_NAME, PROJECT
+from pydbus.generic import signal
+
+from hidamari import trace
+from hidamari.commons import (
+    DBUS_INTERFACE_PLAYER,
+    DBUS_INTERFACE_SERVER,
+    DBUS_NAME_PLAYER,
+    DBUS_NAME_SERVER,
+    LOGGER_NAME,
+    PROJECT,
+)
 from hidamari.utils import gnome_desktop_icon_workaround
 
 logger = logging.getLogger(LOGGER_NAME)
 
 APP_ID = f"{PROJECT}.player"
+# Emitted from the main loop, so the server's supervisor notices when it stalls
+HEARTBEAT_INTERVAL_SEC = 5
 
 
 class DummyWindow(Gtk.ApplicationWindow):
@@ -29,23 +40,39 @@ class BasePlayer(Gtk.Application):
     <node>
     <interface name='io.github.jeffshee.hidamari.player'>
         <property name="mode" type="s" access="read"/>
-        <property name="data_source" type="s" access="readwrite"/>
+        <property name="data_source" type="s" access="write"/>
         <property name="volume" type="i" access="readwrite"/>
         <property name="is_mute" type="b" access="readwrite"/>
         <property name="is_playing" type="b" access="read"/>
         <method name='pause_playback'/>
         <method name='start_playback'/>
         <method name='quit_player'/>
+        <method name='end_session'/>
+        <method name='seek'>
+            <arg type='d' name='position' direction='in'/>
+        </method>
+        <signal name='Heartbeat'>
+            <arg type='d' name='position'/>
+        </signal>
     </interface>
     </node>
     """
 
+    # Hooked up by pydbus on publish, mirrored by the server's PlayerProxy
+    PropertiesChanged = signal()
+    Heartbeat = signal()
+    # Announced on startup, so the server has them even before its GetAll returns.
+    # data_source is write-only: the video player's is a per-monitor dict, not an "s".
+    MIRRORED_PROPERTIES = ("mode", "volume", "is_mute", "is_playing")
+
+    @trace.traced("BasePlayer.__init__")
     def __init__(self, *args, **kwargs):
         super().__init__(
             *args, application_id=APP_ID, flags=Gio.ApplicationFlags.FLAGS_NONE, **kwargs
         )
         setproctitle.setproctitle(mp.current_process().name)
         self.windows = dict()
+        self.is_ending_session = False
         self._monitor_detect()
 
     def _monitor_detect(self):
@@ -61,6 +88,10 @@ class BasePlayer(Gtk.Application):
         display.connect("monitor-added", self._on_monitor_added)
         display.connect("monitor-removed", self._on_monitor_removed)
 
+    def notify_properties(self, *names):
+        """Emit PropertiesChanged with the current values of the given properties"""
+        self.PropertiesChanged(DBUS_INTERFACE_PLAYER, {name: getattr(self, name) for name in names}, [])
+
     def new_window(self, gdk_monitor):
         # Override here for different window
         # NOTE: Don't forget to set the application=self, otherwise the application will quit immediately lol
@@ -85,6 +116,30 @@ class BasePlayer(Gtk.Application):
 
     def do_startup(self):
         Gtk.Application.do_startup(self)
+        self.notify_properties(*self.MIRRORED_PROPERTIES)
+        GLib.timeout_add_seconds(HEARTBEAT_INTERVAL_SEC, self._on_heartbeat)
+        # The server pushes settings changes instead of having us re-read the config
+        SessionBus().subscribe(
+            sender=DBUS_NAME_SERVER,
+            iface=DBUS_INTERFACE_SERVER,
+            signal="ConfigChanged",
+            signal_fired=self._on_config_changed,
+        )
+
+    def _on_config_changed(self, sender, object, iface, signal, params):
+        self.apply_settings(params[0])
+
+    def _on_heartbeat(self):
+        self.Heartbeat(self.get_position())
+        return GLib.SOURCE_CONTINUE
+
+    def get_position(self):
+        """Playback position (0.0 - 1.0) reported with the heartbeats, -1.0 if unknown"""
+        return -1.0
+
+    def seek(self, position):
+        """Resume playback at `position` (0.0 - 1.0), e.g. after a crash"""
+        pass
 
     def do_activate(self):
         for monitor in self.windows:
@@ -137,6 +192,11 @@ class BasePlayer(Gtk.Application):
     def is_playing(self):
         pass
 
+    @abstractmethod
+    def apply_settings(self, settings):
+        """Apply a batch of settings (see SETTINGS_KEYS), touching only what changed"""
+        pass
+
     @abstractmethod
     def pause_playback(self):
         pass
@@ -148,6 +208,11 @@ class BasePlayer(Gtk.Application):
     def quit_player(self):
         self.quit()
 
+    def end_session(self):
+        """Quit for logout/shutdown: there's no time for fades"""
+        self.is_ending_session = True
+        self.quit_player()
+
 
 def main():
     bus = SessionBus()
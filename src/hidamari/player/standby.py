@@ -0,0 +1,224 @@
+"""
+Warm standby player processes.
+
+A standby player is spawned ahead of time and pays for the fresh interpreter, the
+GTK/VLC/WebKit imports and the process-wide setup (`prepare()`) up front. It then
+blocks on a pipe, unpublished, until the server activates it: only then does it
+create the player application from the state snapshot sent along, publish DBUS_NAME_PLAYER
+and open its windows. A standby must never touch the session bus before activation.
+"""
+
+import logging
+import multiprocessing as mp
+
+import setproctitle
+from gi.repository import Gio, GLib
+
+from hidamari import trace
+from hidamari.commons import LOGGER_NAME, PLAYER_KIND_VIDEO, PLAYER_KIND_WEB
+from hidamari.teardown import Teardown
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Give the freshly activated player a head start before spawning its replacement
+STANDBY_REFILL_DELAY_SEC = 10
+# After a low-memory warning, keep the pool empty for this long
+STANDBY_SUSPEND_SEC = 300
+STANDBY_CHECK_INTERVAL_SEC = 30
+# A standby whose RSS grows past this is dropped and not refilled
+STANDBY_MAX_RSS_KB = 256 * 1024
+# A dropped standby only has to return from `conn.recv()`
+STANDBY_STOP_DEADLINE_SEC = 2
+
+
+def standby_main(kind, conn):
+    """Entry point of a standby process"""
+    setproctitle.setproctitle(mp.current_process().name)
+    trace.process_started()
+    with trace.span("import"):
+        if kind == PLAYER_KIND_VIDEO:
+            from hidamari.player import video_player as player
+        elif kind == PLAYER_KIND_WEB:
+            from hidamari.player import web_player as player
+        else:
+            raise ValueError(f"[Standby] Unknown player kind {kind}")
+    with trace.span("prepare"):
+        player.prepare()
+
+    try:
+        activation = conn.recv()
+    except (EOFError, OSError):
+        # The server went away or dropped us
+        return
+    conn.close()
+    if activation is None:
+        return
+    name, snapshot = activation
+    mp.current_process().name = name
+    trace.instant("standby activated", name=name)
+    player.main(snapshot)
+
+
+def _read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class StandbyPool:
+    """
+    Keeps at most one pre-initialized standby process per player kind, except for the
+    kind of the running player: switching to another source of the same kind is a
+    hot-swap and needs no new process. Everything runs on the server's GLib main loop;
+    taking a standby never blocks on its startup.
+    """
+
+    def __init__(self, kinds=(PLAYER_KIND_VIDEO, PLAYER_KIND_WEB)):
+        self.kinds = kinds
+        self.active_kind = None
+        self.standbys = {}  # kind -> (process, conn)
+        self._refill_ids = {}
+        self._oversized_kinds = set()
+        self._suspended_until = 0
+        self._count = 0
+
+        self.memory_monitor = None
+        try:
+            # GLib >= 2.64
+            self.memory_monitor = Gio.MemoryMonitor.dup_default()
+            self.memory_monitor.connect("low-memory-warning", self._on_low_memory_warning)
+        except (AttributeError, GLib.Error) as e:
+            logger.debug(f"[Standby] Memory monitor unavailable: {e}")
+        self._check_id = GLib.timeout_add_seconds(STANDBY_CHECK_INTERVAL_SEC, self._on_check)
+
+    def fill(self, delay_sec=STANDBY_REFILL_DELAY_SEC):
+        """Schedule a standby for every inactive kind that doesn't have one"""
+        for kind in self.kinds:
+            self._schedule_refill(kind, delay_sec)
+
+    def set_active(self, kind):
+        """A player of `kind` (None: no player) is running now"""
+        self.active_kind = kind
+        if kind is not None:
+            source_id = self._refill_ids.pop(kind, None)
+            if source_id is not None:
+                GLib.source_remove(source_id)
+            self.drop(kind)
+        self.fill()
+
+    def take(self, kind, name, snapshot=None):
+        """
+        Activate the standby of `kind` as the player process `name`, starting from the
+        state `snapshot`. Returns the running process, or None if there's no usable
+        standby (the caller spawns one the slow way).
+        """
+        entry = self.standbys.pop(kind, None)
+        if entry is None:
+            return None
+        process, conn = entry
+        try:
+            if not process.is_alive():
+                raise BrokenPipeError
+            conn.send((name, snapshot))
+        except (BrokenPipeError, OSError):
+            logger.warning(f"[Standby] {process.name} is gone, spawning a new player instead")
+            teardown = Teardown(STANDBY_STOP_DEADLINE_SEC)
+            self._stop(process, conn, teardown)
+            teardown.wait()
+            return None
+        conn.close()
+        logger.info(f"[Standby] Activated {process.name} as {name}")
+        process.name = name
+        return process
+
+    def drop(self, kind=None, teardown=None):
+        """
+        Stop the standby of `kind`, or all of them. With a `teardown`, they are only
+        signalled and the caller waits for them together with its other processes.
+        """
+        own_teardown = teardown is None
+        if own_teardown:
+            teardown = Teardown(STANDBY_STOP_DEADLINE_SEC)
+        for k in [kind] if kind is not None else list(self.standbys):
+            entry = self.standbys.pop(k, None)
+            if entry is not None:
+                logger.info(f"[Standby] Dropping {entry[0].name}")
+                self._stop(*entry, teardown)
+        if own_teardown:
+            teardown.wait()
+
+    def close(self, teardown=None):
+        for source_id in self._refill_ids.values():
+            GLib.source_remove(source_id)
+        self._refill_ids.clear()
+        if self._check_id is not None:
+            GLib.source_remove(self._check_id)
+            self._check_id = None
+        self.drop(teardown=teardown)
+
+    def _schedule_refill(self, kind, delay_sec):
+        if (
+            kind == self.active_kind
+            or kind in self.standbys
+            or kind in self._refill_ids
+            or kind in self._oversized_kinds
+        ):
+            return
+        self._refill_ids[kind] = GLib.timeout_add_seconds(delay_sec, self._on_refill, kind)
+
+    def _on_refill(self, kind):
+        del self._refill_ids[kind]
+        if GLib.get_monotonic_time() < self._suspended_until:
+            self._schedule_refill(kind, STANDBY_CHECK_INTERVAL_SEC)
+        elif kind not in self.standbys:
+            self._spawn(kind)
+        return GLib.SOURCE_REMOVE
+
+    def _spawn(self, kind):
+        recv_conn, send_conn = mp.Pipe(duplex=False)
+        process = mp.Process(
+            name=f"hidamari-player-standby-{kind}-{self._count}",
+            target=standby_main,
+            args=(kind, recv_conn),
+        )
+        with trace.span("spawn", name=process.name):
+            process.start()
+        recv_conn.close()
+        self._count += 1
+        self.standbys[kind] = (process, send_conn)
+        logger.info(f"[Standby] Spawned {process.name}")
+
+    @staticmethod
+    def _stop(process, conn, teardown):
+        try:
+            # The standby acknowledges by returning from `conn.recv()` and exiting
+            conn.send(None)
+        except (BrokenPipeError, OSError):
+            teardown.terminate(process)
+        else:
+            teardown.expect(process)
+        conn.close()
+
+    def _on_low_memory_warning(self, monitor, level):
+        logger.warning(f"[Standby] Low memory warning ({level}), dropping standby players")
+        self._suspended_until = GLib.get_monotonic_time() + STANDBY_SUSPEND_SEC * 1_000_000
+        self.drop()
+        self.fill(STANDBY_SUSPEND_SEC)
+
+    def _on_check(self):
+        for kind, (process, _conn) in list(self.standbys.items()):
+            if not process.is_alive():
+                logger.warning(f"[Standby] {process.name} exited unexpectedly")
+                self.standbys.pop(kind)
+                self._schedule_refill(kind, STANDBY_REFILL_DELAY_SEC)
+            elif _read_rss_kb(process.pid) > STANDBY_MAX_RSS_KB:
+                logger.warning(f"[Standby] {process.name} exceeds the memory bound, not refilling")
+                self._oversized_kinds.add(kind)
+                self.drop(kind)
+        return GLib.SOURCE_CONTINUE
+
@@ -1,5 +1,6 @@
 import ctypes
 import glob
+import json
 import logging
 import os
 import pathlib
@@ -15,12 +16,13 @@ gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
 import vlc
 from gi.repository import Gdk, Gio, Gtk
-from PIL import Image, ImageFilter
 from pydbus import SessionBus
 
+from hidamari import metadata, trace
 from hidamari.commons import (
     CONFIG_DIR,
     CONFIG_KEY_ACTIVE_PLAYLIST,
+    CONFIG_KEY_BLUR_RADIUS,
     CONFIG_KEY_DATA_SOURCE,
     CONFIG_KEY_FADE_DURATION_SEC,
     CONFIG_KEY_FADE_INTERVAL,
@@ -52,7 +54,6 @@ from hidamari.utils import (
     is_gnome,
     is_wayland,
 )
-from hidamari.yt_utils import get_best_audio, get_formats, get_optimal_video
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -65,6 +66,36 @@ else:
     from hidamari.utils import WindowHandler
 
 
+_is_x11_threads_initialized = False
+
+
+def init_x11_threads():
+    """
+    XInitThreads() must run before the process's first X11 connection, or Xlib's
+    internal state is never made thread-safe and concurrent Xlib/xcb calls (GTK's
+    main thread alongside libVLC's decode/output threads) corrupt the connection,
+    crashing with `Assertion '!xcb_xlib_threads_sequence_lost' failed`.
+    """
+    global _is_x11_threads_initialized
+    if _is_x11_threads_initialized:
+        return
+    x11 = None
+    for lib in ["libX11.so", "libX11.so.6"]:
+        try:
+            x11 = ctypes.cdll.LoadLibrary(lib)
+        except OSError:
+            pass
+        if x11 is not None:
+            x11.XInitThreads()
+            break
+    _is_x11_threads_initialized = True
+
+
+def prepare():
+    """Process-wide setup that doesn't depend on the config (used by the standby player)"""
+    init_x11_threads()
+
+
 class Fade:
     def __init__(self):
         self.timer = None
@@ -133,7 +164,8 @@ class VLCWidget(Gtk.DrawingArea):
         #   plugin segfaults (pw_thread_loop_lock) when multiple instances are
         #   active, e.g. one per monitor. See the Flatpak, which uses Pulse too.
         vlc_options = ["--no-disable-screensaver", "--aout=pulse"]
-        self.instance = vlc.Instance(vlc_options)
+        with trace.span("vlc.Instance"):
+            self.instance = vlc.Instance(vlc_options)
         
         # normal player
         self.player = self.instance.media_player_new()
@@ -186,11 +218,15 @@ class PlayerWindow(Gtk.ApplicationWindow):
 
         # A timer that handling fade-in/out
         self.fade = Fade()
+        self.is_played = False
 
         self.menu = None
         self.connect("button-press-event", self._on_button_press_event)
 
     def play(self):
+        if not self.is_played:
+            self.is_played = True
+            trace.instant("first play()", monitor=self.name)
         if self.mode == MODE_PLAYLIST:
             self.__vlc_widget.list_player.play()
         else:
@@ -209,6 +245,11 @@ class PlayerWindow(Gtk.ApplicationWindow):
             update_callback=self.set_volume,
         )
 
+    def stop(self):
+        self.fade.cancel()
+        self.__vlc_widget.list_player.stop()
+        self.__vlc_widget.player.stop()
+
     def is_playing(self):
         if self.mode == MODE_PLAYLIST:
             return self.__vlc_widget.list_player.is_playing()
@@ -352,42 +393,50 @@ class VideoPlayer(BasePlayer):
     <node>
     <interface name='io.github.jeffshee.hidamari.player'>
         <property name="mode" type="s" access="read"/>
-        <property name="data_source" type="s" access="readwrite"/>
+        <property name="data_source" type="s" access="write"/>
         <property name="volume" type="i" access="readwrite"/>
         <property name="is_mute" type="b" access="readwrite"/>
         <property name="is_playing" type="b" access="read"/>
         <property name="is_paused_by_user" type="b" access="readwrite"/>
-        <method name='reload_config'/>
+        <method name='hot_swap'>
+            <arg type='s' name='config' direction='in'/>
+        </method>
+        <method name='apply_settings'>
+            <arg type='a{sv}' name='settings' direction='in'/>
+        </method>
         <method name='pause_playback'/>
         <method name='start_playback'/>
         <method name='quit_player'/>
+        <method name='end_session'/>
+        <method name='seek'>
+            <arg type='d' name='position' direction='in'/>
+        </method>
+        <signal name='Heartbeat'>
+            <arg type='d' name='position'/>
+        </signal>
     </interface>
     </node>
     """
 
-    def __init__(self, *args, **kwargs):
-        # XInitThreads() must run before the process's first X11 connection, or Xlib's
-        # internal state is never made thread-safe and concurrent Xlib/xcb calls (GTK's
-        # main thread alongside libVLC's decode/output threads) corrupt the connection,
-        # crashing with `Assertion '!xcb_xlib_threads_sequence_lost' failed`. super().__init__()
-        # below (BasePlayer -> Gdk.Display.get_default()) opens that connection, so this
-        # has to happen first.
-        x11 = None
-        for lib in ["libX11.so", "libX11.so.6"]:
-            try:
-                x11 = ctypes.cdll.LoadLibrary(lib)
-            except OSError:
-                pass
-            if x11 is not None:
-                x11.XInitThreads()
-                break
+    MIRRORED_PROPERTIES = (*BasePlayer.MIRRORED_PROPERTIES, "is_paused_by_user")
+
+    def __init__(self, *args, snapshot=None, **kwargs):
+        # super().__init__() below (BasePlayer -> Gdk.Display.get_default()) opens the X11
+        # connection, so this has to happen first. See init_x11_threads().
+        init_x11_threads()
 
         super(VideoPlayer, self).__init__(*args, **kwargs)
 
         self.config = None
         self.playlist = None
-        self.reload_config()
-        self.reload_playlist()
+        # The playlist is re-read on the next switch to playlist mode, unless fresh
+        self._is_playlist_stale = True
+        if snapshot is not None:
+            self.config = snapshot["config"]
+            self.playlist = snapshot["playlist"]
+            self._is_playlist_stale = self.playlist is None
+        else:
+            self.reload_config()
 
         # Static wallpaper (currently for GNOME only)
         if is_gnome():
@@ -415,8 +464,9 @@ class VideoPlayer(BasePlayer):
         # Handler should be created after everything initialized
         self.active_handler, self.window_handler = None, None
         self.is_any_maximized, self.is_any_fullscreen = False, False
-        self.is_paused_by_user = False
+        self._is_paused_by_user = False
 
+    @trace.traced("VideoPlayer.new_window")
     def new_window(self, gdk_monitor):
         rect = gdk_monitor.get_geometry()
         return PlayerWindow(gdk_monitor.get_model(), rect.width, rect.height, application=self)
@@ -446,6 +496,8 @@ class VideoPlayer(BasePlayer):
         logger.info(
             f"is_any_maximized: {self.is_any_maximized}, is_any_fullscreen: {self.is_any_fullscreen}"
         )
+        if self.is_ending_session:
+            return
 
         if self.config[CONFIG_KEY_PAUSE_WHEN_MAXIMIZED]:
             if self._should_playback_start():
@@ -470,6 +522,8 @@ class VideoPlayer(BasePlayer):
                     )
 
     def _should_playback_start(self):
+        if self.is_ending_session:
+            return False
         if self.config[CONFIG_KEY_PAUSE_WHEN_MAXIMIZED] and (
             self.is_any_maximized or self.is_any_fullscreen
         ):
@@ -488,43 +542,30 @@ class VideoPlayer(BasePlayer):
 
     @data_source.setter
     def data_source(self, data_source):
+        if isinstance(data_source, str):
+            # Set over D-Bus (hot-swap): a single source replaces the Default one,
+            # the per-monitor sources are kept as configured
+            data_source = {**self.config[CONFIG_KEY_DATA_SOURCE], "Default": data_source}
         self.config[CONFIG_KEY_DATA_SOURCE] = data_source
-        
-        # update mode for window
+
+        # update mode for window, stopping whatever the window was playing before
         for window in self.windows.values():
-            window.mode = self.mode
+            if window:
+                window.stop()
+                window.mode = self.mode
 
         if self.mode == MODE_VIDEO:
-            # Get the dimension of the video
+            # Get the dimension of the videos, each distinct one probed once (and only if
+            # it isn't cached yet). None lets centercrop() ask libvlc instead.
+            videos = {
+                monitor: video or data_source["Default"] for monitor, video in data_source.items()
+            }
+            infos = metadata.get_many(video for video in videos.values() if video)
             video_width, video_height = {}, {}
-            try:
-                for monitor, video in data_source.items():
-                    # fallback to Default video
-                    if len(video) == 0:
-                        video = data_source["Default"]
-                    dimension = subprocess.check_output(
-                        [
-                            "ffprobe",
-                            "-v",
-                            "error",
-                            "-select_streams",
-                            "v:0",
-                            "-show_entries",
-                            "stream=width,height",
-                            "-of",
-                            "csv=s=x:p=0",
-                            video,
-                        ],
-                        shell=False,
-                        encoding="UTF-8",
-                    ).replace("\n", "")
-                    dimension = dimension.split("x")
-                    video_width[monitor] = int(dimension[0])
-                    video_height[monitor] = int(dimension[1])
-            except subprocess.CalledProcessError:
-                for monitor, _video in data_source.items():
-                    video_width.setdefault(monitor, None)
-                    video_height.setdefault(monitor, None)
+            for monitor, video in videos.items():
+                info = infos.get(video) or {}
+                video_width[monitor] = info.get("width")
+                video_height[monitor] = info.get("height")
 
             for monitor, window in self.windows.items():
                 source = (
@@ -556,7 +597,9 @@ class VideoPlayer(BasePlayer):
                         video_width[monitor.get_model()], video_height[monitor.get_model()]
                     )
         elif self.mode == MODE_PLAYLIST:
-            self.reload_playlist()
+            if self._is_playlist_stale:
+                self.reload_playlist()
+            self._is_playlist_stale = True
             playlist_name = self.config[CONFIG_KEY_ACTIVE_PLAYLIST]
             playlist_data = self.playlist["playlists"].get(playlist_name, {})
             distribution_mode = playlist_data.get(PLAYLIST_KEY_MODE, PLAYLIST_MODE_PER_MONITOR)
@@ -606,6 +649,9 @@ class VideoPlayer(BasePlayer):
                         window.mode = MODE_NULL
 
         elif self.mode == MODE_STREAM:
+            # Imported here: yt_dlp is heavy and only needed for streaming
+            from hidamari.yt_utils import get_best_audio, get_formats, get_optimal_video
+
             source = data_source["Default"]
             formats = get_formats(source)
             max_height = (
@@ -643,6 +689,7 @@ class VideoPlayer(BasePlayer):
             self.set_static_wallpaper()
         else:
             self.set_original_wallpaper()
+        self.notify_properties("mode")
 
     @property
     def volume(self):
@@ -654,6 +701,7 @@ class VideoPlayer(BasePlayer):
         for monitor in self.windows:
             if monitor.is_primary():
                 self.windows[monitor].set_volume(volume)
+        self.notify_properties("volume")
 
     @property
     def is_mute(self):
@@ -665,13 +713,38 @@ class VideoPlayer(BasePlayer):
         for monitor, window in self.windows.items():
             if monitor.is_primary():
                 window.set_mute(is_mute)
+        self.notify_properties("is_mute")
 
     @property
     def is_playing(self):
         return not self.is_paused_by_user
 
+    @property
+    def is_paused_by_user(self):
+        return self._is_paused_by_user
+
+    @is_paused_by_user.setter
+    def is_paused_by_user(self, is_paused_by_user):
+        self._is_paused_by_user = is_paused_by_user
+        self.notify_properties("is_paused_by_user", "is_playing")
+
+    def get_position(self):
+        for monitor, window in self.windows.items():
+            if monitor.is_primary() and window:
+                return float(window.get_position())
+        return -1.0
+
+    def seek(self, position):
+        logger.info(f"[Player] Seek to {position:.3f}")
+        for _monitor, window in self.windows.items():
+            if window:
+                window.set_position(position)
+
     def pause_playback(self):
         for _monitor, window in self.windows.items():
+            if self.is_ending_session:
+                window.pause()
+                continue
             window.pause_fade(
                 fade_duration_sec=self.config[CONFIG_KEY_FADE_DURATION_SEC],
                 fade_interval=self.config[CONFIG_KEY_FADE_INTERVAL],
@@ -716,24 +789,8 @@ class VideoPlayer(BasePlayer):
         if not is_gnome():
             return
         # Get the duration of the video
-        try:
-            duration = float(
-                subprocess.check_output(
-                    [
-                        "ffprobe",
-                        "-v",
-                        "error",
-                        "-show_entries",
-                        "format=duration",
-                        "-of",
-                        "default=noprint_wrappers=1:nokey=1",
-                        self.data_source["Default"],
-                    ],
-                    shell=False,
-                )
-            )
-        except subprocess.CalledProcessError:
-            duration = 0
+        info = metadata.get(self.data_source["Default"]) or {}
+        duration = info.get("duration") or 0
         # Find the golden ratio
         ss = time.strftime("%H:%M:%S", time.gmtime(duration / 3.14))
         # Extract the frame
@@ -757,6 +814,8 @@ class VideoPlayer(BasePlayer):
             stderr=subprocess.STDOUT,
         )
         if ret.returncode == 0 and os.path.isfile(static_wallpaper_path):
+            from PIL import Image, ImageFilter
+
             blur_wallpaper = Image.open(static_wallpaper_path)
             blur_wallpaper = blur_wallpaper.filter(
                 ImageFilter.GaussianBlur(self.config["static_wallpaper_blur_radius"])
@@ -840,6 +899,40 @@ class VideoPlayer(BasePlayer):
 
     def reload_config(self):
         self.config = ConfigUtil().load()
+
+    def hot_swap(self, config):
+        """Take over the server's config (as JSON) and switch to its source in place"""
+        self.config = json.loads(config)
+        self.data_source = self.config[CONFIG_KEY_DATA_SOURCE]
+
+    def apply_settings(self, settings):
+        changed = {
+            key: value
+            for key, value in settings.items()
+            if key in self.config and self.config[key] != value
+        }
+        if not changed:
+            return
+        logger.info(f"[Player] Settings changed: {changed}")
+        self.config.update(changed)
+
+        if CONFIG_KEY_VOLUME in changed:
+            self.volume = changed[CONFIG_KEY_VOLUME]
+        if CONFIG_KEY_MUTE in changed:
+            self.is_mute = changed[CONFIG_KEY_MUTE]
+        if CONFIG_KEY_STATIC_WALLPAPER in changed or CONFIG_KEY_BLUR_RADIUS in changed:
+            if self.config[CONFIG_KEY_STATIC_WALLPAPER] and self.mode == MODE_VIDEO:
+                self.set_static_wallpaper()
+            else:
+                self.set_original_wallpaper()
+        if CONFIG_KEY_PAUSE_WHEN_MAXIMIZED in changed or CONFIG_KEY_MUTE_WHEN_MAXIMIZED in changed:
+            self._on_window_state_changed(
+                {
+                    "is_any_maximized": self.is_any_maximized,
+                    "is_any_fullscreen": self.is_any_fullscreen,
+                }
+            )
+        # The fade settings are read on use
         
     def reload_playlist(self):
         self.playlist = PlaylistUtil().load()
@@ -864,9 +957,14 @@ class VideoPlayer(BasePlayer):
         super().quit_player()
 
 
-def main():
+def main(snapshot=None):
+    """
+    :param snapshot: Initial state handed over by the server, see
+        HidamariServer._player_snapshot(). Without it, the state is loaded from disk.
+    """
     bus = SessionBus()
-    app = VideoPlayer()
+    with trace.span("VideoPlayer()"):
+        app = VideoPlayer(snapshot=snapshot)
     try:
         bus.publish(DBUS_NAME_PLAYER, app)
     except RuntimeError as e:
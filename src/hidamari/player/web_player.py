@@ -1,4 +1,5 @@
 import glob
+import json
 import logging
 import os
 import pathlib
@@ -12,6 +13,7 @@ gi.require_version("WebKit2", "4.1")
 from gi.repository import Gdk, Gtk, WebKit2
 from pydbus import SessionBus
 
+from hidamari import trace
 from hidamari.commons import (
     CONFIG_KEY_DATA_SOURCE,
     CONFIG_KEY_MODE,
@@ -58,6 +60,11 @@ def setup_render_device():
     os.environ["WEBKIT_DMABUF_RENDERER_FORCE_SHM"] = "1"
 
 
+def prepare():
+    """Process-wide setup that doesn't depend on the config (used by the standby player)"""
+    setup_render_device()
+
+
 class WebWindow(Gtk.ApplicationWindow):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -91,22 +98,37 @@ class WebPlayer(BasePlayer):
     <node>
     <interface name='io.github.jeffshee.hidamari.player'>
         <property name="mode" type="s" access="read"/>
-        <property name="data_source" type="s" access="readwrite"/>
+        <property name="data_source" type="s" access="write"/>
         <property name="volume" type="i" access="readwrite"/>
         <property name="is_mute" type="b" access="readwrite"/>
         <property name="is_playing" type="b" access="read"/>
-        <method name='reload_config'/>
+        <method name='hot_swap'>
+            <arg type='s' name='config' direction='in'/>
+        </method>
+        <method name='apply_settings'>
+            <arg type='a{sv}' name='settings' direction='in'/>
+        </method>
         <method name='pause_playback'/>
         <method name='start_playback'/>
         <method name='quit_player'/>
+        <method name='end_session'/>
+        <method name='seek'>
+            <arg type='d' name='position' direction='in'/>
+        </method>
+        <signal name='Heartbeat'>
+            <arg type='d' name='position'/>
+        </signal>
     </interface>
     </node>
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, snapshot=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.config = None
-        self.reload_config()
+        if snapshot is not None:
+            self.config = snapshot["config"]
+        else:
+            self.reload_config()
 
     def new_window(self, gdk_monitor):
         return WebWindow(application=self)
@@ -137,12 +159,14 @@ class WebPlayer(BasePlayer):
         ):
             data_source = pathlib.Path(data_source).resolve().as_uri()
 
+        trace.instant("load_uri()", uri=data_source)
         for monitor, window in self.windows.items():
             window.load_uri(data_source)
             if not monitor.is_primary():
                 window.set_is_mute(True)
         self.volume = self.config[CONFIG_KEY_VOLUME]
         self.is_mute = self.config[CONFIG_KEY_MUTE]
+        self.notify_properties("mode")
 
     @property
     def volume(self):
@@ -152,6 +176,7 @@ class WebPlayer(BasePlayer):
     def volume(self, volume):
         # TODO: How to set volume of webview?
         self.config[CONFIG_KEY_VOLUME] = volume
+        self.notify_properties("volume")
 
     @property
     def is_mute(self):
@@ -163,6 +188,7 @@ class WebPlayer(BasePlayer):
         for monitor, window in self.windows.items():
             if monitor.is_primary():
                 window.set_is_mute(is_mute)
+        self.notify_properties("is_mute")
 
     @property
     def is_playing(self):
@@ -177,11 +203,37 @@ class WebPlayer(BasePlayer):
     def reload_config(self):
         self.config = ConfigUtil().load()
 
+    def hot_swap(self, config):
+        """Take over the server's config (as JSON) and switch to its source in place"""
+        self.config = json.loads(config)
+        self.data_source = self.config[CONFIG_KEY_DATA_SOURCE]["Default"]
 
-def main():
-    setup_render_device()
+    def apply_settings(self, settings):
+        changed = {
+            key: value
+            for key, value in settings.items()
+            if key in self.config and self.config[key] != value
+        }
+        if not changed:
+            return
+        logger.info(f"[Player] Settings changed: {changed}")
+        self.config.update(changed)
+
+        if CONFIG_KEY_VOLUME in changed:
+            self.volume = changed[CONFIG_KEY_VOLUME]
+        if CONFIG_KEY_MUTE in changed:
+            self.is_mute = changed[CONFIG_KEY_MUTE]
+
+
+def main(snapshot=None):
+    """
+    :param snapshot: Initial state handed over by the server, see
+        HidamariServer._player_snapshot(). Without it, the config is loaded from disk.
+    """
+    prepare()
     bus = SessionBus()
-    app = WebPlayer()
+    with trace.span("WebPlayer()"):
+        app = WebPlayer(snapshot=snapshot)
     try:
         bus.publish(DBUS_NAME_PLAYER, app)
     except RuntimeError as e:
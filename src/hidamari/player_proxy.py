@@ -0,0 +1,175 @@
+import logging
+
+from gi.repository import Gio, GLib
+
+from hidamari.commons import DBUS_INTERFACE_PLAYER, DBUS_NAME_PLAYER, LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# pydbus publishes an object under the path derived from its bus name
+PLAYER_OBJECT_PATH = "/" + DBUS_NAME_PLAYER.replace(".", "/")
+PLAYER_CALL_TIMEOUT_MSEC = 3000
+DBUS_INTERFACE_PROPERTIES = "org.freedesktop.DBus.Properties"
+
+
+class PlayerProxy:
+    """
+    Server-side handle of the player's D-Bus object.
+
+    Unlike `bus.get()`, nothing here introspects or blocks the server's main loop:
+    - The player's unique name is tracked with a name watcher, so a restarted player
+      is picked up (and calls never reach a player that is going away).
+    - Method calls and property sets are asynchronous, with a timeout.
+    - Player state is mirrored from its PropertiesChanged signals (the player sends
+      one on startup) and one GetAll when it appears, so reading e.g. `is_playing`
+      costs no round trip.
+    """
+
+    def __init__(self, bus, on_appeared: callable = None, on_vanished: callable = None):
+        self.bus = bus
+        self.con = bus.con
+        self.owner = None
+        self.properties = {}
+        self.on_appeared = on_appeared
+        self.on_vanished = on_vanished
+        self._watcher = bus.watch_name(
+            DBUS_NAME_PLAYER,
+            name_appeared=self._on_name_appeared,
+            name_vanished=self._on_name_vanished,
+        )
+        self._subscription = bus.subscribe(
+            sender=DBUS_NAME_PLAYER,
+            iface=DBUS_INTERFACE_PROPERTIES,
+            signal="PropertiesChanged",
+            object=PLAYER_OBJECT_PATH,
+            signal_fired=self._on_properties_changed,
+        )
+
+    @property
+    def is_available(self):
+        return self.owner is not None
+
+    def get(self, name, default=None):
+        """Mirrored value of a player property"""
+        return self.properties.get(name, default)
+
+    def set(self, name, signature, value, callback: callable = None):
+        """Set a player property asynchronously"""
+        self.properties[name] = value
+        return self._call(
+            DBUS_INTERFACE_PROPERTIES,
+            "Set",
+            GLib.Variant("(ssv)", (DBUS_INTERFACE_PLAYER, name, GLib.Variant(signature, value))),
+            callback,
+        )
+
+    def call(self, method, signature=None, args=(), callback: callable = None):
+        """
+        Call a player method asynchronously. `callback(result)` receives the unpacked
+        return values, or None if the call failed. Returns False if there's no player.
+        """
+        parameters = GLib.Variant(f"({signature})", args) if signature else None
+        return self._call(DBUS_INTERFACE_PLAYER, method, parameters, callback)
+
+    def subscribe(self, signal, callback: callable):
+        """Call `callback(*args)` on every `signal` emitted by the current player"""
+
+        def on_signal(sender, object, iface, signal, params):
+            if sender == self.owner:
+                callback(*params)
+
+        return self.bus.subscribe(
+            sender=DBUS_NAME_PLAYER,
+            iface=DBUS_INTERFACE_PLAYER,
+            signal=signal,
+            object=PLAYER_OBJECT_PATH,
+            signal_fired=on_signal,
+        )
+
+    def call_sync(self, method, signature=None, args=(), timeout_msec=PLAYER_CALL_TIMEOUT_MSEC):
+        """
+        Call a player method and wait for it, e.g. to let it clean up before quitting.
+        Returns False if there's no player or the call failed.
+        """
+        if self.owner is None:
+            return False
+        parameters = GLib.Variant(f"({signature})", args) if signature else None
+        try:
+            self.con.call_sync(
+                self.owner,
+                PLAYER_OBJECT_PATH,
+                DBUS_INTERFACE_PLAYER,
+                method,
+                parameters,
+                None,
+                Gio.DBusCallFlags.NONE,
+                timeout_msec,
+                None,
+            )
+        except GLib.Error as e:
+            logger.warning(f"[PlayerProxy] {method} failed: {e.message}")
+            return False
+        return True
+
+    def _call(self, interface, method, parameters, callback):
+        if self.owner is None:
+            logger.debug(f"[PlayerProxy] No player, dropping {method}")
+            return False
+        self.con.call(
+            self.owner,
+            PLAYER_OBJECT_PATH,
+            interface,
+            method,
+            parameters,
+            None,
+            Gio.DBusCallFlags.NONE,
+            PLAYER_CALL_TIMEOUT_MSEC,
+            None,
+            self._on_call_finished,
+            (method, callback),
+        )
+        return True
+
+    def _on_call_finished(self, con, result, user_data):
+        method, callback = user_data
+        try:
+            value = con.call_finish(result).unpack()
+        except GLib.Error as e:
+            logger.warning(f"[PlayerProxy] {method} failed: {e.message}")
+            value = None
+        if callback is not None:
+            callback(value)
+
+    def _on_name_appeared(self, owner):
+        logger.debug(f"[PlayerProxy] Player appeared as {owner}")
+        self.owner = owner
+        self.properties = {}
+        self._call(
+            DBUS_INTERFACE_PROPERTIES,
+            "GetAll",
+            GLib.Variant("(s)", (DBUS_INTERFACE_PLAYER,)),
+            self._on_get_all,
+        )
+        if self.on_appeared is not None:
+            self.on_appeared()
+
+    def _on_name_vanished(self):
+        if self.owner is not None:
+            logger.debug(f"[PlayerProxy] Player {self.owner} vanished")
+        self.owner = None
+        self.properties = {}
+        if self.on_vanished is not None:
+            self.on_vanished()
+
+    def _on_get_all(self, result):
+        if result is None:
+            # Every property the player declares readable must fit its D-Bus type
+            logger.error("[PlayerProxy] Can't mirror the player, GetAll failed")
+            return
+        # Don't overwrite anything that changed while GetAll was in flight
+        self.properties = {**result[0], **self.properties}
+
+    def _on_properties_changed(self, sender, object, iface, signal, params):
+        interface, changed, _invalidated = params
+        if interface == DBUS_INTERFACE_PLAYER and sender == self.owner:
+            self.properties.update(changed)
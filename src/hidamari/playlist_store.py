@@ -0,0 +1,467 @@
+"""
+Playlist store, playlist format version 3.
+
+Playlists live in an SQLite database in CONFIG_DIR instead of one JSON document:
+- `videos` interns every video path once (the library),
+- `playlists` has one row per playlist,
+- `entries` holds the ordered videos of every playlist, per monitor. Monitor ""
+  (ALL_MONITORS) is the monitor-independent list of PLAYLIST_MODE_ALL.
+Entries keep their id and are ordered by a fractional position, so inserting, removing
+or moving an entry writes that row only, never renumbers the rest of the list. Edits
+address the entries by id (see entry_ids()), so they never look up a list by index. The
+database is in WAL mode, so readers in other processes don't block the writer, and every
+process notices the commits of the others through `PRAGMA data_version`.
+
+PlaylistUtil keeps exposing the v2 document structure on top of this. An existing
+playlist.json (v1/v2) is imported when the database is created, and JSON import/export
+stays available for backups.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from hidamari import persistence
+from hidamari.commons import (
+    CONFIG_DIR,
+    LOGGER_NAME,
+    PLAYLIST_DB_PATH,
+    PLAYLIST_KEY_EDITS,
+    PLAYLIST_KEY_MODE,
+    PLAYLIST_KEY_MONITORS,
+    PLAYLIST_KEY_VIDEOS,
+    PLAYLIST_MODE_PER_MONITOR,
+    PLAYLIST_PATH,
+    PLAYLIST_VERSION,
+)
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Version of the JSON documents, v1 is migrated on import
+JSON_VERSION = 2
+ALL_MONITORS = ""
+BUSY_TIMEOUT_SEC = 10
+# Gap between the positions of entries written in one go
+POSITION_STEP = 1.0
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS videos (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS playlists (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        mode TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+        monitor TEXT NOT NULL,
+        position REAL NOT NULL,
+        video_id INTEGER NOT NULL REFERENCES videos (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS entries_by_position ON entries (playlist_id, monitor, position)",
+    "CREATE INDEX IF NOT EXISTS entries_by_video ON entries (video_id)",
+)
+
+
+class _Crowded(Exception):
+    """No room left between two positions, the list needs renumbering"""
+
+
+# One connection (and cache) per thread, sqlite3 connections can't be shared
+_local = threading.local()
+
+
+def read_json(path):
+    """Read a v1/v2 JSON playlist document, returns {name: playlist}"""
+    with open(path) as f:
+        document = json.load(f)
+    if not isinstance(document, dict) or not isinstance(document.get("playlists"), dict):
+        raise ValueError(f"{path} is not a playlist document")
+    if document.get("version", 1) <= 1:
+        document = _migrateV1ToV2(document)
+    return document["playlists"]
+
+
+def _migrateV1ToV2(document: dict):
+    """
+    v1 stored each playlist as a flat {monitor: [videos]} dict. v2 wraps it with a
+    'mode' (PER_MONITOR/ALL) so a playlist can also be evenly distributed across all
+    monitors instead of manually assigned per monitor.
+    """
+    logger.debug("[Playlist] Migration from version 1 to 2.")
+    document["playlists"] = {
+        name: {
+            PLAYLIST_KEY_MODE: PLAYLIST_MODE_PER_MONITOR,
+            PLAYLIST_KEY_MONITORS: pl_monitors,
+            PLAYLIST_KEY_VIDEOS: [],
+        }
+        for name, pl_monitors in document.get("playlists", {}).items()
+    }
+    document["version"] = 2
+    return document
+
+
+def connect():
+    """The connection of the calling thread, opened (and migrated) on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(CONFIG_DIR, exist_ok=True)
+        # Autocommit, transactions are explicit. See _transaction().
+        conn = sqlite3.connect(PLAYLIST_DB_PATH, timeout=BUSY_TIMEOUT_SEC, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        _migrate(conn)
+        _local.conn = conn
+        _local.playlists = None
+        _local.data_version = None
+    return conn
+
+
+@contextlib.contextmanager
+def _transaction(conn):
+    """Write transaction, joins the one already open on `conn`"""
+    if conn.in_transaction:
+        yield conn
+        return
+    # IMMEDIATE: take the write lock up front rather than fail to upgrade a read lock
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    # Our own commits don't change `data_version`
+    _local.playlists = None
+
+
+def _migrate(conn):
+    with _transaction(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= PLAYLIST_VERSION:
+            return
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if os.path.isfile(PLAYLIST_PATH):
+            try:
+                playlists = read_json(PLAYLIST_PATH)
+            except (OSError, ValueError) as e:
+                logger.warning(f"[Playlist] Can't import {PLAYLIST_PATH}: {e}")
+            else:
+                _replace_all(conn, playlists)
+                logger.info(f"[Playlist] Imported {len(playlists)} playlists from {PLAYLIST_PATH}")
+        conn.execute(f"PRAGMA user_version = {PLAYLIST_VERSION}")
+
+
+def load_all():
+    """
+    {name: {mode, monitors: {monitor: [paths]}, videos: [paths]}}, cached while the
+    database is unchanged. Shared with later calls, the caller must not modify it.
+    """
+    conn = connect()
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _local.playlists is not None and _local.data_version == data_version:
+        return _local.playlists
+
+    playlists = {}
+    rows = conn.execute("SELECT id, name, mode FROM playlists ORDER BY id")
+    names = {}
+    for playlist_id, name, mode in rows:
+        names[playlist_id] = name
+        playlists[name] = {
+            PLAYLIST_KEY_MODE: mode,
+            PLAYLIST_KEY_MONITORS: {},
+            PLAYLIST_KEY_VIDEOS: [],
+        }
+    rows = conn.execute(
+        """
+        SELECT e.playlist_id, e.monitor, v.path FROM entries e JOIN videos v ON v.id = e.video_id
+        ORDER BY e.playlist_id, e.monitor, e.position
+        """
+    )
+    for playlist_id, monitor, path in rows:
+        playlist = playlists[names[playlist_id]]
+        if monitor == ALL_MONITORS:
+            playlist[PLAYLIST_KEY_VIDEOS].append(path)
+        else:
+            playlist[PLAYLIST_KEY_MONITORS].setdefault(monitor, []).append(path)
+
+    _local.playlists = playlists
+    _local.data_version = data_version
+    return playlists
+
+
+def entry_ids(name: str):
+    """
+    {monitor: [entry id]} of the playlist `name`, in list order. Monitor ALL_MONITORS
+    is the shared list. Empty lists are left out.
+    """
+    ids = {}
+    rows = connect().execute(
+        """
+        SELECT e.monitor, e.id FROM entries e JOIN playlists p ON p.id = e.playlist_id
+        WHERE p.name = ? ORDER BY e.monitor, e.position
+        """,
+        (name,),
+    )
+    for monitor, entry_id in rows:
+        ids.setdefault(monitor, []).append(entry_id)
+    return ids
+
+
+def upsert(name: str, playlist: dict):
+    """Add or replace the playlist `name`, writing only the entries that changed"""
+    conn = connect()
+    with _transaction(conn):
+        _upsert(conn, name, playlist)
+
+
+def update(name: str, changes: dict):
+    """
+    Apply a partial playlist to the stored playlist `name`: its mode, the monitor lists
+    and the shared list only if present in `changes`. Raises KeyError if there's no
+    such playlist.
+
+    Instead of whole lists, `changes` can hold the edits of some lists under
+    PLAYLIST_KEY_EDITS, as {monitor: [edit]}, applied in order. Edits refer to entries
+    by their id (see entry_ids()), or by the negative id an earlier edit gave a new one:
+        ("insert", before, after, [(new id, path)]): new entries between the entries
+          `before` and `after`, None at either end of the list,
+        ("remove", [entry id]),
+        ("move", entry id, before, after): the entry put between `before` and `after`.
+    Only the rows of the inserted, removed and moved entries are read and written.
+    Entries that are gone by now (e.g. removed by another process) are skipped; new
+    entries next to them go to the end of the list.
+    """
+    conn = connect()
+    with _transaction(conn):
+        row = conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        _update(conn, row[0], changes)
+
+
+def delete(name: str):
+    conn = connect()
+    with _transaction(conn):
+        conn.execute("DELETE FROM playlists WHERE name = ?", (name,))
+
+
+def rename(name: str, new_name: str):
+    """Rename the playlist `name`. Raises ValueError if there's already one named `new_name`."""
+    conn = connect()
+    try:
+        with _transaction(conn):
+            conn.execute("UPDATE playlists SET name = ? WHERE name = ?", (new_name, name))
+    except sqlite3.IntegrityError:
+        raise ValueError(f"A playlist named '{new_name}' already exists") from None
+
+
+def replace_all(playlists: dict):
+    """Make {name: playlist} the whole content of the store"""
+    conn = connect()
+    with _transaction(conn):
+        _replace_all(conn, playlists)
+
+
+def import_json(path):
+    """Replace all playlists with the ones of a JSON document (e.g. a backup)"""
+    replace_all(read_json(path))
+
+
+def export_json(path):
+    """Write all playlists to `path` as a v2 JSON document"""
+    document = {"version": JSON_VERSION, "playlists": load_all()}
+    persistence.atomic_write(path, json.dumps(document, indent=3) + "\n")
+
+
+def _replace_all(conn, playlists):
+    existing = {name for (name,) in conn.execute("SELECT name FROM playlists")}
+    conn.executemany(
+        "DELETE FROM playlists WHERE name = ?", [(name,) for name in existing - set(playlists)]
+    )
+    for name, playlist in playlists.items():
+        _upsert(conn, name, playlist)
+
+
+def _upsert(conn, name, playlist):
+    conn.execute(
+        """
+        INSERT INTO playlists (name, mode) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET mode = excluded.mode WHERE mode != excluded.mode
+        """,
+        (name, playlist.get(PLAYLIST_KEY_MODE, PLAYLIST_MODE_PER_MONITOR)),
+    )
+    (playlist_id,) = conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()
+
+    lists = dict(playlist.get(PLAYLIST_KEY_MONITORS, {}))
+    lists[ALL_MONITORS] = playlist.get(PLAYLIST_KEY_VIDEOS, [])
+    # Drop the monitors that are gone from the playlist
+    stored = {
+        monitor
+        for (monitor,) in conn.execute(
+            "SELECT DISTINCT monitor FROM entries WHERE playlist_id = ?", (playlist_id,)
+        )
+    }
+    conn.executemany(
+        "DELETE FROM entries WHERE playlist_id = ? AND monitor = ?",
+        [(playlist_id, monitor) for monitor in stored - set(lists)],
+    )
+    for monitor, paths in lists.items():
+        _replace_entries(conn, playlist_id, monitor, paths)
+
+
+def _update(conn, playlist_id, changes):
+    if PLAYLIST_KEY_MODE in changes:
+        conn.execute(
+            "UPDATE playlists SET mode = ? WHERE id = ?", (changes[PLAYLIST_KEY_MODE], playlist_id)
+        )
+    for monitor, paths in changes.get(PLAYLIST_KEY_MONITORS, {}).items():
+        _replace_entries(conn, playlist_id, monitor, paths)
+    if PLAYLIST_KEY_VIDEOS in changes:
+        _replace_entries(conn, playlist_id, ALL_MONITORS, changes[PLAYLIST_KEY_VIDEOS])
+    new_ids = {}  # negative id of an inserted entry -> its entry id
+    for monitor, edits in changes.get(PLAYLIST_KEY_EDITS, {}).items():
+        for edit in edits:
+            try:
+                _apply_edit(conn, playlist_id, monitor, edit, new_ids)
+            except _Crowded:
+                _renumber(conn, playlist_id, monitor)
+                _apply_edit(conn, playlist_id, monitor, edit, new_ids)
+
+
+def _replace_entries(conn, playlist_id, monitor, paths):
+    """Make `paths` the whole list, if it isn't already"""
+    old_paths = [
+        path
+        for (path,) in conn.execute(
+            """
+            SELECT v.path FROM entries e JOIN videos v ON v.id = e.video_id
+            WHERE e.playlist_id = ? AND e.monitor = ? ORDER BY e.position
+            """,
+            (playlist_id, monitor),
+        )
+    ]
+    if old_paths == list(paths):
+        return
+    conn.execute(
+        "DELETE FROM entries WHERE playlist_id = ? AND monitor = ?", (playlist_id, monitor)
+    )
+    _insert_entries(
+        conn,
+        playlist_id,
+        monitor,
+        [(index * POSITION_STEP, path) for index, path in enumerate(paths)],
+    )
+
+
+def _apply_edit(conn, playlist_id, monitor, edit, new_ids):
+    kind = edit[0]
+    if kind == "insert":
+        _kind, before, after, items = edit
+        positions = _positions_around(
+            conn, playlist_id, monitor, new_ids, before, after, len(items)
+        )
+        video_ids = _intern(conn, {path for _new_id, path in items})
+        for position, (new_id, path) in zip(positions, items, strict=True):
+            cursor = conn.execute(
+                "INSERT INTO entries (playlist_id, monitor, position, video_id) VALUES (?, ?, ?, ?)",
+                (playlist_id, monitor, position, video_ids[path]),
+            )
+            new_ids[new_id] = cursor.lastrowid
+    elif kind == "remove":
+        conn.executemany(
+            "DELETE FROM entries WHERE id = ? AND playlist_id = ?",
+            [(new_ids.get(entry_id, entry_id), playlist_id) for entry_id in edit[1]],
+        )
+    elif kind == "move":
+        _kind, entry_id, before, after = edit
+        if _position(conn, playlist_id, monitor, new_ids, entry_id) is None:
+            return
+        (position,) = _positions_around(conn, playlist_id, monitor, new_ids, before, after, 1)
+        conn.execute(
+            "UPDATE entries SET position = ? WHERE id = ?",
+            (position, new_ids.get(entry_id, entry_id)),
+        )
+
+
+def _position(conn, playlist_id, monitor, new_ids, entry_id):
+    """Position of an entry of the list, None if it isn't in there"""
+    if entry_id is None:
+        return None
+    row = conn.execute(
+        "SELECT position FROM entries WHERE id = ? AND playlist_id = ? AND monitor = ?",
+        (new_ids.get(entry_id, entry_id), playlist_id, monitor),
+    ).fetchone()
+    return row[0] if row is not None else None
+
+
+def _positions_around(conn, playlist_id, monitor, new_ids, before, after, count):
+    """`count` increasing positions between the entries `before` and `after`"""
+    low = _position(conn, playlist_id, monitor, new_ids, before)
+    high = _position(conn, playlist_id, monitor, new_ids, after)
+    if low is None and high is None:
+        # The end of the list, also when both neighbours are gone
+        (low,) = conn.execute(
+            "SELECT MAX(position) FROM entries WHERE playlist_id = ? AND monitor = ?",
+            (playlist_id, monitor),
+        ).fetchone()
+    return _positions_between(low, high, count)
+
+
+def _positions_between(low, high, count):
+    """`count` increasing positions between `low` and `high`, either None at an end"""
+    if low is None and high is None:
+        low = 0.0
+    if low is None:
+        low = high - POSITION_STEP * (count + 1)
+    if high is None:
+        high = low + POSITION_STEP * (count + 1)
+    positions = [low + (high - low) * (i + 1) / (count + 1) for i in range(count)]
+    if not all(a < b for a, b in zip([low, *positions], [*positions, high], strict=True)):
+        raise _Crowded()
+    return positions
+
+
+def _renumber(conn, playlist_id, monitor):
+    """Spread the positions of a list evenly again"""
+    ids = conn.execute(
+        "SELECT id FROM entries WHERE playlist_id = ? AND monitor = ? ORDER BY position",
+        (playlist_id, monitor),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE entries SET position = ? WHERE id = ?",
+        [(index * POSITION_STEP, entry_id) for index, (entry_id,) in enumerate(ids)],
+    )
+
+
+def _insert_entries(conn, playlist_id, monitor, rows):
+    """Add entries from [(position, path)]"""
+    if not rows:
+        return
+    video_ids = _intern(conn, {path for _position, path in rows})
+    conn.executemany(
+        "INSERT INTO entries (playlist_id, monitor, position, video_id) VALUES (?, ?, ?, ?)",
+        [(playlist_id, monitor, position, video_ids[path]) for position, path in rows],
+    )
+
+
+def _intern(conn, paths):
+    """{path: video id}, adding the paths that aren't in the library yet"""
+    conn.executemany("INSERT OR IGNORE INTO videos (path) VALUES (?)", [(p,) for p in paths])
+    return {
+        path: conn.execute("SELECT id FROM videos WHERE path = ?", (path,)).fetchone()[0]
+        for path in paths
+    }
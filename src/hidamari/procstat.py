@@ -0,0 +1,193 @@
+"""
+Per-process resource accounting.
+
+Samples /proc/<pid>/stat, status, smaps_rollup and fd of the server, its child
+processes, and their descendants (e.g. the WebKit web process of the web player).
+Descendants are reported as "<parent>/<comm>". The latest sample is kept for the
+server's `process_stats` D-Bus property, and every sample is appended as one JSON line
+to a size-rotated log in CACHE_DIR.
+"""
+
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+
+from gi.repository import GLib
+
+from hidamari.commons import CACHE_DIR, LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+PROCSTAT_INTERVAL_SEC = 10
+PROCSTAT_LOG_PATH = os.path.join(CACHE_DIR, "procstat.log")
+PROCSTAT_LOG_MAX_BYTES = 1024 * 1024
+PROCSTAT_LOG_BACKUP_COUNT = 3
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def _read_stat(pid):
+    """(comm, ppid, cpu ticks, threads) from /proc/<pid>/stat"""
+    with open(f"/proc/{pid}/stat") as f:
+        stat = f.read()
+    comm = stat[stat.index("(") + 1 : stat.rindex(")")]
+    # Fields after the parenthesized command name start at field 3 (state)
+    fields = stat[stat.rindex(")") + 2 :].split()
+    ppid = int(fields[1])
+    ticks = int(fields[11]) + int(fields[12])  # utime + stime
+    threads = int(fields[17])
+    return comm, ppid, ticks, threads
+
+
+def _read_kb(path, key):
+    """Value in kB of the `key:` line of a /proc file, 0 if unavailable"""
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def _count_fds(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+def _read_children(pid):
+    """
+    [pid] of the children of `pid`, from /proc/<pid>/task/<tid>/children. None if the
+    kernel doesn't provide these files (CONFIG_PROC_CHILDREN).
+    """
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return []
+    children = []
+    for tid in tids:
+        path = f"/proc/{pid}/task/{tid}/children"
+        try:
+            with open(path) as f:
+                children += [int(child) for child in f.read().split()]
+        except FileNotFoundError:
+            if os.path.exists(f"/proc/{pid}/task/{tid}"):
+                return None
+            # The thread is gone
+        except (OSError, ValueError):
+            continue
+    return children
+
+
+def _children():
+    """ppid -> [pid] of all processes, by reading the stat of each one"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            _comm, ppid, _ticks, _threads = _read_stat(entry)
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+class ProcessStats:
+    def __init__(self, get_processes: callable, interval_sec=PROCSTAT_INTERVAL_SEC):
+        """
+        :param get_processes: Returns {name: pid} of the processes to account for
+        """
+        self.get_processes = get_processes
+        self.stats = {}
+        self._prev = {}  # pid -> (cpu ticks, monotonic time)
+        self._all_children = None  # _children() of the current sample, if it was needed
+
+        self.log = logging.getLogger(f"{LOGGER_NAME}.procstat")
+        self.log.propagate = False
+        if not self.log.handlers:
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                handler = RotatingFileHandler(
+                    PROCSTAT_LOG_PATH,
+                    maxBytes=PROCSTAT_LOG_MAX_BYTES,
+                    backupCount=PROCSTAT_LOG_BACKUP_COUNT,
+                )
+                self.log.addHandler(handler)
+                self.log.setLevel(logging.INFO)
+            except OSError as e:
+                logger.warning(f"[ProcStat] Can't write {PROCSTAT_LOG_PATH}: {e}")
+
+        self._timer_id = GLib.timeout_add_seconds(interval_sec, self._on_sample)
+
+    def close(self):
+        if self._timer_id is not None:
+            GLib.source_remove(self._timer_id)
+            self._timer_id = None
+
+    def sample(self):
+        """Sample all processes now, returns {name: {stat: value}}"""
+        processes = {name: pid for name, pid in self.get_processes().items() if pid}
+        self._all_children = None
+        stats = {}
+        for name, pid in processes.items():
+            self._sample_tree(name, pid, stats)
+        # Forget processes that are gone
+        sampled_pids = {s["pid"] for s in stats.values()}
+        self._prev = {pid: prev for pid, prev in self._prev.items() if pid in sampled_pids}
+        self.stats = stats
+        return stats
+
+    def _sample_tree(self, name, pid, stats):
+        stat = self._sample_one(pid)
+        if stat is None:
+            return
+        stats[name] = stat
+        for child in self._children_of(pid):
+            try:
+                comm = _read_stat(child)[0]
+            except (OSError, ValueError, IndexError):
+                continue
+            self._sample_tree(f"{name}/{comm}", child, stats)
+
+    def _children_of(self, pid):
+        children = _read_children(pid)
+        if children is not None:
+            return children
+        # Without the children files, scan every process once per sample
+        if self._all_children is None:
+            self._all_children = _children()
+        return self._all_children.get(pid, [])
+
+    def _sample_one(self, pid):
+        try:
+            _comm, _ppid, ticks, threads = _read_stat(pid)
+        except (OSError, ValueError, IndexError):
+            return None
+        now = time.monotonic()
+        cpu_percent = 0.0
+        if pid in self._prev:
+            prev_ticks, prev_time = self._prev[pid]
+            if now > prev_time:
+                cpu_percent = (ticks - prev_ticks) / CLK_TCK / (now - prev_time) * 100
+        self._prev[pid] = (ticks, now)
+        return {
+            "pid": pid,
+            "cpu_percent": round(cpu_percent, 1),
+            "rss_kb": _read_kb(f"/proc/{pid}/status", "VmRSS:"),
+            # smaps_rollup: Linux >= 4.14
+            "pss_kb": _read_kb(f"/proc/{pid}/smaps_rollup", "Pss:"),
+            "threads": threads,
+            "fds": _count_fds(pid),
+        }
+
+    def _on_sample(self):
+        stats = self.sample()
+        if self.log.handlers:
+            self.log.info(json.dumps({"time": time.time(), "processes": stats}))
+        return GLib.SOURCE_CONTINUE
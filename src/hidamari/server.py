@@ -1,5 +1,8 @@
+import copy
+import json
 import logging
 import multiprocessing as mp
+import os
 import random
 import signal
 import time
@@ -7,8 +10,9 @@ from multiprocessing import Process
 
 import setproctitle
 from gi.repository import GLib
-from pydbus import SessionBus
+from pydbus import SessionBus, generic
 
+from hidamari import persistence, trace
 from hidamari.commons import (
     CONFIG_KEY_ACTIVE_PLAYLIST,
     CONFIG_KEY_BLUR_RADIUS,
@@ -17,10 +21,11 @@ from hidamari.commons import (
     CONFIG_KEY_MUTE,
     CONFIG_KEY_MUTE_WHEN_MAXIMIZED,
     CONFIG_KEY_PAUSE_WHEN_MAXIMIZED,
+    CONFIG_KEY_STANDBY_PLAYER,
     CONFIG_KEY_STATIC_WALLPAPER,
     CONFIG_KEY_SYSTRAY,
     CONFIG_KEY_VOLUME,
-    DBUS_NAME_PLAYER,
+    CONFIG_TEMPLATE,
     DBUS_NAME_SERVER,
     LOGGER_NAME,
     MODE_NULL,
@@ -28,27 +33,44 @@ from hidamari.commons import (
     MODE_STREAM,
     MODE_VIDEO,
     MODE_WEBPAGE,
+    PLAYER_KIND_VIDEO,
+    PLAYER_KIND_WEB,
+    PLAYER_KINDS,
+    SETTINGS_KEYS,
 )
-from hidamari.gui.control import main as gui_main
-from hidamari.menu import show_systray_icon
+from hidamari.entry import gui as gui_entry
+from hidamari.entry import systray as systray_entry
+from hidamari.entry import video_player as video_player_entry
+from hidamari.entry import web_player as web_player_entry
 from hidamari.monitor import Monitors
-from hidamari.player.video_player import main as video_player_main
-from hidamari.player.web_player import main as web_player_main
-from hidamari.utils import ConfigUtil, EndSessionHandler, get_video_paths
-
-# NOTE: `gui.control`, `player.video_player`, `player.web_player` and `menu` all import
-# GTK/GLib at module level. `multiprocessing`'s forkserver start method preloads this
-# `__main__` module into its persistent helper process *before* forking any children.
-# If GTK gets imported during that preload, the forkserver helper ends up with GTK's
-# internal worker thread(s) initialized, and every child forked from it afterward
-# inherits a broken thread state where synchronous D-Bus calls (e.g. `SessionBus().get()`)
-# hang forever. Keep these imports local to the functions that build each Process's
-# target, so GTK is only ever imported inside the already-forked child, never in the
-# forkserver's preloaded state.
+from hidamari.player.standby import StandbyPool
+from hidamari.player_proxy import PlayerProxy
+from hidamari.procstat import ProcessStats
+from hidamari.supervisor import PlayerSupervisor
+from hidamari.teardown import END_SESSION_DEADLINE_SEC, Teardown
+from hidamari.utils import (
+    ConfigUtil,
+    EndSessionHandler,
+    PlaylistUtil,
+    get_video_paths,
+    to_variant_dict,
+)
+
+# NOTE: Children are started with the `spawn` method, so each one is a fresh interpreter
+# that imports the module of its Process target (and, with `python -m hidamari`, the
+# `__main__` module too). Targets are therefore the tiny modules in `hidamari.entry`,
+# which import the actual GUI/player/systray code only inside the child. Never import
+# `gui.control`, `player.*_player` or `menu` at module level here: every child would
+# pay for WebKit2, GnomeDesktop, AppIndicator, VLC and yt_dlp whether it needs them or not.
 
 loop = GLib.MainLoop()
 logger = logging.getLogger(LOGGER_NAME)
 
+# Settings changed within this window reach the players in a single ConfigChanged
+SETTINGS_COALESCE_MSEC = 50
+# Config changes are written to disk in the background once they settle for this long
+CONFIG_PERSIST_DELAY_SEC = 1
+
 
 class HidamariServer:
     """
@@ -74,6 +96,9 @@ class HidamariServer:
         <method name="feeling_lucky"/>
         <method name='show_gui'/>
         <method name='quit'/>
+        <method name='apply_settings'>
+            <arg type='a{sv}' name='settings' direction='in'/>
+        </method>
         <property name="mode" type="s" access="read"/>
         <property name="volume" type="i" access="readwrite"/>
         <property name="blur_radius" type="i" access="readwrite"/>
@@ -83,10 +108,19 @@ class HidamariServer:
         <property name="is_static_wallpaper" type="b" access="readwrite"/>
         <property name="is_pause_when_maximized" type="b" access="readwrite"/>
         <property name="is_mute_when_maximized" type="b" access="readwrite"/>
+        <property name="restart_count" type="i" access="read"/>
+        <property name="last_failure" type="s" access="read"/>
+        <property name="process_stats" type="a{sa{sv}}" access="read"/>
+        <signal name='ConfigChanged'>
+            <arg type='a{sv}' name='changes'/>
+        </signal>
     </interface>
     </node>
     """
 
+    # Changed settings, applied incrementally by the players
+    ConfigChanged = generic.signal()
+
     def __init__(self, version, pkgdatadir, localedir, args):
         setproctitle.setproctitle("hidamari-server")
 
@@ -96,6 +130,9 @@ class HidamariServer:
         self.args = args
         self._prev_mode = None
         self._player_count = 0
+        self._player_kind = None
+        self._pending_settings = {}
+        self._settings_flush_id = None
 
         # Processes
         # `fork` crashes (GTK/GLib state doesn't survive a raw fork). `forkserver` was tried
@@ -110,19 +147,30 @@ class HidamariServer:
         self.gui_process = None
         self.sys_icon_process = None
         self.player_process = None
+        self.standby_pool = None
+        # Cached, asynchronous handle of whichever player currently owns DBUS_NAME_PLAYER
+        self.player_proxy = PlayerProxy(SessionBus(), on_appeared=self._on_player_appeared)
+        # Restarts the player when it crashes or hangs
+        self.supervisor = PlayerSupervisor(self.player_proxy, self.reload)
+        # CPU/memory/threads/fds of every process, see `process_stats`
+        self.procstat = ProcessStats(self._get_processes)
 
         signal.signal(signal.SIGINT, lambda *_: self.quit())
         signal.signal(signal.SIGTERM, lambda *_: self.quit())
         # SIGSEGV as a fail-safe
         signal.signal(signal.SIGSEGV, lambda *_: self.quit())
         # Monitoring EndSession (OS reboot, shutdown, etc.)
-        EndSessionHandler(self.quit)
+        EndSessionHandler(lambda: self.quit(is_end_session=True))
 
         # Configuration
         if args.reset:
             ConfigUtil().generate_template()
         self._load_config()
 
+        # Warm standby players, taken over when the player class has to change
+        if self.config[CONFIG_KEY_STANDBY_PLAYER]:
+            self.standby_pool = StandbyPool()
+
         # Player process
         self.reload()
 
@@ -135,8 +183,13 @@ class HidamariServer:
     def _load_config(self):
         self.config = ConfigUtil().load()
 
-    def _save_config(self):
-        ConfigUtil().save(self.config)
+    def _update_config(self, changes):
+        """
+        Change keys of the config. The server's copy is authoritative, the changed keys
+        are merged into config.json in the background (the GUI writes the others).
+        """
+        self.config.update(changes)
+        ConfigUtil().save_later(changes, CONFIG_PERSIST_DELAY_SEC)
 
     def _setup_player(self, mode, data_source=None, monitor=None):
         # todo: implement playlist mode
@@ -144,78 +197,144 @@ class HidamariServer:
         logger.info(f"[Mode] {mode}")
         logger.info(f"[Data Source] {data_source}")
         logger.info(f"[Monitor] {monitor}")
-        self.config[CONFIG_KEY_MODE] = mode
+        if mode != MODE_NULL and mode not in PLAYER_KINDS:
+            raise ValueError("[Server] Unknown mode")
+        changes = {CONFIG_KEY_MODE: mode}
 
         # Set data source if specified
+        data_sources = dict(self.config[CONFIG_KEY_DATA_SOURCE])
         if data_source and monitor and mode == MODE_VIDEO:
-            self.config[CONFIG_KEY_DATA_SOURCE][monitor] = data_source
-
-        if mode == MODE_VIDEO:
-            self.config[CONFIG_KEY_DATA_SOURCE]['Default'] = data_source # always update default source
-            
-        if mode == MODE_PLAYLIST:
-            self.config[CONFIG_KEY_ACTIVE_PLAYLIST] = data_source
-            
+            data_sources[monitor] = data_source
+
+        if data_source and mode in [MODE_VIDEO, MODE_STREAM, MODE_WEBPAGE]:
+            data_sources["Default"] = data_source  # always update default source
+        changes[CONFIG_KEY_DATA_SOURCE] = data_sources
+
+        if data_source and mode == MODE_PLAYLIST:
+            changes[CONFIG_KEY_ACTIVE_PLAYLIST] = data_source
+
+        self._update_config(changes)
+
+        # Same player class: push the new source into the running player
+        player_kind = PLAYER_KINDS.get(mode)
+        if (
+            player_kind is not None
+            and player_kind == self._player_kind
+            and self.player_process is not None
+            and self.player_process.is_alive()
+        ):
+            if self._hot_swap_player():
+                self._refresh_systray(mode)
+                return
+            logger.warning("[Server] Hot-swap failed, restarting the player")
+
         # Quit current then create a new player
-        self._quit_player()
-
-        # Terminate old player process and wait for it to finish
-        if self.player_process:
-            self.player_process.terminate()
-            self.player_process.join(timeout=5)  # Wait up to 5 seconds
-            if self.player_process.is_alive():
-                logger.warning("[Server] Player process didn't terminate, killing it")
-                self.player_process.kill()
-                self.player_process.join(timeout=2)
-            self.player_process = None
-
-        if mode in [MODE_VIDEO, MODE_STREAM, MODE_PLAYLIST]:
-            try:
-                from player.video_player import main as video_player_main
-            except ModuleNotFoundError:
-                from hidamari.player.video_player import main as video_player_main
-            self.player_process = Process(
-                name=f"hidamari-player-{self._player_count}", target=video_player_main
-            )
-        elif mode == MODE_WEBPAGE:
-            try:
-                from player.web_player import main as web_player_main
-            except ModuleNotFoundError:
-                from hidamari.player.web_player import main as web_player_main
-            self.player_process = Process(
-                name=f"hidamari-player-{self._player_count}", target=web_player_main
-            )
-        elif mode == MODE_NULL:
-            pass
-        else:
-            raise ValueError("[Server] Unknown mode")
-        if self.player_process is not None:
-            self.player_process.start()
+        teardown = Teardown()
+        self._quit_player(teardown)
+        teardown.wait()
+
+        if player_kind is not None:
+            name = f"hidamari-player-{self._player_count}"
+            snapshot = self._player_snapshot()
+            if self.standby_pool is not None:
+                self.player_process = self.standby_pool.take(player_kind, name, snapshot)
+            if self.player_process is None:
+                if player_kind == PLAYER_KIND_VIDEO:
+                    target = video_player_entry.main
+                elif player_kind == PLAYER_KIND_WEB:
+                    target = web_player_entry.main
+                self.player_process = Process(name=name, target=target, args=(snapshot,))
+                with trace.span("spawn", name=name):
+                    self.player_process.start()
+            self.supervisor.watch(self.player_process)
             self._player_count += 1
-
-        # Refresh systray icon if the mode changed
+            self._player_kind = player_kind
+
+        if self.standby_pool is not None:
+            self.standby_pool.set_active(player_kind)
+        self._refresh_systray(mode)
+
+    def _player_snapshot(self):
+        """
+        Initial state of a new player, pickled into the process (or the standby's
+        activation message) so that it doesn't read the config and the playlist from
+        disk on its way to the first frame. The playlist is already reconciled with
+        the connected monitors by PlaylistUtil.
+        """
+        playlist = None
+        if self.config[CONFIG_KEY_MODE] == MODE_PLAYLIST:
+            playlist = PlaylistUtil().load()
+        return {"config": copy.deepcopy(self.config), "playlist": playlist}
+
+    def _hot_swap_player(self):
+        """
+        Replace the source of the running player in place. The player takes over the
+        server's config (mode, per-monitor sources, active playlist) and re-applies it
+        through its `data_source` setter, so its process, GTK windows and VLC instances
+        are kept. Nothing waits for the config to reach the disk.
+
+        Waits for the player's reply: on False (no player, an error or no reply within
+        the call timeout) the caller restarts the player instead.
+        """
+        # As JSON: D-Bus has no None, e.g. for no active playlist
+        if not self.player_proxy.call_sync("hot_swap", "s", (json.dumps(self.config),)):
+            return False
+        logger.info("[Server] Hot-swapped the player source")
+        return True
+
+    def _get_processes(self):
+        processes = {"hidamari-server": os.getpid()}
+        candidates = [self.player_process, self.gui_process, self.sys_icon_process]
+        if self.standby_pool is not None:
+            candidates += [process for process, _conn in self.standby_pool.standbys.values()]
+        for process in candidates:
+            if process is not None and process.is_alive():
+                processes[process.name] = process.pid
+        return processes
+
+    def _on_player_appeared(self):
+        # Settings changed after the player read the config, but before it subscribed
+        # to ConfigChanged. The player ignores the ones it already has.
+        settings = {key: self.config[key] for key in SETTINGS_KEYS}
+        self.player_proxy.call("apply_settings", "a{sv}", (to_variant_dict(settings),))
+
+        position = self.supervisor.take_resume_position()
+        if position:
+            logger.info(f"[Server] Resuming the restarted player at {position:.3f}")
+            self.player_proxy.call("seek", "d", (position,))
+
+    def _refresh_systray(self, mode):
+        """Refresh systray icon if the mode changed"""
         if self.config[CONFIG_KEY_SYSTRAY]:
             if self._prev_mode != self.mode:
-                if self.sys_icon_process:
-                    self.sys_icon_process.terminate()
-                    self.sys_icon_process.join(timeout=3)
-                    if self.sys_icon_process.is_alive():
-                        self.sys_icon_process.kill()
-                        self.sys_icon_process.join(timeout=1)
+                teardown = Teardown()
+                teardown.terminate(self.sys_icon_process)
+                teardown.wait()
                 self.sys_icon_process = Process(
                     name="hidamari-systray",
-                    target=show_systray_icon,
+                    target=systray_entry.main,
                     args=(mode, self.localedir),
                 )
-                self.sys_icon_process.start()
+                with trace.span("spawn", name=self.sys_icon_process.name):
+                    self.sys_icon_process.start()
             self._prev_mode = self.mode
 
-    @staticmethod
-    def _quit_player():
-        """Quit current player"""
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player:
-            player.quit_player()
+    def _quit_player(self, teardown, is_end_session=False):
+        """
+        Ask the current player to quit and hand its process over to `teardown`. The reply
+        to `quit_player` is its acknowledgement: the wallpaper is restored and it exits by
+        itself. Without one (no reply in time, or not published yet) it is terminated.
+        """
+        # Stopping it on purpose, not a crash
+        self.supervisor.unwatch()
+        method = "end_session" if is_end_session else "quit_player"
+        timeout_msec = int(teardown.remaining() * 1000)
+        if timeout_msec > 0 and self.player_proxy.call_sync(method, timeout_msec=timeout_msec):
+            teardown.expect(self.player_process)
+        else:
+            teardown.terminate(self.player_process)
+        self.player_process = None
+        self._player_kind = None
 
     def playlist(self, playlist_name=None):
         self._setup_player(MODE_PLAYLIST, playlist_name)
@@ -229,17 +348,11 @@ class HidamariServer:
     def webpage(self, webpage_url=None):
         self._setup_player(MODE_WEBPAGE, webpage_url)
 
-    @staticmethod
-    def pause_playback():
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player:
-            player.pause_playback()
+    def pause_playback(self):
+        self.player_proxy.call("pause_playback")
 
-    @staticmethod
-    def start_playback():
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player:
-            player.start_playback()
+    def start_playback(self):
+        self.player_proxy.call("start_playback")
 
     def reload(self):
         if self.config[CONFIG_KEY_MODE] == MODE_VIDEO:
@@ -258,46 +371,75 @@ class HidamariServer:
     def feeling_lucky(self):
         """Random play a video from the directory"""
         monitors = Monitors().get_monitors()
+        video_paths = get_video_paths()
+        data_sources = dict(self.config[CONFIG_KEY_DATA_SOURCE])
         for monitor in monitors:
-            file_list = get_video_paths()
             # Remove current data source from the random selection
-            if self.config[CONFIG_KEY_DATA_SOURCE][monitor] in file_list:
-                file_list.remove(self.config[CONFIG_KEY_DATA_SOURCE][monitor])
+            file_list = [path for path in video_paths if path != data_sources.get(monitor)]
             if file_list:
-                video_path = random.choice(file_list)
-                self.config[CONFIG_KEY_MODE] = MODE_VIDEO
-                self.config[CONFIG_KEY_DATA_SOURCE][monitor] = video_path
-                self._save_config()
-            self.video(video_path)
+                data_sources[monitor] = data_sources["Default"] = random.choice(file_list)
+        # One player setup for all monitors, which persists the changed keys
+        self._update_config({CONFIG_KEY_DATA_SOURCE: data_sources})
+        self.video()
 
     def show_gui(self):
         """Show main GUI"""
         self.gui_process = Process(
             name="hidamari-gui",
-            target=gui_main,
+            target=gui_entry.main,
             args=(
                 self.version,
                 self.pkgdatadir,
                 self.localedir,
             ),
         )
-        self.gui_process.start()
-
-    def quit(self):
-        try:
-            self._quit_player()
-        except GLib.Error:
-            pass
-
-        # Quit all processes with proper cleanup
-        for process in [self.player_process, self.gui_process, self.sys_icon_process]:
-            if process and process.is_alive():
-                process.terminate()
-                process.join(timeout=3)
-                if process.is_alive():
-                    logger.warning(f"[Server] Process {process.name} didn't terminate, killing it")
-                    process.kill()
-                    process.join(timeout=1)
+        with trace.span("spawn", name=self.gui_process.name):
+            self.gui_process.start()
+
+    def apply_settings(self, settings):
+        """
+        Apply several settings (keys of SETTINGS_KEYS) at once. Bursts such as slider
+        drags are coalesced: the players receive the changed keys in one ConfigChanged
+        signal, and they are persisted in the background once they settle.
+        """
+        for key in settings:
+            if key not in SETTINGS_KEYS:
+                raise ValueError(f"[Server] Unknown setting {key}")
+        changes = {}
+        for key, value in settings.items():
+            # D-Bus clients may send e.g. an int for a float setting
+            value = type(CONFIG_TEMPLATE[key])(value)
+            if self.config[key] != value:
+                changes[key] = value
+        if not changes:
+            return
+        self._update_config(changes)
+        self._pending_settings.update(changes)
+
+        if self._settings_flush_id is None:
+            self._settings_flush_id = GLib.timeout_add(SETTINGS_COALESCE_MSEC, self._flush_settings)
+
+    def _flush_settings(self):
+        self._settings_flush_id = None
+        settings, self._pending_settings = self._pending_settings, {}
+        logger.debug(f"[Server] ConfigChanged: {settings}")
+        self.ConfigChanged(to_variant_dict(settings))
+        return GLib.SOURCE_REMOVE
+
+    def quit(self, is_end_session=False):
+        """Stop all processes concurrently, skipping fades on end session (logout, shutdown)"""
+        persistence.flush()
+        self.procstat.close()
+
+        teardown = Teardown(END_SESSION_DEADLINE_SEC) if is_end_session else Teardown()
+        # Nothing to clean up in these, signal them first so they go down in parallel
+        teardown.terminate(self.gui_process)
+        teardown.terminate(self.sys_icon_process)
+
+        if self.standby_pool is not None:
+            self.standby_pool.close(teardown)
+        self._quit_player(teardown, is_end_session)
+        teardown.wait()
 
         loop.quit()
         logger.info("[Server] Stopped")
@@ -306,16 +448,26 @@ class HidamariServer:
     def mode(self):
         return self.config[CONFIG_KEY_MODE]
 
+    @property
+    def restart_count(self):
+        return self.supervisor.restart_count
+
+    @property
+    def last_failure(self):
+        return self.supervisor.last_failure
+
+    @property
+    def process_stats(self):
+        """Latest sample of every process: CPU%, RSS/PSS, threads and open fds"""
+        return {name: to_variant_dict(stat) for name, stat in self.procstat.stats.items()}
+
     @property
     def volume(self):
         return self.config[CONFIG_KEY_VOLUME]
 
     @volume.setter
     def volume(self, volume):
-        self.config[CONFIG_KEY_VOLUME] = volume
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.volume = volume
+        self.apply_settings({CONFIG_KEY_VOLUME: volume})
 
     @property
     def blur_radius(self):
@@ -323,10 +475,7 @@ class HidamariServer:
 
     @blur_radius.setter
     def blur_radius(self, blur_radius):
-        self.config[CONFIG_KEY_BLUR_RADIUS] = blur_radius
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.reload_config()
+        self.apply_settings({CONFIG_KEY_BLUR_RADIUS: blur_radius})
 
     @property
     def is_mute(self):
@@ -334,30 +483,22 @@ class HidamariServer:
 
     @is_mute.setter
     def is_mute(self, is_mute):
-        self.config[CONFIG_KEY_MUTE] = is_mute
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.is_mute = is_mute
+        self.apply_settings({CONFIG_KEY_MUTE: is_mute})
 
     @property
     def is_playing(self):
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            return player.is_playing
-        return False
+        return self.player_proxy.get("is_playing", False)
 
     @property
     def is_paused_by_user(self):
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None and player.mode in [MODE_VIDEO, MODE_STREAM]:
-            return player.is_paused_by_user
+        if self.player_proxy.get("mode") in [MODE_VIDEO, MODE_STREAM, MODE_PLAYLIST]:
+            return self.player_proxy.get("is_paused_by_user", False)
         return None
 
     @is_paused_by_user.setter
     def is_paused_by_user(self, is_paused_by_user):
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None and player.mode in [MODE_VIDEO, MODE_STREAM]:
-            player.is_paused_by_user = is_paused_by_user
+        if self.player_proxy.get("mode") in [MODE_VIDEO, MODE_STREAM, MODE_PLAYLIST]:
+            self.player_proxy.set("is_paused_by_user", "b", is_paused_by_user)
 
     @property
     def is_static_wallpaper(self):
@@ -365,10 +506,7 @@ class HidamariServer:
 
     @is_static_wallpaper.setter
     def is_static_wallpaper(self, is_static_wallpaper):
-        self.config[CONFIG_KEY_STATIC_WALLPAPER] = is_static_wallpaper
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.reload_config()
+        self.apply_settings({CONFIG_KEY_STATIC_WALLPAPER: is_static_wallpaper})
 
     @property
     def is_pause_when_maximized(self):
@@ -376,10 +514,7 @@ class HidamariServer:
 
     @is_pause_when_maximized.setter
     def is_pause_when_maximized(self, is_pause_when_maximized):
-        self.config[CONFIG_KEY_PAUSE_WHEN_MAXIMIZED] = is_pause_when_maximized
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.reload_config()
+        self.apply_settings({CONFIG_KEY_PAUSE_WHEN_MAXIMIZED: is_pause_when_maximized})
 
     @property
     def is_mute_when_maximized(self):
@@ -387,10 +522,7 @@ class HidamariServer:
 
     @is_mute_when_maximized.setter
     def is_mute_when_maximized(self, is_mute_when_maximized):
-        self.config[CONFIG_KEY_MUTE_WHEN_MAXIMIZED] = is_mute_when_maximized
-        player = get_instance(DBUS_NAME_PLAYER)
-        if player is not None:
-            player.reload_config()
+        self.apply_settings({CONFIG_KEY_MUTE_WHEN_MAXIMIZED: is_mute_when_maximized})
 
 
 def get_instance(dbus_name):
@@ -0,0 +1,144 @@
+"""
+Player supervision.
+
+The server hands every player process it starts to the supervisor, and takes it back
+(`unwatch()`) before stopping it on purpose, so only unexpected exits count as crashes.
+A player is considered failed when:
+- its process exits: the process sentinel is watched on the server's main loop, or
+- its main loop stalls: the player emits a `Heartbeat` signal from a main loop timer,
+  and the supervisor kills it when the heartbeats stop.
+Failed players are restarted with exponential backoff, resuming from the last position
+reported by the heartbeats, until the crash budget is exhausted.
+"""
+
+import logging
+import signal
+import time
+
+from gi.repository import GLib
+
+from hidamari.commons import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Keep in sync with HEARTBEAT_INTERVAL_SEC of the player
+HEARTBEAT_TIMEOUT_SEC = 20
+HEARTBEAT_CHECK_INTERVAL_SEC = 5
+# Time a fresh player gets to show up and send its first heartbeat
+STARTUP_GRACE_SEC = 30
+RESTART_BACKOFF_BASE_SEC = 1
+RESTART_BACKOFF_MAX_SEC = 60
+# Give up after this many failures within the window
+CRASH_BUDGET = 5
+CRASH_WINDOW_SEC = 600
+
+
+class PlayerSupervisor:
+    def __init__(self, player_proxy, restart: callable):
+        """
+        :param player_proxy: PlayerProxy, the heartbeats are received through it
+        :param restart: Called to start a new player, after which `watch()` is expected
+        """
+        self.restart = restart
+        self.restart_count = 0
+        self.last_failure = ""
+        self.resume_position = None
+
+        self.process = None
+        self._position = None
+        self._heartbeat_deadline = 0
+        self._stall_reason = None
+        self._failures = []
+        self._watch_id = None
+        self._check_id = None
+        self._restart_id = None
+        player_proxy.subscribe("Heartbeat", self._on_heartbeat)
+
+    def watch(self, process):
+        """Supervise the freshly started player `process`"""
+        self.unwatch()
+        self.process = process
+        self._position = None
+        self._stall_reason = None
+        self._heartbeat_deadline = time.monotonic() + STARTUP_GRACE_SEC
+        self._watch_id = GLib.unix_fd_add_full(
+            GLib.PRIORITY_DEFAULT,
+            process.sentinel,
+            GLib.IOCondition.IN | GLib.IOCondition.HUP,
+            self._on_process_exit,
+            process,
+        )
+        self._check_id = GLib.timeout_add_seconds(HEARTBEAT_CHECK_INTERVAL_SEC, self._on_check)
+
+    def unwatch(self):
+        """Stop supervising, e.g. before the player is stopped on purpose"""
+        if self._restart_id is not None:
+            # A pending restart is superseded by whatever the server starts instead
+            self.resume_position = None
+        for source_id in (self._watch_id, self._check_id, self._restart_id):
+            if source_id is not None:
+                GLib.source_remove(source_id)
+        self._watch_id = self._check_id = self._restart_id = None
+        self.process = None
+
+    def take_resume_position(self):
+        """The position to resume the restarted player from, once"""
+        position, self.resume_position = self.resume_position, None
+        return position
+
+    def _on_heartbeat(self, position):
+        self._heartbeat_deadline = time.monotonic() + HEARTBEAT_TIMEOUT_SEC
+        if position >= 0:
+            self._position = position
+
+    def _on_check(self):
+        if self.process is None or time.monotonic() < self._heartbeat_deadline:
+            return GLib.SOURCE_CONTINUE
+        # The sentinel fires once it's dead, and the failure is handled there
+        self._stall_reason = f"main loop stalled for over {HEARTBEAT_TIMEOUT_SEC}s"
+        logger.warning(f"[Supervisor] {self.process.name}: {self._stall_reason}, killing it")
+        self.process.kill()
+        self._check_id = None
+        return GLib.SOURCE_REMOVE
+
+    def _on_process_exit(self, _fd, _condition, process):
+        self._watch_id = None
+        if process is not self.process:
+            return GLib.SOURCE_REMOVE
+        process.join()
+        if self._stall_reason is not None:
+            reason = self._stall_reason
+        elif process.exitcode is not None and process.exitcode < 0:
+            reason = f"killed by {signal.Signals(-process.exitcode).name}"
+        else:
+            reason = f"exited with code {process.exitcode}"
+        self._on_failure(f"{process.name} {reason}")
+        return GLib.SOURCE_REMOVE
+
+    def _on_failure(self, reason):
+        position = self._position
+        self.unwatch()
+        self.last_failure = reason
+
+        now = time.monotonic()
+        self._failures = [t for t in self._failures if now - t < CRASH_WINDOW_SEC] + [now]
+        if len(self._failures) > CRASH_BUDGET:
+            logger.error(
+                f"[Supervisor] {reason}. Crash budget exhausted "
+                f"({CRASH_BUDGET} in {CRASH_WINDOW_SEC}s), not restarting the player"
+            )
+            self.last_failure = f"{reason} (gave up)"
+            return
+
+        delay = min(
+            RESTART_BACKOFF_BASE_SEC * 2 ** (len(self._failures) - 1), RESTART_BACKOFF_MAX_SEC
+        )
+        logger.warning(f"[Supervisor] {reason}. Restarting the player in {delay}s")
+        self.resume_position = position
+        self._restart_id = GLib.timeout_add_seconds(delay, self._on_restart)
+
+    def _on_restart(self):
+        self._restart_id = None
+        self.restart_count += 1
+        self.restart()
+        return GLib.SOURCE_REMOVE
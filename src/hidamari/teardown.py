@@ -0,0 +1,60 @@
+"""
+Concurrent teardown of child processes under a single deadline.
+
+Every process is asked to stop first, then all of them are waited for together on
+their sentinels, so stopping N processes costs as much as the slowest one instead of
+the sum of their timeouts. Processes that acknowledged a quit request (e.g. the player
+replying to `quit_player` once it restored the wallpaper) are left to exit on their own;
+the others get SIGTERM. Whatever is still alive at the deadline is killed.
+"""
+
+import logging
+import time
+from multiprocessing.connection import wait
+
+from hidamari.commons import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+TEARDOWN_DEADLINE_SEC = 5
+# Logout/shutdown: the session manager won't wait for long
+END_SESSION_DEADLINE_SEC = 2
+KILL_GRACE_SEC = 1
+
+
+class Teardown:
+    def __init__(self, deadline_sec=TEARDOWN_DEADLINE_SEC):
+        self.deadline = time.monotonic() + deadline_sec
+        self.processes = []
+
+    def remaining(self):
+        """Seconds left until the deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def terminate(self, process):
+        """Send SIGTERM to `process` now and wait for it in `wait()`"""
+        if process is not None and process.is_alive():
+            process.terminate()
+            self.processes.append(process)
+
+    def expect(self, process):
+        """Wait in `wait()` for `process`, which acknowledged a quit request, to exit by itself"""
+        if process is not None and process.is_alive():
+            self.processes.append(process)
+
+    def wait(self):
+        """Wait for all processes until the deadline, then kill the stragglers"""
+        pending = {process.sentinel: process for process in self.processes}
+        while pending:
+            remaining = self.remaining()
+            if remaining == 0:
+                break
+            for sentinel in wait(list(pending), timeout=remaining):
+                pending.pop(sentinel).join()
+
+        for process in pending.values():
+            logger.warning(f"[Teardown] {process.name} didn't stop in time, killing it")
+            process.kill()
+        for process in pending.values():
+            process.join(timeout=KILL_GRACE_SEC)
+        self.processes = []
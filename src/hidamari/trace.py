@@ -0,0 +1,137 @@
+"""
+Startup timeline tracing (`hidamari --trace-startup FILE`).
+
+Writes a Chrome trace / Perfetto compatible timeline in the "JSON Array Format".
+Every process (server, players, GUI, systray) appends its events to the same file,
+one event per O_APPEND write so they never interleave. The closing `]` is optional in
+that format, so there is nothing to finalize when a process exits or crashes.
+Timestamps come from CLOCK_BOOTTIME, which all processes share and which is the clock
+of /proc/<pid>/stat, so each process's timeline starts at its actual launch.
+
+Tracing is off unless the launcher sets it up; then the path is handed down to the
+children through the environment. When off, `span()` and `traced()` cost one lookup.
+Only startup is recorded: every process stops tracing STARTUP_WINDOW_SEC after the
+launcher started the trace, so a long-running session doesn't grow the file forever.
+"""
+
+import contextlib
+import functools
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+
+TRACE_ENV = "HIDAMARI_TRACE_STARTUP"
+TRACE_DEADLINE_ENV = "HIDAMARI_TRACE_STARTUP_UNTIL"
+STARTUP_WINDOW_SEC = 30
+
+_fd = None
+_fd_pid = None
+
+
+def is_enabled():
+    return bool(os.environ.get(TRACE_ENV))
+
+
+def start(path):
+    """Start a new trace file and enable tracing for this process and its children"""
+    path = os.path.abspath(path)
+    with open(path, "w") as f:
+        f.write("[\n")
+    os.environ[TRACE_ENV] = path
+    os.environ[TRACE_DEADLINE_ENV] = str(_now_us() + int(STARTUP_WINDOW_SEC * 1_000_000))
+
+
+def stop():
+    """Stop tracing in this process and the children it starts from now on"""
+    global _fd, _fd_pid
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(TRACE_DEADLINE_ENV, None)
+    if _fd is not None and _fd_pid == os.getpid():
+        with contextlib.suppress(OSError):
+            os.close(_fd)
+    _fd = _fd_pid = None
+
+
+def _now_us():
+    return time.clock_gettime_ns(time.CLOCK_BOOTTIME) // 1000
+
+
+def _process_start_us():
+    with open("/proc/self/stat") as f:
+        stat = f.read()
+    # Fields after the parenthesized command name start at field 3 (state);
+    # starttime is field 22, in clock ticks since boot
+    fields = stat[stat.rindex(")") + 2 :].split()
+    return int(fields[19]) * 1_000_000 // os.sysconf("SC_CLK_TCK")
+
+
+def _write(event):
+    global _fd, _fd_pid
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return
+    try:
+        if _now_us() > int(os.environ.get(TRACE_DEADLINE_ENV, "0")):
+            # Startup is over
+            stop()
+            return
+        if _fd is None or _fd_pid != os.getpid():
+            _fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _fd_pid = os.getpid()
+        event["pid"] = os.getpid()
+        event["tid"] = threading.get_native_id()
+        os.write(_fd, (json.dumps(event, default=str) + ",\n").encode())
+    except OSError:
+        # Tracing must never break the app
+        pass
+
+
+def process_started(name=None):
+    """Name this process in the timeline and add a span from its launch until now"""
+    if not is_enabled():
+        return
+    name = name or mp.current_process().name
+    _write({"name": "process_name", "ph": "M", "args": {"name": name}})
+    try:
+        start_us = _process_start_us()
+    except (OSError, ValueError, IndexError):
+        return
+    _write({"name": "process launch", "ph": "X", "ts": start_us, "dur": _now_us() - start_us})
+
+
+def instant(name, **args):
+    if not is_enabled():
+        return
+    _write({"name": name, "ph": "i", "s": "p", "ts": _now_us(), "args": args})
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    if not is_enabled():
+        yield
+        return
+    start_us = _now_us()
+    try:
+        yield
+    finally:
+        _write({"name": name, "ph": "X", "ts": start_us, "dur": _now_us() - start_us, "args": args})
+
+
+def traced(name=None):
+    """Decorator recording every call of the function as a span"""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return function(*args, **kwargs)
+            with span(span_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,16 +1,18 @@
+import copy
 import gettext
 import json
 import locale
 import logging
 import os
+import sqlite3
+import threading
 from pprint import pformat
 
 import gi
-
-gi.require_version("Wnck", "3.0")
 import pydbus
-from gi.repository import Gio, GLib, Wnck
+from gi.repository import GLib
 
+from hidamari import library, persistence, playlist_store, trace
 from hidamari.commons import (
     AUTOSTART_DESKTOP_CONTENT,
     AUTOSTART_DESKTOP_CONTENT_FLATPAK,
@@ -19,6 +21,7 @@ from hidamari.commons import (
     CONFIG_DIR,
     CONFIG_KEY_DATA_SOURCE,
     CONFIG_KEY_MUTE_WHEN_MAXIMIZED,
+    CONFIG_KEY_STANDBY_PLAYER,
     CONFIG_PATH,
     CONFIG_TEMPLATE,
     CONFIG_VERSION,
@@ -28,16 +31,35 @@ from hidamari.commons import (
     PLAYLIST_KEY_MONITORS,
     PLAYLIST_KEY_VIDEOS,
     PLAYLIST_MODE_PER_MONITOR,
-    PLAYLIST_PATH,
     PLAYLIST_TEMPLATE,
-    PLAYLIST_VERSION,
     TRANSLATION_DOMAIN,
     VIDEO_WALLPAPER_DIR,
 )
-from hidamari.monitor import Monitors
+from hidamari.monitor import MonitorInfo
 
 logger = logging.getLogger(LOGGER_NAME)
 
+# Process-wide cache of config.json: the last config read or written, and the
+# (mtime_ns, inode, size) of the file it corresponds to. See ConfigUtil.load().
+_config_cache = {"stat": None, "config": None}
+# Reentrant: loading may save (migrations). Shared with the persistence lock, so the
+# two are always taken in the same order.
+_config_lock = persistence.process_lock
+# Keys waiting for ConfigUtil.save_later() to merge them into config.json
+_unsaved_config = {}
+# The last document PlaylistUtil.load() built: from which playlist_store.load_all()
+# result, reconciled with which monitor names
+_playlist_cache = {"playlists": None, "monitors": None, "document": None}
+_playlist_lock = persistence.process_lock
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
 
 def init_translations(localedir):
     """Bind the gettext text domain for the current process.
@@ -126,16 +148,49 @@ def setup_autostart(autostart):
             os.remove(AUTOSTART_DESKTOP_PATH)
 
 
-def get_video_paths():
-    file_list = []
-    for filename in os.listdir(VIDEO_WALLPAPER_DIR):
-        filepath = os.path.join(VIDEO_WALLPAPER_DIR, filename)
-        file = Gio.file_new_for_path(filepath)
-        info = file.query_info("standard::content-type", Gio.FileQueryInfoFlags.NONE, None)
-        mime_type = info.get_content_type()
-        if "video" in mime_type:
-            file_list.append(filepath)
-    return sorted(file_list)
+def get_video_paths(directory=VIDEO_WALLPAPER_DIR, full_rescan=False):
+    """
+    Sorted paths of the videos in `directory` and its subfolders, from the library
+    index. `full_rescan` also notices files replaced in place, see library.scan().
+    """
+    if full_rescan:
+        library.scan(directory, full=True)
+    return library.get_videos(directory)
+
+
+def get_video_paths_async(on_done: callable, directory=VIDEO_WALLPAPER_DIR, full_rescan=False):
+    """
+    get_video_paths() on a worker thread, as the rescan may take a while on a large or
+    slow folder. `on_done(paths)` is then called on the main loop.
+    """
+
+    def run():
+        try:
+            paths = get_video_paths(directory, full_rescan)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"[Library] Can't list the videos of {directory}: {e}")
+            return
+        GLib.idle_add(on_done, paths)
+
+    threading.Thread(target=run, name="hidamari-library-scan", daemon=True).start()
+
+
+def to_variant_dict(values: dict):
+    """Wrap plain values into GLib.Variant for an `a{sv}` D-Bus argument"""
+    variants = {}
+    for key, value in values.items():
+        # bool is a subclass of int, check it first
+        if isinstance(value, bool):
+            variants[key] = GLib.Variant("b", value)
+        elif isinstance(value, int):
+            variants[key] = GLib.Variant("i", value)
+        elif isinstance(value, float):
+            variants[key] = GLib.Variant("d", value)
+        elif isinstance(value, str):
+            variants[key] = GLib.Variant("s", value)
+        else:
+            raise TypeError(f"Unsupported setting type {type(value).__name__} for {key}")
+    return variants
 
 
 """
@@ -167,6 +222,7 @@ def gnome_extension_is_installed(extension_name: str):
     return extension_name in installed.keys()
 
 
+@trace.traced()
 def gnome_desktop_icon_workaround():
     """
     Workaround for GNOME desktop icon extensions not displaying the icons on top of Hidamari.
@@ -374,10 +430,19 @@ class WindowHandler:
         self.window_signal_handlers.clear()
 
 
+def config_template():
+    """A copy of CONFIG_TEMPLATE with a data source for every connected monitor"""
+    template = copy.deepcopy(CONFIG_TEMPLATE)
+    data_sources = {name: "" for name in MonitorInfo.names()}
+    data_sources["Default"] = ""
+    template[CONFIG_KEY_DATA_SOURCE] = data_sources
+    return template
+
+
 class ConfigUtil:
     def generate_template(self):
         os.makedirs(CONFIG_DIR, exist_ok=True)
-        self.save(CONFIG_TEMPLATE)
+        self.save(config_template())
 
     @staticmethod
     def _check(config: dict):
@@ -389,12 +454,28 @@ class ConfigUtil:
     def _invalid(self):
         logger.debug("[Config] Invalid. A new config will be generated.")
         self.generate_template()
-        return CONFIG_TEMPLATE
+        return config_template()
+
+    @staticmethod
+    def _cache(config: dict):
+        _config_cache["stat"] = _stat_key(CONFIG_PATH)
+        _config_cache["config"] = copy.deepcopy(config)
+
+    @staticmethod
+    def _log(action: str, config: dict):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logs = []
+        logs.append("--------- Config ---------")
+        logs.append(pformat(config, indent=3))
+        logs.append("--------------------------")
+        logs_str = "\n".join(logs)
+        logger.debug(f"[Config] {action} {CONFIG_PATH}\n{logs_str}")
 
     def _migrateV3To4(self, config: dict):
         logger.debug("[Config] Migration from version 3 to 4.")
         curr_data_source = config["data_source"]
-        config["data_source"] = CONFIG_TEMPLATE[CONFIG_KEY_DATA_SOURCE]
+        config["data_source"] = config_template()[CONFIG_KEY_DATA_SOURCE]
         config["data_source"]["Default"] = curr_data_source
         config["is_pause_when_maximized"] = config["is_detect_maximized"]
         del config["is_detect_maximized"]
@@ -451,7 +532,28 @@ class ConfigUtil:
         self.save(config)
         return config
 
+    def _migrateV5ToV6(self, config: dict):
+        logger.debug("[Config] Migration from version 5 to 6.")
+        config[CONFIG_KEY_STANDBY_PLAYER] = CONFIG_TEMPLATE[CONFIG_KEY_STANDBY_PLAYER]
+        config["version"] = 6
+        # save config file
+        self.save(config)
+        return config
+
+    @trace.traced("ConfigUtil.load")
     def load(self):
+        """
+        Load the config. It's parsed (and migrated and checked) only when config.json
+        changed since it was last read or written by this process, otherwise it comes from
+        the cache. Returns a copy, which the caller is free to modify.
+        """
+        with _config_lock:
+            stat_key = _stat_key(CONFIG_PATH)
+            if stat_key is not None and stat_key == _config_cache["stat"]:
+                return copy.deepcopy(_config_cache["config"])
+            return copy.deepcopy(self._parse())
+
+    def _parse(self):
         if os.path.isfile(CONFIG_PATH):
             with open(CONFIG_PATH) as f:
                 json_str = f.read()
@@ -465,141 +567,122 @@ class ConfigUtil:
                     if config.get("version") <= 4 and CONFIG_VERSION >= 5:
                         config = self._migrateV4ToV5(config)
 
+                    # migration to version 6 for adding new key
+                    if config.get("version") <= 5 and CONFIG_VERSION >= 6:
+                        config = self._migrateV5ToV6(config)
+
                     self._checkDefaultSource(config)
-                    self._checkMissingMonitors(config, CONFIG_TEMPLATE)
+                    self._checkMissingMonitors(config, config_template())
                     if self._check(config):
-                        logs = []
-                        logs.append("--------- Config ---------")
-                        logs.append(pformat(config, indent=3))
-                        logs.append("--------------------------")
-                        logs_str = "\n".join(logs)
-                        logger.debug(f"[Config] Loaded {CONFIG_PATH}\n{logs_str}")
+                        self._log("Loaded", config)
+                        self._cache(config)
                         return config
                 except json.decoder.JSONDecodeError:
                     logger.debug("[Config] JSONDecodeError")
         return self._invalid()
 
     def save(self, config):
-        old_config = None
-        if os.path.isfile(CONFIG_PATH):
-            with open(CONFIG_PATH) as f:
-                json_str = f.read()
-                try:
-                    old_config = json.loads(json_str)
-                    if not self._check(old_config):
-                        old_config = None
-                except json.decoder.JSONDecodeError:
-                    old_config = None
-        # Skip if the config is identical
-        if old_config == config:
-            return
-        with open(CONFIG_PATH, "w") as f:
-            json_str = json.dumps(config, indent=3)
-            print(json_str, file=f)
-            logs = []
-            logs.append("--------- Config ---------")
-            logs.append(pformat(config, indent=3))
-            logs.append("--------------------------")
-            logs_str = "\n".join(logs)
-            logger.debug(f"[Config] Saved {CONFIG_PATH}\n{logs_str}")
+        """Write the config now (atomically). Supersedes a pending `save_later()`."""
+        with persistence.locked():
+            # This process's whole config, so it has the unsaved keys too
+            persistence.discard(CONFIG_PATH)
+            _unsaved_config.clear()
+            # Skip if the config is identical to the cached one, and the file wasn't
+            # changed by another process since
+            stat_key = _stat_key(CONFIG_PATH)
+            if stat_key is not None and stat_key == _config_cache["stat"]:
+                if _config_cache["config"] == config:
+                    return
+            persistence.atomic_write(CONFIG_PATH, json.dumps(config, indent=3) + "\n")
+            self._cache(config)
+            self._log("Saved", config)
+
+    def save_later(self, changes: dict, delay_sec=persistence.WRITE_BEHIND_DELAY_SEC):
+        """
+        Merge `changes` (some keys of the config) into config.json in the background;
+        bursts collapse into one write. The file is read again right before, so the keys
+        other processes changed meanwhile are kept.
+        """
+        with _config_lock:
+            _unsaved_config.update(copy.deepcopy(changes))
+            persistence.save_later(CONFIG_PATH, self._write_unsaved, delay_sec)
+
+    def _write_unsaved(self):
+        # Runs on the write-behind thread (or in persistence.flush())
+        with persistence.locked():
+            changes = dict(_unsaved_config)
+            if not changes:
+                return
+            config = self.load()
+            config.update(changes)
+            self.save(config)
 
 class PlaylistUtil:
-    def generate_template(self):
-        os.makedirs(CONFIG_DIR, exist_ok=True)
-        self.save(PLAYLIST_TEMPLATE)
-        
-    @staticmethod
-    def _check(playlist: dict):
-        """Check if the playlist is valid"""
-        is_all_keys_match = all(key in playlist for key in PLAYLIST_TEMPLATE)
-        is_version_match = playlist.get("version") == PLAYLIST_VERSION
-        return is_all_keys_match and is_version_match
-
-    def _invalid(self):
-        logger.debug(f"[Playlist] Invalid. A new playlist will be generated.")
-        self.generate_template()
-        playlist = PLAYLIST_TEMPLATE
-        playlist = self._load_monitors(playlist) # ensure monitors are loaded
-        return playlist
-    
-    def _load_monitors(self, playlist: dict):
-        monitors = Monitors()
-        monitor_names = monitors.get_monitors()
+    """
+    Playlists as a document: {"version", "playlists": {name: {mode, monitors, videos}}}.
+    They are stored by playlist_store. Loading never writes, the monitors missing from
+    a playlist are filled in on the loaded document only, and only when the playlists
+    or the connected monitors changed.
+    """
 
+    @staticmethod
+    def _reconcile(playlist: dict, monitor_names):
+        """Fill in the defaults and the monitors missing from every playlist, in place"""
         for pl_name, pl_data in playlist.get("playlists", {}).items():
             pl_data.setdefault(PLAYLIST_KEY_MODE, PLAYLIST_MODE_PER_MONITOR)
             pl_data.setdefault(PLAYLIST_KEY_VIDEOS, [])
             pl_monitors = pl_data.setdefault(PLAYLIST_KEY_MONITORS, {})
             for monitor in monitor_names:
                 if monitor not in pl_monitors:
-                    logger.info(f"[Playlist] Adding missing monitor '{monitor}' to playlist '{pl_name}'.")
+                    logger.debug(f"[Playlist] Adding missing monitor '{monitor}' to playlist '{pl_name}'.")
                     pl_monitors[monitor] = []
 
-        self.save(playlist)
-        return playlist
-
-    def _migrateV1ToV2(self, playlist: dict):
-        """
-        v1 stored each playlist as a flat {monitor: [videos]} dict. v2 wraps it with a
-        'mode' (PER_MONITOR/ALL) so a playlist can also be evenly distributed across all
-        monitors instead of manually assigned per monitor.
-        """
-        logger.debug(f"[Playlist] Migration from version 1 to 2.")
-        old_playlists = playlist.get("playlists", {})
-        new_playlists = {}
-        for name, pl_monitors in old_playlists.items():
-            new_playlists[name] = {
-                PLAYLIST_KEY_MODE: PLAYLIST_MODE_PER_MONITOR,
-                PLAYLIST_KEY_MONITORS: pl_monitors,
-                PLAYLIST_KEY_VIDEOS: [],
-            }
-        playlist["playlists"] = new_playlists
-        playlist["version"] = 2
-        self.save(playlist)
-        return playlist
-
+    @trace.traced("PlaylistUtil.load")
     def load(self):
-        if os.path.isfile(PLAYLIST_PATH):
-            with open(PLAYLIST_PATH, "r") as f:
-                json_str = f.read()
-                try:
-                    playlist = json.loads(json_str)
-                    if playlist.get("version", 1) <= 1 and PLAYLIST_VERSION >= 2:
-                        playlist = self._migrateV1ToV2(playlist)
-                    self._load_monitors(playlist) # add missing monitors to playlists if exists
-                    if self._check(playlist):
-                        logs = []
-                        logs.append("--------- Playlist ---------")
-                        logs.append(pformat(playlist, indent=3))
-                        logs.append("--------------------------")
-                        logs_str = "\n".join(logs)
-                        logger.debug(
-                            f"[Playlist] Loaded {PLAYLIST_PATH}\n{logs_str}")
-                        return playlist
-                except json.decoder.JSONDecodeError:
-                    logger.debug(f"[Playlist] JSONDecodeError")
-        return self._invalid()
+        """Load all playlists. Returns a copy, which the caller is free to modify."""
+        with _playlist_lock:
+            playlists = playlist_store.load_all()
+            monitor_names = MonitorInfo.names()
+            if (
+                _playlist_cache["playlists"] is not playlists
+                or _playlist_cache["monitors"] != monitor_names
+            ):
+                document = copy.deepcopy(PLAYLIST_TEMPLATE)
+                document["playlists"] = copy.deepcopy(playlists)
+                self._reconcile(document, monitor_names)
+                _playlist_cache.update(
+                    playlists=playlists, monitors=monitor_names, document=document
+                )
+            return copy.deepcopy(_playlist_cache["document"])
 
     def save(self, playlist):
-        old_playlist = None
-        if os.path.isfile(PLAYLIST_PATH):
-            with open(PLAYLIST_PATH, "r") as f:
-                json_str = f.read()
-                try:
-                    old_playlist = json.loads(json_str)
-                    if not self._check(old_playlist):
-                        old_playlist = None
-                except json.decoder.JSONDecodeError:
-                    old_playlist = None
-        # Skip if the config is identical
-        if old_playlist == playlist:
-            return
-        with open(PLAYLIST_PATH, "w") as f:
-            json_str = json.dumps(playlist, indent=3)
-            print(json_str, file=f)
-            logs = []
-            logs.append("--------- Playlist ---------")
-            logs.append(pformat(playlist, indent=3))
-            logs.append("--------------------------")
-            logs_str = "\n".join(logs)
-            logger.debug(f"[Config] Saved {CONFIG_PATH}\n{logs_str}")
\ No newline at end of file
+        """Replace all playlists with the ones of the document `playlist`"""
+        playlist_store.replace_all(playlist["playlists"])
+
+    def upsert_playlist(self, name: str, data: dict):
+        """Add or replace the playlist `name`"""
+        playlist_store.upsert(name, data)
+
+    def update_playlist(self, name: str, changes: dict):
+        """Apply the partial playlist `changes` (mode, some of its lists or their edits) to `name`"""
+        playlist_store.update(name, changes)
+
+    def entry_ids(self, name: str):
+        """{monitor: [entry id]} of the playlist `name`, which its edits refer to"""
+        return playlist_store.entry_ids(name)
+
+    def delete_playlist(self, name: str):
+        """Delete the playlist `name`, if there is one"""
+        playlist_store.delete(name)
+
+    def rename_playlist(self, name: str, new_name: str):
+        """Rename the playlist `name`. Raises ValueError if `new_name` is taken."""
+        playlist_store.rename(name, new_name)
+
+    def import_json(self, path):
+        """Replace all playlists with the ones of a (v1/v2) JSON backup"""
+        playlist_store.import_json(path)
+
+    def export_json(self, path):
+        """Back up all playlists to a JSON document"""
+        playlist_store.export_json(path)
@@ -0,0 +1,125 @@
+"""
+What each child process imports.
+
+Children are started with the `spawn` method: a fresh interpreter that imports the module
+of its Process target and, through `python -m hidamari`, `__main__`. None of these may
+load GTK, WebKit2 or VLC, or every child pays for all of them.
+"""
+
+import ast
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+HEAVY_MODULES = ("gi.repository.Gtk", "gi.repository.WebKit2", "vlc")
+
+ENTRY_MODULES = (
+    "hidamari.entry.gui",
+    "hidamari.entry.systray",
+    "hidamari.entry.video_player",
+    "hidamari.entry.web_player",
+)
+# Imported by every child as well, through `__main__` and the standby target
+SERVER_MODULES = ("hidamari.__main__", "hidamari.server", "hidamari.player.standby")
+
+_SCRIPT = """
+import importlib, json, sys
+importlib.import_module(sys.argv[2])
+print(json.dumps([name for name in json.loads(sys.argv[1]) if name in sys.modules]))
+"""
+
+
+def loaded_heavy_modules(module):
+    """The HEAVY_MODULES a fresh interpreter has loaded after importing `module`"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    output = subprocess.check_output(
+        [sys.executable, "-c", _SCRIPT, json.dumps(HEAVY_MODULES), module],
+        env=env,
+        encoding="UTF-8",
+        timeout=60,
+    )
+    return set(json.loads(output))
+
+
+def _module_path(name):
+    """Source file of a hidamari module, or None for anything outside the package"""
+    if name != "hidamari" and not name.startswith("hidamari."):
+        return None
+    base = os.path.join(SRC_DIR, *name.split("."))
+    for path in (base + ".py", os.path.join(base, "__init__.py")):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _import_time_names(tree, package):
+    """Modules named by the import statements that run when the module is imported"""
+    body = list(tree.body)
+    while body:
+        node = body.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package.rsplit(".", node.level - 1)[0]
+                module = f"{base}.{node.module}" if node.module else base
+            else:
+                # The GUI's `from commons import ...` is followed by its
+                # `from hidamari.commons import ...` fallback, which is what counts
+                module = node.module
+            yield module
+            yield from (f"{module}.{alias.name}" for alias in node.names)
+        else:
+            body.extend(ast.iter_child_nodes(node))
+
+
+def import_time_modules(module):
+    """Every module importing `module` loads, as far as the sources tell"""
+    seen = set()
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if "." in name:
+            # Importing a submodule runs its package first
+            pending.append(name.rpartition(".")[0])
+        path = _module_path(name)
+        if path is None:
+            continue
+        with open(path, encoding="UTF-8") as f:
+            tree = ast.parse(f.read(), path)
+        package = name if path.endswith("__init__.py") else name.rpartition(".")[0]
+        pending.extend(_import_time_names(tree, package))
+    return seen
+
+
+class EntryImportTest(unittest.TestCase):
+    def test_entry_modules(self):
+        """Process targets import their actual code only once the child runs them"""
+        for module in ENTRY_MODULES:
+            with self.subTest(module=module):
+                self.assertEqual(loaded_heavy_modules(module), set())
+
+    def test_server_modules(self):
+        # Read from the sources, these need PyGObject and pydbus to import
+        for module in SERVER_MODULES:
+            with self.subTest(module=module):
+                self.assertEqual(import_time_modules(module) & set(HEAVY_MODULES), set())
+
+    def test_import_time_modules(self):
+        """The source walk sees what the toolkit modules do load"""
+        self.assertIn("vlc", import_time_modules("hidamari.player.video_player"))
+        self.assertIn("gi.repository.WebKit2", import_time_modules("hidamari.player.web_player"))
+        self.assertIn("gi.repository.Gtk", import_time_modules("hidamari.gui.control"))
+
+
+if __name__ == "__main__":
+    unittest.main()
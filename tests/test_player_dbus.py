@@ -0,0 +1,106 @@
+"""
+The player's D-Bus object, as the server's PlayerProxy sees it.
+
+Runs a real video player on a private session bus (`dbus-run-session`), so it needs a
+display besides GTK 3, pydbus and python-vlc.
+"""
+
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from test_entry_imports import SRC_DIR
+
+_SCRIPT = """
+import json, subprocess, sys, time
+from gi.repository import Gio, GLib
+from hidamari.commons import DBUS_INTERFACE_PLAYER, DBUS_NAME_PLAYER
+from hidamari.player_proxy import DBUS_INTERFACE_PROPERTIES, PLAYER_OBJECT_PATH
+
+def call(name, path, interface, method, parameters):
+    return con.call_sync(
+        name, path, interface, method, parameters, None, Gio.DBusCallFlags.NONE, 10000, None
+    ).unpack()
+
+con = Gio.bus_get_sync(Gio.BusType.SESSION)
+player = subprocess.Popen(
+    [sys.executable, "-c", "from hidamari.entry.video_player import main; main()"]
+)
+try:
+    deadline = time.monotonic() + 30
+    while not call(
+        "org.freedesktop.DBus", "/org/freedesktop/DBus", "org.freedesktop.DBus",
+        "NameHasOwner", GLib.Variant("(s)", (DBUS_NAME_PLAYER,)),
+    )[0]:
+        if time.monotonic() > deadline or player.poll() is not None:
+            sys.exit("The player didn't publish itself")
+        time.sleep(0.1)
+    (properties,) = call(
+        DBUS_NAME_PLAYER, PLAYER_OBJECT_PATH, DBUS_INTERFACE_PROPERTIES,
+        "GetAll", GLib.Variant("(s)", (DBUS_INTERFACE_PLAYER,)),
+    )
+    print(json.dumps(properties))
+finally:
+    player.terminate()
+    player.wait(10)
+"""
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def has_typelib(namespace, version):
+    if not has_module("gi"):
+        return False
+    import gi
+
+    try:
+        gi.require_version(namespace, version)
+    except ValueError:
+        return False
+    return True
+
+
+@unittest.skipUnless(
+    shutil.which("dbus-run-session")
+    and os.environ.get("DISPLAY")
+    and has_typelib("Gtk", "3.0")
+    and has_module("pydbus")
+    and has_module("vlc"),
+    "needs dbus-run-session, a display, GTK 3, pydbus and python-vlc",
+)
+class PlayerDBusTest(unittest.TestCase):
+    def test_get_all(self):
+        """GetAll is what PlayerProxy mirrors when the player appears"""
+        with tempfile.TemporaryDirectory() as home:
+            env = dict(
+                os.environ,
+                PYTHONPATH=SRC_DIR,
+                GDK_BACKEND="x11",
+                XDG_CONFIG_HOME=os.path.join(home, "config"),
+                XDG_CACHE_HOME=os.path.join(home, "cache"),
+            )
+            result = subprocess.run(
+                ["dbus-run-session", "--", sys.executable, "-c", _SCRIPT],
+                env=env,
+                capture_output=True,
+                encoding="UTF-8",
+                timeout=90,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        properties = json.loads(result.stdout.splitlines()[-1])
+        self.assertEqual(
+            set(properties), {"mode", "volume", "is_mute", "is_playing", "is_paused_by_user"}
+        )
+        self.assertIs(properties["is_playing"], True)
+        self.assertIs(properties["is_paused_by_user"], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
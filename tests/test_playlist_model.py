@@ -0,0 +1,211 @@
+"""
+PlaylistDraft, the edit model of the playlist view.
+"""
+
+import sys
+import unittest
+
+from test_entry_imports import SRC_DIR
+
+sys.path.insert(0, SRC_DIR)
+
+from hidamari.commons import (
+    PLAYLIST_KEY_EDITS,
+    PLAYLIST_KEY_MODE,
+    PLAYLIST_KEY_MONITORS,
+    PLAYLIST_KEY_VIDEOS,
+    PLAYLIST_MODE_ALL,
+    PLAYLIST_MODE_PER_MONITOR,
+)
+from hidamari.gui.playlist_model import ALL, PlaylistDraft
+
+MONITOR = "HDMI-1"
+
+
+def draft_of(*videos, shared=()):
+    """A draft of a stored playlist with `videos` on MONITOR and entry ids 1, 2, ..."""
+    stored = {
+        PLAYLIST_KEY_MODE: PLAYLIST_MODE_PER_MONITOR,
+        PLAYLIST_KEY_MONITORS: {MONITOR: list(videos)},
+        PLAYLIST_KEY_VIDEOS: list(shared),
+    }
+    entry_ids = {
+        MONITOR: list(range(1, len(videos) + 1)),
+        ALL: list(range(101, len(shared) + 101)),
+    }
+    return PlaylistDraft(stored, [MONITOR], entry_ids)
+
+
+class PlaylistDraftTest(unittest.TestCase):
+    def test_batch_insert_undo_redo(self):
+        draft = draft_of("a", "b")
+        self.assertTrue(draft.add(MONITOR, ["c", "a", "d", "c"]))
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c", "d"])
+        self.assertTrue(draft.is_dirty)
+
+        # One undo step for the whole batch
+        self.assertTrue(draft.undo())
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b"])
+        self.assertFalse(draft.is_dirty)
+        self.assertFalse(draft.contains(MONITOR, "c"))
+        self.assertFalse(draft.undo())
+
+        self.assertTrue(draft.redo())
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c", "d"])
+        self.assertTrue(draft.contains(MONITOR, "d"))
+        self.assertFalse(draft.redo())
+
+    def test_add_nothing_new(self):
+        draft = draft_of("a")
+        self.assertFalse(draft.add(MONITOR, ["a"]))
+        self.assertFalse(draft.is_dirty)
+
+    def test_remove_undo(self):
+        draft = draft_of("a", "b", "c", "d")
+        draft.remove(MONITOR, [3, 1, 5])
+        self.assertEqual(draft.get_list(MONITOR), ["a", "c"])
+        draft.undo()
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c", "d"])
+
+    def test_move_at_the_ends(self):
+        draft = draft_of("a", "b", "c")
+        # Nothing to move past either end
+        self.assertFalse(draft.move(MONITOR, [0], -1))
+        self.assertFalse(draft.move(MONITOR, [2], 1))
+
+        self.assertTrue(draft.move(MONITOR, [0], 1))
+        self.assertEqual(draft.get_list(MONITOR), ["b", "a", "c"])
+        self.assertTrue(draft.move(MONITOR, [2], -1))
+        self.assertEqual(draft.get_list(MONITOR), ["b", "c", "a"])
+
+        draft.undo()
+        draft.undo()
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c"])
+
+    def test_move_selection(self):
+        draft = draft_of("a", "b", "c", "d")
+        self.assertTrue(draft.move(MONITOR, [1, 2], -1))
+        self.assertEqual(draft.get_list(MONITOR), ["b", "c", "a", "d"])
+        self.assertTrue(draft.move(MONITOR, [0, 1], 1))
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c", "d"])
+
+    def test_reorder_round_trip(self):
+        original = ["a", "b", "c", "d", "e"]
+        orders = (
+            ["b", "c", "d", "a", "e"],  # a dragged right
+            ["a", "e", "b", "c", "d"],  # e dragged left
+            ["e", "d", "c", "b", "a"],
+            ["a", "b", "c", "d", "e"],
+        )
+        for order in orders:
+            with self.subTest(order=order):
+                draft = draft_of(*original)
+                self.assertEqual(draft.reorder(MONITOR, order), order != original)
+                self.assertEqual(draft.get_list(MONITOR), order)
+                draft.undo()
+                self.assertEqual(draft.get_list(MONITOR), original)
+                draft.redo()
+                self.assertEqual(draft.get_list(MONITOR), order)
+
+    def test_reorder_single_drag_is_one_move(self):
+        draft = draft_of("a", "b", "c", "d")
+        draft.reorder(MONITOR, ["b", "c", "a", "d"])
+        self.assertEqual(draft.delta()[PLAYLIST_KEY_EDITS][MONITOR], [("move", 1, 3, 4)])
+
+    def test_deduplicate(self):
+        draft = draft_of("a", "b", "a", "c", "b", "a", shared=["x", "x"])
+        self.assertTrue(draft.deduplicate())
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "c"])
+        self.assertEqual(draft.get_list(ALL), ["x"])
+        self.assertFalse(draft.deduplicate())
+
+        draft.undo()
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "a", "c", "b", "a"])
+        self.assertEqual(draft.get_list(ALL), ["x", "x"])
+
+    def test_remove_missing(self):
+        draft = draft_of("a", "gone", "b", shared=["gone"])
+        self.assertTrue(draft.remove_missing(lambda path: path != "gone"))
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b"])
+        self.assertEqual(draft.get_list(ALL), [])
+
+    def test_delta(self):
+        draft = draft_of("a", "b", "c")
+        self.assertEqual(draft.delta(), {})
+
+        draft.add(MONITOR, ["d", "e"])
+        draft.remove(MONITOR, [0])
+        draft.set_mode(PLAYLIST_MODE_ALL)
+        self.assertEqual(
+            draft.delta(),
+            {
+                PLAYLIST_KEY_MODE: PLAYLIST_MODE_ALL,
+                PLAYLIST_KEY_EDITS: {
+                    MONITOR: [("insert", 3, None, [(-1, "d"), (-2, "e")]), ("remove", [1])]
+                },
+            },
+        )
+
+    def test_delta_after_undo_and_redo(self):
+        draft = draft_of("a", "b", "c")
+        draft.add(MONITOR, ["d"])
+        draft.move(MONITOR, [3], -1)
+        draft.set_mode(PLAYLIST_MODE_ALL)
+
+        draft.undo()
+        draft.undo()
+        # Only what is left on the undo history
+        self.assertEqual(
+            draft.delta(), {PLAYLIST_KEY_EDITS: {MONITOR: [("insert", 3, None, [(-1, "d")])]}}
+        )
+        draft.undo()
+        self.assertEqual(draft.delta(), {})
+
+        draft.redo()
+        draft.redo()
+        self.assertEqual(
+            draft.delta(),
+            {PLAYLIST_KEY_EDITS: {MONITOR: [("insert", 3, None, [(-1, "d")]), ("move", -1, 2, 3)]}},
+        )
+        self.assertEqual(draft.get_list(MONITOR), ["a", "b", "d", "c"])
+
+    def test_delta_of_an_edit_then_its_inverse(self):
+        """Undoing by hand is not undo: both edits are sent"""
+        draft = draft_of("a", "b")
+        draft.move(MONITOR, [0], 1)
+        draft.move(MONITOR, [1], -1)
+        self.assertEqual(
+            draft.delta()[PLAYLIST_KEY_EDITS][MONITOR],
+            [("move", 1, 2, None), ("move", 1, None, 2)],
+        )
+
+    def test_delta_without_entry_ids(self):
+        """Lists whose entry ids are unknown are sent whole"""
+        stored = {
+            PLAYLIST_KEY_MODE: PLAYLIST_MODE_PER_MONITOR,
+            PLAYLIST_KEY_MONITORS: {MONITOR: ["a", "b"]},
+            PLAYLIST_KEY_VIDEOS: ["x"],
+        }
+        draft = PlaylistDraft(stored, [MONITOR], {ALL: [7]})
+        draft.add(MONITOR, ["c"])
+        draft.add(ALL, ["y"])
+        self.assertEqual(
+            draft.delta(),
+            {
+                PLAYLIST_KEY_MONITORS: {MONITOR: ["a", "b", "c"]},
+                PLAYLIST_KEY_EDITS: {ALL: [("insert", 7, None, [(-1, "y")])]},
+            },
+        )
+
+    def test_stored_playlist_is_not_modified(self):
+        videos = ["a", "b"]
+        stored = {PLAYLIST_KEY_MONITORS: {MONITOR: videos}, PLAYLIST_KEY_VIDEOS: []}
+        draft = PlaylistDraft(stored, [MONITOR])
+        draft.add(MONITOR, ["c"])
+        draft.remove(MONITOR, [0])
+        self.assertEqual(videos, ["a", "b"])
+        self.assertEqual(draft.to_dict()[PLAYLIST_KEY_MONITORS][MONITOR], ["b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+"""
+The SQLite playlist store, on a database in a temporary CONFIG_DIR.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from test_entry_imports import SRC_DIR
+
+sys.path.insert(0, SRC_DIR)
+
+from hidamari import playlist_store
+from hidamari.commons import (
+    PLAYLIST_KEY_EDITS,
+    PLAYLIST_KEY_MODE,
+    PLAYLIST_KEY_MONITORS,
+    PLAYLIST_KEY_VIDEOS,
+    PLAYLIST_MODE_ALL,
+    PLAYLIST_MODE_PER_MONITOR,
+)
+from hidamari.gui.playlist_model import ALL, PlaylistDraft
+
+MONITOR = "HDMI-1"
+
+
+def playlist(videos=(), mode=PLAYLIST_MODE_PER_MONITOR, **monitors):
+    return {
+        PLAYLIST_KEY_MODE: mode,
+        PLAYLIST_KEY_MONITORS: {name.replace("_", "-"): list(v) for name, v in monitors.items()},
+        PLAYLIST_KEY_VIDEOS: list(videos),
+    }
+
+
+class PlaylistStoreTest(unittest.TestCase):
+    def setUp(self):
+        config_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(config_dir.cleanup)
+        self.config_dir = config_dir.name
+        patcher = mock.patch.multiple(
+            playlist_store,
+            CONFIG_DIR=self.config_dir,
+            PLAYLIST_DB_PATH=os.path.join(self.config_dir, "playlist.db"),
+            PLAYLIST_PATH=os.path.join(self.config_dir, "playlist.json"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._close)
+
+    @staticmethod
+    def _close():
+        conn = getattr(playlist_store._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            del playlist_store._local.conn
+
+    def videos(self, name="p", monitor=MONITOR):
+        return playlist_store.load_all()[name][PLAYLIST_KEY_MONITORS].get(monitor, [])
+
+    def ids(self, name="p", monitor=MONITOR):
+        return playlist_store.entry_ids(name).get(monitor, [])
+
+    def edit(self, *edits, name="p", monitor=MONITOR):
+        playlist_store.update(name, {PLAYLIST_KEY_EDITS: {monitor: list(edits)}})
+
+    def test_insert(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["b", "d"]))
+        b, d = self.ids()
+        self.edit(
+            ("insert", None, b, [(-1, "a")]),
+            ("insert", b, d, [(-2, "c1"), (-3, "c2")]),
+            ("insert", d, None, [(-4, "e")]),
+        )
+        self.assertEqual(self.videos(), ["a", "b", "c1", "c2", "d", "e"])
+        # Existing entries keep their ids
+        self.assertEqual(self.ids()[1], b)
+        self.assertEqual(self.ids()[4], d)
+
+    def test_insert_next_to_new_entries(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["a"]))
+        (a,) = self.ids()
+        self.edit(("insert", a, None, [(-1, "c")]), ("insert", a, -1, [(-2, "b")]))
+        self.assertEqual(self.videos(), ["a", "b", "c"])
+
+    def test_insert_into_empty_list(self):
+        playlist_store.upsert("p", playlist())
+        self.edit(("insert", None, None, [(-1, "a"), (-2, "b")]))
+        self.assertEqual(self.videos(), ["a", "b"])
+
+    def test_remove(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["a", "b", "c", "b"]))
+        ids = self.ids()
+        self.edit(("remove", [ids[1], ids[2]]))
+        self.assertEqual(self.videos(), ["a", "b"])
+        self.assertEqual(self.ids(), [ids[0], ids[3]])
+
+    def test_move(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["a", "b", "c", "d"]))
+        a, b, c, d = self.ids()
+        self.edit(("move", a, c, d))
+        self.assertEqual(self.videos(), ["b", "c", "a", "d"])
+        self.edit(("move", d, None, b))
+        self.assertEqual(self.videos(), ["d", "b", "c", "a"])
+        self.edit(("move", b, a, None))
+        self.assertEqual(self.videos(), ["d", "c", "a", "b"])
+        self.assertEqual(self.ids(), [d, c, a, b])
+
+    def test_edits_skip_entries_that_are_gone(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["a", "b", "c"]))
+        a, b, c = self.ids()
+        self.edit(("remove", [c]))
+        self.edit(("move", c, None, a), ("remove", [c]), ("insert", c, None, [(-1, "d")]))
+        self.assertEqual(self.videos(), ["a", "b", "d"])
+
+    def test_renumber_when_crowded(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["first", "last"]))
+        first, after = self.ids()
+        # Halves the gap after "first" every time, until there's no room left
+        for i in range(100):
+            self.edit(("insert", first, after, [(-1, str(i))]))
+            after = self.ids()[1]
+        self.assertEqual(self.videos(), ["first", *map(str, reversed(range(100))), "last"])
+        positions = [
+            position
+            for (position,) in playlist_store.connect().execute(
+                "SELECT position FROM entries ORDER BY position"
+            )
+        ]
+        self.assertEqual(len(set(positions)), len(positions))
+
+    def test_modes_and_whole_lists(self):
+        playlist_store.upsert("p", playlist(["a"], HDMI_1=["b"], DP_1=["c"]))
+        playlist_store.update(
+            "p", {PLAYLIST_KEY_MODE: PLAYLIST_MODE_ALL, PLAYLIST_KEY_VIDEOS: ["x", "y"]}
+        )
+        self.assertEqual(
+            playlist_store.load_all()["p"],
+            playlist(["x", "y"], PLAYLIST_MODE_ALL, HDMI_1=["b"], DP_1=["c"]),
+        )
+        with self.assertRaises(KeyError):
+            playlist_store.update("q", {PLAYLIST_KEY_MODE: PLAYLIST_MODE_ALL})
+
+    def test_draft_delta(self):
+        """Random draft edits, saved as their delta, give the draft's lists"""
+        rng = random.Random(0)
+        paths = [f"/videos/{i}.mp4" for i in range(30)]
+        playlist_store.upsert("p", playlist(rng.sample(paths, 5), HDMI_1=rng.sample(paths, 8)))
+        for _save in range(20):
+            stored = playlist_store.load_all()["p"]
+            draft = PlaylistDraft(stored, [MONITOR], playlist_store.entry_ids("p"))
+            for _edit in range(rng.randrange(1, 8)):
+                key = rng.choice([MONITOR, ALL])
+                length = len(draft.get_list(key))
+                action = rng.randrange(5)
+                if action == 0:
+                    draft.add(key, rng.sample(paths, 3))
+                elif action == 1 and length:
+                    draft.remove(key, rng.sample(range(length), rng.randint(1, length)))
+                elif action == 2 and length:
+                    draft.move(
+                        key, rng.sample(range(length), rng.randint(1, length)), rng.choice([-1, 1])
+                    )
+                elif action == 3:
+                    draft.reorder(key, rng.sample(draft.get_list(key), length))
+                elif action == 4:
+                    draft.undo()
+            delta = draft.delta()
+            # Edits only, no whole lists
+            self.assertLessEqual(set(delta), {PLAYLIST_KEY_EDITS})
+            playlist_store.update("p", delta)
+            stored = playlist_store.load_all()["p"]
+            self.assertEqual(stored[PLAYLIST_KEY_VIDEOS], draft.get_list(ALL))
+            self.assertEqual(
+                stored[PLAYLIST_KEY_MONITORS].get(MONITOR, []), draft.get_list(MONITOR)
+            )
+
+    def test_rename(self):
+        playlist_store.upsert("p", playlist(HDMI_1=["a"]))
+        playlist_store.upsert("q", playlist(HDMI_1=["b"]))
+        with self.assertRaises(ValueError):
+            playlist_store.rename("p", "q")
+        self.assertEqual(self.videos("p"), ["a"])
+        self.assertEqual(self.videos("q"), ["b"])
+
+        playlist_store.rename("p", "r")
+        self.assertEqual(list(playlist_store.load_all()), ["r", "q"])
+        self.assertEqual(self.videos("r"), ["a"])
+
+    def test_migrate_json(self):
+        """The playlist.json of format version 1 and 2 is imported into a new database"""
+        v2 = playlist(["c"], PLAYLIST_MODE_ALL, HDMI_1=["a", "b"])
+        documents = {
+            1: (
+                {"version": 1, "playlists": {"p": {"HDMI-1": ["a", "b"]}}},
+                playlist(HDMI_1=["a", "b"]),
+            ),
+            2: ({"version": 2, "playlists": {"p": v2}}, v2),
+        }
+        for version, (document, expected) in documents.items():
+            with self.subTest(version=version):
+                self._close()
+                for name in os.listdir(self.config_dir):
+                    os.remove(os.path.join(self.config_dir, name))
+                with open(playlist_store.PLAYLIST_PATH, "w") as f:
+                    json.dump(document, f)
+                self.assertEqual(playlist_store.load_all(), {"p": expected})
+
+    def test_export_import_json(self):
+        playlists = {"p": playlist(["c"], HDMI_1=["a", "b"]), "q": playlist(HDMI_1=["d"])}
+        playlist_store.replace_all(playlists)
+        path = os.path.join(self.config_dir, "backup.json")
+        playlist_store.export_json(path)
+        playlist_store.replace_all({})
+        self.assertEqual(playlist_store.load_all(), {})
+        playlist_store.import_json(path)
+        self.assertEqual(playlist_store.load_all(), playlists)
+
+
+if __name__ == "__main__":
+    unittest.main()